@@ -3,9 +3,15 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLineEdit, QComboBox, QLabel,
                              QMessageBox, QDialog, QFormLayout, QSpinBox,
                              QDoubleSpinBox, QTextEdit)
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import QTimer
 import db
+import catalog_engine
+import item_directory
+import operations
 from datetime import datetime
+from ui_async import QueryRunner, LazyTabs, TableWatcher
+from ui_table import (RowTableModel, ButtonDelegate, create_table_view, selected_record,
+                      fit_columns, format_money, format_yes_no)
 
 
 def get_item_type_ru(item_type):
@@ -28,18 +34,35 @@ def get_item_type_en(item_type_ru):
     return types_map.get(item_type_ru, item_type_ru)
 
 
+def format_shortfalls(shortfalls, names):
+    """Сообщение о нехватке остатков по позициям"""
+    lines = ['Недостаточно товара на складе:']
+    for s in shortfalls:
+        name = names.get((s['item_type'], s['item_id']), f"{get_item_type_ru(s['item_type'])} #{s['item_id']}")
+        lines.append(f"{name}: нужно {s['requested']}, в наличии {s['available']}")
+    return '\n'.join(lines)
+
+
+# Типы товаров во вкладке каталога
+CATALOG_ITEM_TYPES = ('FLOWER', 'BOUQUET')
+
+# Задержка живого фильтра каталога после последнего изменения, мс
+FILTER_DELAY_MS = 150
+
+
 class SellerWindow(QMainWindow):
     
     def __init__(self, user):
         super().__init__()
         self.user = user
         self.current_order_items = []
+        self.catalog = None
+        self.queries = QueryRunner(self, on_error=self.show_load_error)
         self.init_ui()
-        self.load_catalog()
-        self.load_clients()
-        self.load_orders()
-        self.load_clients_for_order()
-        self.load_available_items()
+        # Снимок каталога свежий сразу после своих записей в склад и периодически для чужих
+        self.catalog_watcher = TableWatcher(self, catalog_engine.SNAPSHOT_TABLES,
+                                            catalog_engine.REFRESH_INTERVAL_MS, self.refresh_loaded_catalog)
+        self.lazy_tabs.start()
     
     def init_ui(self):
         self.setWindowTitle(f'Продавец-флорист - {self.user["username"]}')
@@ -51,18 +74,44 @@ class SellerWindow(QMainWindow):
         layout = QVBoxLayout()
         central_widget.setLayout(layout)
         
+        # Данные вкладки загружаются при первом открытии, остальные подгружаются в фоне
         tabs = QTabWidget()
-        tabs.addTab(self.create_catalog_tab(), 'Каталог')
-        tabs.addTab(self.create_clients_tab(), 'Клиенты')
-        tabs.addTab(self.create_order_tab(), 'Оформление заказа')
-        tabs.addTab(self.create_payment_tab(), 'Оплата')
+        self.lazy_tabs = LazyTabs(tabs, self.queries)
+        self.lazy_tabs.add_tab(self.create_catalog_tab(), 'Каталог', self.refresh_catalog,
+                               self.load_item_directory)
+        self.lazy_tabs.add_tab(self.create_clients_tab(), 'Клиенты', self.load_clients)
+        self.lazy_tabs.add_tab(self.create_order_tab(), 'Оформление заказа',
+                               self.load_clients_for_order, self.refresh_catalog)
+        self.lazy_tabs.add_tab(self.create_payment_tab(), 'Оплата', self.load_orders)
+        self.lazy_tabs.add_tab(self.create_requests_tab(), 'Заявки', self.load_requests)
         
         layout.addWidget(tabs)
     
+    def load_item_directory(self):
+        # Справочник названий и цен нужен корзине и диалогу изменения заказа
+        self.queries.submit('item_directory', item_directory.preload)
+    
+    def show_load_error(self, error):
+        QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки данных: {str(error)}')
+    
     def create_catalog_tab(self):
         widget = QWidget()
         layout = QVBoxLayout()
         
+        # Полнотекстовый поиск с ранжированием
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(QLabel('Поиск:'))
+        self.catalog_search = QLineEdit()
+        self.catalog_search.setPlaceholderText('Название, сорт, цвет или повод')
+        self.catalog_search.returnPressed.connect(self.search_catalog)
+        search_layout.addWidget(self.catalog_search)
+        
+        btn_search = QPushButton('Найти')
+        btn_search.clicked.connect(self.search_catalog)
+        search_layout.addWidget(btn_search)
+        
+        layout.addLayout(search_layout)
+        
         filter_layout = QHBoxLayout()
         
         filter_layout.addWidget(QLabel('Название:'))
@@ -97,11 +146,30 @@ class SellerWindow(QMainWindow):
         
         layout.addLayout(filter_layout)
         
-        self.catalog_table = QTableWidget()
-        self.catalog_table.setColumnCount(7)
-        self.catalog_table.setHorizontalHeaderLabels([
-            'Тип', 'ID', 'Название', 'Цвет/Повод', 'Цена', 'Остаток', 'Действие'
-        ])
+        # Живой фильтр с задержкой
+        self.catalog_filter_timer = QTimer(self)
+        self.catalog_filter_timer.setSingleShot(True)
+        self.catalog_filter_timer.setInterval(FILTER_DELAY_MS)
+        self.catalog_filter_timer.timeout.connect(self.apply_catalog_filter)
+        for line_edit in (self.filter_name, self.filter_color, self.filter_occasion):
+            line_edit.textChanged.connect(self.schedule_catalog_filter)
+        for spin in (self.filter_price_from, self.filter_price_to):
+            spin.valueChanged.connect(self.schedule_catalog_filter)
+        
+        self.catalog_model = RowTableModel([
+            ('Тип', 'item_type', get_item_type_ru),
+            ('ID', 'item_id', None),
+            ('Название', 'name', None),
+            ('Цвет/Повод', 'attr', None),
+            ('Цена', 'price', format_money),
+            ('Остаток', 'stock', None),
+            ('Действие', None, None),
+        ], parent=self)
+        self.catalog_table = create_table_view(self.catalog_model)
+        # Кнопка рисуется делегатом: при перефильтрации виджеты не создаются
+        self.catalog_add_button = ButtonDelegate('Добавить', self.catalog_table)
+        self.catalog_add_button.clicked.connect(self.add_catalog_row_to_cart)
+        self.catalog_table.setItemDelegateForColumn(6, self.catalog_add_button)
         layout.addWidget(self.catalog_table)
         
         widget.setLayout(layout)
@@ -130,9 +198,16 @@ class SellerWindow(QMainWindow):
         
         layout.addLayout(form_layout)
         
-        self.clients_table = QTableWidget()
-        self.clients_table.setColumnCount(4)
-        self.clients_table.setHorizontalHeaderLabels(['ID', 'ФИО', 'Телефон', 'Email'])
+        self.clients_model = RowTableModel([
+            ('ID', 'client_id', None),
+            ('ФИО', 'full_name', None),
+            ('Телефон', 'phone', None),
+            ('Email', 'email', None),
+        ], runner=self.queries, key='clients', parent=self)
+        self.clients_model.set_loader(lambda token: db.fetch_page(
+            "SELECT client_id, full_name, phone, email FROM clients WHERE {page}",
+            key='client_id', token=token, descending=False))
+        self.clients_table = create_table_view(self.clients_model)
         layout.addWidget(self.clients_table)
         
         widget.setLayout(layout)
@@ -157,10 +232,15 @@ class SellerWindow(QMainWindow):
         
         # Доступные товары
         layout.addWidget(QLabel('Доступные товары:'))
-        self.available_items_table = QTableWidget()
-        self.available_items_table.setColumnCount(5)
-        self.available_items_table.setHorizontalHeaderLabels(['Тип', 'ID', 'Название', 'Цена', 'Остаток'])
-        self.available_items_table.cellDoubleClicked.connect(self.add_to_cart)
+        self.available_items_model = RowTableModel([
+            ('Тип', 'item_type', get_item_type_ru),
+            ('ID', 'item_id', None),
+            ('Название', 'name', None),
+            ('Цена', 'price', format_money),
+            ('Остаток', 'stock', None),
+        ], parent=self)
+        self.available_items_table = create_table_view(self.available_items_model)
+        self.available_items_table.doubleClicked.connect(self.add_to_cart)
         layout.addWidget(self.available_items_table)
         
         btn_add_to_cart = QPushButton('Добавить в заказ')
@@ -228,9 +308,16 @@ class SellerWindow(QMainWindow):
         
         # Список заказов для оплаты
         layout.addWidget(QLabel('Заказы для оплаты:'))
-        self.payment_orders_table = QTableWidget()
-        self.payment_orders_table.setColumnCount(5)
-        self.payment_orders_table.setHorizontalHeaderLabels(['ID', 'Клиент', 'Статус', 'Сумма', 'Оплачен'])
+        self.payment_orders_model = RowTableModel([
+            ('ID', 'order_id', None),
+            ('Клиент', 'full_name', None),
+            ('Статус', 'status', None),
+            ('Сумма', 'total_sum', format_money),
+            ('Оплачен', 'is_paid', format_yes_no),
+        ], runner=self.queries, key='orders', parent=self)
+        self.payment_orders_model.set_loader(
+            lambda token: db.fetch_page(db.SELLER_ORDERS_SQL, key='o.order_id', token=token))
+        self.payment_orders_table = create_table_view(self.payment_orders_model)
         layout.addWidget(self.payment_orders_table)
         
         # Форма оплаты
@@ -249,90 +336,81 @@ class SellerWindow(QMainWindow):
         widget.setLayout(layout)
         return widget
     
+    def refresh_catalog(self):
+        """Перечитывает снимок каталога: при открытии вкладки, после записи в склад и по таймеру"""
+        self.queries.submit('catalog', catalog_engine.load_snapshot, list(db.CATALOG_SOURCES),
+                            [self.catalog_model.fields, self.available_items_model.fields],
+                            on_result=self.set_catalog_snapshot)
+    
+    def refresh_loaded_catalog(self):
+        # До первого открытия вкладки снимок загрузит LazyTabs
+        if self.catalog is not None:
+            self.refresh_catalog()
+    
+    def set_catalog_snapshot(self, snapshot):
+        self.catalog = snapshot
+        # Пока в строке поиска есть запрос, таблица показывает его результаты, а не фильтр снимка
+        if self.catalog_search.text().strip():
+            self.search_catalog()
+        else:
+            self.apply_catalog_filter()
+        fit_columns(self.catalog_table)
+        self.fill_available_items()
+    
+    def schedule_catalog_filter(self, *args):
+        # Фильтр применяется, когда пользователь перестал печатать
+        self.end_catalog_search()
+        self.catalog_filter_timer.start()
+    
+    def end_catalog_search(self):
+        # Живые фильтры работают по снимку: запрос поиска и его незавершённый результат сбрасываются
+        self.catalog_search.clear()
+        self.queries.cancel('catalog_search')
+    
+    def search_catalog(self):
+        text = self.catalog_search.text().strip()
+        if not text:
+            self.apply_catalog_filter()
+            return
+        self.queries.submit('catalog_search', db.search_catalog, text, on_result=self.fill_catalog_search)
+    
+    def fill_catalog_search(self, items):
+        # Результаты уже отсортированы по релевантности
+        self.catalog_model.set_rows(items)
+    
     def load_catalog(self):
+        self.catalog_search.clear()
         self.filter_name.clear()
         self.filter_color.clear()
         self.filter_price_from.setValue(0)
         self.filter_price_to.setValue(0)
         self.filter_occasion.clear()
         self.apply_catalog_filter()
+        self.refresh_catalog()
     
     def apply_catalog_filter(self):
-        name = self.filter_name.text().strip()
-        color = self.filter_color.text().strip()
-        price_from = self.filter_price_from.value()
-        price_to = self.filter_price_to.value()
-        occasion = self.filter_occasion.text().strip()
-        
-        # Собираем данные
-        items = []
-        
-        # Цветы
-        sql = "SELECT f.*, COALESCE(i.qty, 0) as stock FROM flowers f LEFT JOIN inventory i ON i.item_type='FLOWER' AND i.item_id=f.flower_id WHERE f.is_active=1"
-        params = []
-        if name:
-            sql += " AND f.name LIKE %s"
-            params.append(f'%{name}%')
-        if color:
-            sql += " AND f.color LIKE %s"
-            params.append(f'%{color}%')
-        if price_from > 0:
-            sql += " AND f.price >= %s"
-            params.append(price_from)
-        if price_to > 0:
-            sql += " AND f.price <= %s"
-            params.append(price_to)
-        
-        flowers = db.fetch_all(sql, tuple(params) if params else None)
-        for f in flowers:
-            items.append(('FLOWER', f['flower_id'], f['name'], f['color'], f['price'], f['stock']))
-        
-        # Букеты
-        sql = "SELECT b.*, COALESCE(i.qty, 0) as stock FROM bouquets b LEFT JOIN inventory i ON i.item_type='BOUQUET' AND i.item_id=b.bouquet_id WHERE b.is_active=1"
-        params = []
-        if name:
-            sql += " AND b.name LIKE %s"
-            params.append(f'%{name}%')
-        if occasion:
-            sql += " AND b.occasion LIKE %s"
-            params.append(f'%{occasion}%')
-        if price_from > 0:
-            sql += " AND b.base_price >= %s"
-            params.append(price_from)
-        if price_to > 0:
-            sql += " AND b.base_price <= %s"
-            params.append(price_to)
-        
-        bouquets = db.fetch_all(sql, tuple(params) if params else None)
-        for b in bouquets:
-            items.append(('BOUQUET', b['bouquet_id'], b['name'], b['occasion'] or '', b['base_price'], b['stock']))
-        
-        # Заполняем таблицу
-        self.catalog_table.setRowCount(len(items))
-        for i, (item_type, item_id, name, attr, price, stock) in enumerate(items):
-            self.catalog_table.setItem(i, 0, QTableWidgetItem(get_item_type_ru(item_type)))
-            self.catalog_table.setItem(i, 1, QTableWidgetItem(str(item_id)))
-            self.catalog_table.setItem(i, 2, QTableWidgetItem(name))
-            self.catalog_table.setItem(i, 3, QTableWidgetItem(attr))
-            self.catalog_table.setItem(i, 4, QTableWidgetItem(f'{price:.2f}'))
-            self.catalog_table.setItem(i, 5, QTableWidgetItem(str(stock)))
-            btn = QPushButton('Добавить')
-            btn.clicked.connect(lambda checked, t=item_type, id=item_id: self.add_to_cart_from_catalog(t, id))
-            self.catalog_table.setCellWidget(i, 6, btn)
-        
-        self.catalog_table.resizeColumnsToContents()
-    
-    def add_to_cart_from_catalog(self, item_type, item_id):
-        if item_type == 'FLOWER':
-            item = db.fetch_one("SELECT * FROM flowers WHERE flower_id = %s", (item_id,))
-            name = item['name']
-            price = item['price']
-        elif item_type == 'BOUQUET':
-            item = db.fetch_one("SELECT * FROM bouquets WHERE bouquet_id = %s", (item_id,))
-            name = item['name']
-            price = item['base_price']
-        else:
+        self.catalog_filter_timer.stop()
+        self.end_catalog_search()
+        if self.catalog is None:
             return
+        
+        # Фильтрация в памяти по снимку каталога, без запросов к БД
+        indices = self.catalog.filter(
+            name=self.filter_name.text().strip(),
+            color=self.filter_color.text().strip(),
+            occasion=self.filter_occasion.text().strip(),
+            price_from=self.filter_price_from.value(),
+            price_to=self.filter_price_to.value(),
+            item_types=CATALOG_ITEM_TYPES
+        )
+        self.catalog_model.set_rows(self.catalog.rows(indices, self.catalog_model.fields))
+    
+    def add_catalog_row_to_cart(self, row):
+        record = self.catalog_model.record(row)
+        self.add_to_cart_from_catalog(record['item_type'], record['item_id'], record['name'], record['price'])
+    
+    def add_to_cart_from_catalog(self, item_type, item_id, name, price):
+        # Название и цена уже есть в строке снимка каталога
         self.current_order_items.append({
             'item_type': item_type,
             'item_id': item_id,
@@ -344,14 +422,8 @@ class SellerWindow(QMainWindow):
         self.recalculate_order_total()
     
     def load_clients(self):
-        clients = db.fetch_all("SELECT * FROM clients ORDER BY client_id")
-        self.clients_table.setRowCount(len(clients))
-        for i, client in enumerate(clients):
-            self.clients_table.setItem(i, 0, QTableWidgetItem(str(client['client_id'])))
-            self.clients_table.setItem(i, 1, QTableWidgetItem(client['full_name']))
-            self.clients_table.setItem(i, 2, QTableWidgetItem(client['phone']))
-            self.clients_table.setItem(i, 3, QTableWidgetItem(client['email'] or ''))
-        self.clients_table.resizeColumnsToContents()
+        # Первая страница сразу, остальные догружаются при прокрутке
+        self.clients_model.reload(on_loaded=lambda: fit_columns(self.clients_table))
     
     def add_client(self):
         name = self.client_name.text().strip()
@@ -363,30 +435,32 @@ class SellerWindow(QMainWindow):
             return
         
         try:
-            # Создаём клиента
-            client_id = db.execute(
-                "INSERT INTO clients (full_name, phone, email) VALUES (%s, %s, %s)",
-                (name, phone, email if email else None)
-            )
-            
-            username = ''.join(filter(str.isdigit, phone))
-            if not username:
-                username = f'client{client_id}'
-            
-            existing_user = db.fetch_one("SELECT * FROM users WHERE username = %s", (username,))
-            if existing_user:
-                username = f'client{client_id}'
-            
-            password = phone.replace('-', '').replace('+', '').replace(' ', '')
-            if len(password) < 4:
-                password = f'client{client_id}'
-            
-            password_hash = db.hash_password(password)
-            
-            db.execute(
-                "INSERT INTO users (username, password_hash, role, client_id) VALUES (%s, %s, %s, %s)",
-                (username, password_hash, 'CLIENT', client_id)
-            )
+            with db.transaction() as cursor:
+                # Создаём клиента
+                cursor.execute(
+                    "INSERT INTO clients (full_name, phone, email) VALUES (%s, %s, %s)",
+                    (name, phone, email if email else None)
+                )
+                client_id = cursor.lastrowid
+                
+                username = ''.join(filter(str.isdigit, phone))
+                if not username:
+                    username = f'client{client_id}'
+                
+                cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+                if cursor.fetchone():
+                    username = f'client{client_id}'
+                
+                password = phone.replace('-', '').replace('+', '').replace(' ', '')
+                if len(password) < 4:
+                    password = f'client{client_id}'
+                
+                password_hash = db.hash_password(password)
+                
+                cursor.execute(
+                    "INSERT INTO users (username, password_hash, role, client_id) VALUES (%s, %s, %s, %s)",
+                    (username, password_hash, 'CLIENT', client_id)
+                )
             
             QMessageBox.information(
                 self, 
@@ -402,81 +476,34 @@ class SellerWindow(QMainWindow):
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при добавлении клиента: {str(e)}')
     
     def load_clients_for_order(self):
-        clients = db.fetch_all("SELECT client_id, full_name, phone FROM clients ORDER BY full_name")
+        self.queries.submit(
+            'clients_for_order', db.fetch_all, "SELECT client_id, full_name, phone FROM clients ORDER BY full_name",
+            cached=True, on_result=self.fill_order_clients
+        )
+    
+    def fill_order_clients(self, clients):
         self.order_client.clear()
         for client in clients:
             self.order_client.addItem(f"{client['full_name']} ({client['phone']})", client['client_id'])
     
-    def load_available_items(self):
-        """Загружает доступные товары для заказа"""
-        items = []
-        
-        # Цветы
-        flowers = db.fetch_all("""
-            SELECT f.*, COALESCE(i.qty, 0) as stock 
-            FROM flowers f 
-            LEFT JOIN inventory i ON i.item_type='FLOWER' AND i.item_id=f.flower_id 
-            WHERE f.is_active=1 AND COALESCE(i.qty, 0) > 0
-        """)
-        for f in flowers:
-            items.append(('FLOWER', f['flower_id'], f['name'], f['price'], f['stock']))
-        
-        # Букеты
-        bouquets = db.fetch_all("""
-            SELECT b.*, COALESCE(i.qty, 0) as stock 
-            FROM bouquets b 
-            LEFT JOIN inventory i ON i.item_type='BOUQUET' AND i.item_id=b.bouquet_id 
-            WHERE b.is_active=1 AND COALESCE(i.qty, 0) > 0
-        """)
-        for b in bouquets:
-            items.append(('BOUQUET', b['bouquet_id'], b['name'], b['base_price'], b['stock']))
-        
-        # Упаковка
-        packaging = db.fetch_all("""
-            SELECT p.*, COALESCE(i.qty, 0) as stock 
-            FROM packaging p 
-            LEFT JOIN inventory i ON i.item_type='PACKAGING' AND i.item_id=p.packaging_id 
-            WHERE COALESCE(i.qty, 0) > 0
-        """)
-        for p in packaging:
-            items.append(('PACKAGING', p['packaging_id'], p['name'], p['price'], p['stock']))
-        
-        # Аксессуары
-        accessories = db.fetch_all("""
-            SELECT a.*, COALESCE(i.qty, 0) as stock 
-            FROM accessories a 
-            LEFT JOIN inventory i ON i.item_type='ACCESSORY' AND i.item_id=a.accessory_id 
-            WHERE COALESCE(i.qty, 0) > 0
-        """)
-        for a in accessories:
-            items.append(('ACCESSORY', a['accessory_id'], a['name'], a['price'], a['stock']))
-        
-        self.available_items_table.setRowCount(len(items))
-        for i, (item_type, item_id, name, price, stock) in enumerate(items):
-            # Сохраняем английское значение в userData для удобства
-            type_item = QTableWidgetItem(get_item_type_ru(item_type))
-            type_item.setData(Qt.ItemDataRole.UserRole, item_type)  # Сохраняем оригинальное значение
-            self.available_items_table.setItem(i, 0, type_item)
-            self.available_items_table.setItem(i, 1, QTableWidgetItem(str(item_id)))
-            self.available_items_table.setItem(i, 2, QTableWidgetItem(name))
-            self.available_items_table.setItem(i, 3, QTableWidgetItem(f'{price:.2f}'))
-            self.available_items_table.setItem(i, 4, QTableWidgetItem(str(stock)))
-        
-        self.available_items_table.resizeColumnsToContents()
+    def fill_available_items(self):
+        # Все типы товаров с ненулевым остатком из того же снимка каталога
+        indices = self.catalog.filter(in_stock_only=True)
+        self.available_items_model.set_rows(self.catalog.rows(indices, self.available_items_model.fields))
+        fit_columns(self.available_items_table)
     
     def add_to_cart(self):
         """Добавляет выбранный товар в корзину"""
-        row = self.available_items_table.currentRow()
-        if row < 0:
+        record = selected_record(self.available_items_table)
+        if record is None:
             QMessageBox.warning(self, 'Ошибка', 'Выберите товар')
             return
         
-        # Получаем оригинальное английское значение из userData
-        type_item = self.available_items_table.item(row, 0)
-        item_type = type_item.data(Qt.ItemDataRole.UserRole) or get_item_type_en(type_item.text())
-        item_id = int(self.available_items_table.item(row, 1).text())
-        name = self.available_items_table.item(row, 2).text()
-        price = float(self.available_items_table.item(row, 3).text())
+        # В модели хранится исходное английское значение типа
+        item_type = record['item_type']
+        item_id = record['item_id']
+        name = record['name']
+        price = float(record['price'])
         
         # Проверяем, есть ли уже в корзине
         for item in self.current_order_items:
@@ -553,75 +580,67 @@ class SellerWindow(QMainWindow):
         client_id = self.order_client.currentData()
         
         try:
-            # Создаём заказ
-            discount = self.order_discount.value()
-            total = sum(item['price'] * item['qty'] for item in self.current_order_items)
-            total_with_discount = total * (1 - discount / 100)
-            
-            order_id = db.execute(
-                """INSERT INTO orders (client_id, created_by_user_id, status, discount_percent, total_sum) 
-                   VALUES (%s, %s, %s, %s, %s)""",
-                (client_id, self.user['user_id'], 'Новый', discount, total_with_discount)
+            # Заказ, позиции и резерв остатков одной транзакцией
+            order_id = operations.create_order(
+                client_id, self.user['user_id'], self.current_order_items, self.order_discount.value()
             )
             
-            # Добавляем позиции
-            for item in self.current_order_items:
-                sum_val = item['price'] * item['qty']
-                db.execute(
-                    """INSERT INTO order_items (order_id, item_type, item_id, qty, price, sum) 
-                       VALUES (%s, %s, %s, %s, %s, %s)""",
-                    (order_id, item['item_type'], item['item_id'], item['qty'], item['price'], sum_val)
-                )
-                
-                # Уменьшаем остатки
-                db.execute(
-                    """UPDATE inventory SET qty = qty - %s 
-                       WHERE item_type = %s AND item_id = %s""",
-                    (item['qty'], item['item_type'], item['item_id'])
-                )
-            
             QMessageBox.information(self, 'Успех', f'Заказ #{order_id} создан')
             self.current_order_items.clear()
             self.update_cart_table()
             self.recalculate_order_total()
             self.load_orders()
+        except db.StockShortage as e:
+            names = {(item['item_type'], item['item_id']): item['name'] for item in self.current_order_items}
+            QMessageBox.warning(self, 'Ошибка', format_shortfalls(e.shortfalls, names))
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при создании заказа: {str(e)}')
     
     def modify_order_dialog(self):
         """Диалог изменения заказа"""
-        orders = db.fetch_all("""
-            SELECT o.*, c.full_name 
-            FROM orders o 
-            JOIN clients c ON o.client_id = c.client_id 
-            WHERE o.status != 'Отменен' AND o.status != 'Выдан'
-            ORDER BY o.order_id DESC
-        """)
-        
-        if not orders:
-            QMessageBox.information(self, 'Информация', 'Нет заказов для изменения')
-            return
+        def on_chosen(dialog, order_id):
+            dialog.accept()
+            self.modify_order(order_id)
         
-        # Простой выбор через диалог
+        self.open_orders_dialog('Выбор заказа', 'Изменить', on_chosen)
+    
+    def open_orders_dialog(self, title, button_text, on_chosen):
+        """Выбор незакрытого заказа; список догружается страницами при прокрутке"""
         dialog = QDialog(self)
-        dialog.setWindowTitle('Выбор заказа')
+        dialog.setWindowTitle(title)
         layout = QVBoxLayout()
         
-        layout.addWidget(QLabel('Выберите заказ:'))
-        order_combo = QComboBox()
-        for order in orders:
-            order_combo.addItem(f"Заказ #{order['order_id']} - {order['full_name']} ({order['status']})", order['order_id'])
-        layout.addWidget(order_combo)
+        label = QLabel('Выберите заказ:')
+        layout.addWidget(label)
+        model = RowTableModel([
+            ('ID', 'order_id', None),
+            ('Клиент', 'full_name', None),
+            ('Статус', 'status', None),
+        ], runner=self.queries, key='open_orders', parent=dialog)
+        model.set_loader(self.fetch_open_orders)
+        table = create_table_view(model)
+        layout.addWidget(table)
         
-        btn_ok = QPushButton('Изменить')
+        btn_ok = QPushButton(button_text)
+        btn_ok.setEnabled(False)
         btn_cancel = QPushButton('Отмена')
         
+        def on_loaded():
+            fit_columns(table)
+            if model.rowCount() == 0:
+                label.setText('Нет незакрытых заказов')
+            else:
+                btn_ok.setEnabled(True)
+        
         def on_ok():
-            order_id = order_combo.currentData()
-            dialog.accept()
-            self.modify_order(order_id)
+            record = selected_record(table)
+            if record is None:
+                QMessageBox.warning(dialog, 'Ошибка', 'Выберите заказ')
+                return
+            on_chosen(dialog, record['order_id'])
         
         btn_ok.clicked.connect(on_ok)
+        table.doubleClicked.connect(on_ok)
         btn_cancel.clicked.connect(dialog.reject)
         
         btn_layout = QHBoxLayout()
@@ -630,23 +649,27 @@ class SellerWindow(QMainWindow):
         layout.addLayout(btn_layout)
         
         dialog.setLayout(layout)
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            pass  # Уже обработано в on_ok
+        dialog.resize(500, 400)
+        model.reload(on_loaded=on_loaded)
+        dialog.exec()
+        # Страницы, запрошенные до закрытия, закрытому диалогу не нужны
+        self.queries.cancel('open_orders')
+    
+    def fetch_open_orders(self, token):
+        """Страница незакрытых заказов для диалогов изменения и отмены, новые сверху"""
+        return db.fetch_page("""
+            SELECT o.order_id, o.status, c.full_name 
+            FROM orders o 
+            JOIN clients c ON o.client_id = c.client_id 
+            WHERE o.status != 'Отменен' AND o.status != 'Выдан' AND {page}
+        """, key='o.order_id', token=token)
     
     def modify_order(self, order_id):
         """Изменяет заказ"""
         # Загружаем текущие позиции
-        items = db.fetch_all("""
-            SELECT oi.*, 
-                   CASE oi.item_type
-                       WHEN 'FLOWER' THEN (SELECT name FROM flowers WHERE flower_id = oi.item_id)
-                       WHEN 'BOUQUET' THEN (SELECT name FROM bouquets WHERE bouquet_id = oi.item_id)
-                       WHEN 'PACKAGING' THEN (SELECT name FROM packaging WHERE packaging_id = oi.item_id)
-                       WHEN 'ACCESSORY' THEN (SELECT name FROM accessories WHERE accessory_id = oi.item_id)
-                   END as item_name
-            FROM order_items oi 
-            WHERE oi.order_id = %s
-        """, (order_id,))
+        items = item_directory.with_names(db.fetch_all(
+            "SELECT * FROM order_items WHERE order_id = %s", (order_id,)
+        ))
         
         # Простое редактирование через диалог
         dialog = QDialog(self)
@@ -683,35 +706,45 @@ class SellerWindow(QMainWindow):
         btn_cancel = QPushButton('Отмена')
         
         def on_apply():
-            # Обновляем количества
-            for i in range(table.rowCount()):
-                old_qty = items[i]['qty']
-                new_qty = int(table.item(i, 3).text())
-                
-                if new_qty != old_qty:
-                    # Обновляем позицию
-                    new_sum = float(items[i]['price']) * new_qty
-                    db.execute(
-                        "UPDATE order_items SET qty = %s, sum = %s WHERE order_item_id = %s",
-                        (new_qty, new_sum, items[i]['order_item_id'])
-                    )
+            try:
+                with db.transaction() as cursor:
+                    # Обновляем количества
+                    deltas = {}
+                    for i in range(table.rowCount()):
+                        old_qty = items[i]['qty']
+                        new_qty = int(table.item(i, 3).text())
+                        
+                        if new_qty != old_qty:
+                            # Обновляем позицию
+                            new_sum = float(items[i]['price']) * new_qty
+                            cursor.execute(
+                                "UPDATE order_items SET qty = %s, sum = %s WHERE order_item_id = %s",
+                                (new_qty, new_sum, items[i]['order_item_id'])
+                            )
+                            
+                            # Уменьшение возвращаем на склад, увеличение резервируем
+                            key = (items[i]['item_type'], items[i]['item_id'])
+                            deltas[key] = deltas.get(key, 0) - (new_qty - old_qty)
+                    
+                    # Пересчитываем сумму заказа
+                    total = sum(float(table.item(i, 4).text()) for i in range(table.rowCount()))
+                    discount = discount_spin.value()
+                    total_with_discount = total * (1 - discount / 100)
                     
-                    # Корректируем остатки
-                    diff = new_qty - old_qty
-                    db.execute(
-                        "UPDATE inventory SET qty = qty - %s WHERE item_type = %s AND item_id = %s",
-                        (diff, items[i]['item_type'], items[i]['item_id'])
+                    cursor.execute(
+                        "UPDATE orders SET discount_percent = %s, total_sum = %s WHERE order_id = %s",
+                        (discount, total_with_discount, order_id)
                     )
-            
-            # Пересчитываем сумму заказа
-            total = sum(float(table.item(i, 4).text()) for i in range(table.rowCount()))
-            discount = discount_spin.value()
-            total_with_discount = total * (1 - discount / 100)
-            
-            db.execute(
-                "UPDATE orders SET discount_percent = %s, total_sum = %s WHERE order_id = %s",
-                (discount, total_with_discount, order_id)
-            )
+                    
+                    # Возврат и резерв одной блокировкой строк склада
+                    db.adjust_stock(cursor, deltas)
+            except db.StockShortage as e:
+                names = {(item['item_type'], item['item_id']): item['item_name'] for item in items}
+                QMessageBox.warning(dialog, 'Ошибка', format_shortfalls(e.shortfalls, names))
+                return
+            except Exception as e:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка при изменении заказа: {str(e)}')
+                return
             
             QMessageBox.information(dialog, 'Успех', 'Заказ изменён')
             dialog.accept()
@@ -730,115 +763,92 @@ class SellerWindow(QMainWindow):
     
     def cancel_order_dialog(self):
         """Диалог отмены заказа"""
-        orders = db.fetch_all("""
-            SELECT o.*, c.full_name 
-            FROM orders o 
-            JOIN clients c ON o.client_id = c.client_id 
-            WHERE o.status != 'Отменен' AND o.status != 'Выдан'
-            ORDER BY o.order_id DESC
-        """)
-        
-        if not orders:
-            QMessageBox.information(self, 'Информация', 'Нет заказов для отмены')
-            return
-        
-        dialog = QDialog(self)
-        dialog.setWindowTitle('Отмена заказа')
-        layout = QVBoxLayout()
-        
-        layout.addWidget(QLabel('Выберите заказ для отмены:'))
-        order_combo = QComboBox()
-        for order in orders:
-            order_combo.addItem(f"Заказ #{order['order_id']} - {order['full_name']}", order['order_id'])
-        layout.addWidget(order_combo)
-        
-        btn_ok = QPushButton('Отменить заказ')
-        btn_cancel = QPushButton('Отмена')
-        
-        def on_ok():
-            order_id = order_combo.currentData()
+        def on_chosen(dialog, order_id):
             try:
-                # Возвращаем товары на склад
-                items = db.fetch_all("SELECT * FROM order_items WHERE order_id = %s", (order_id,))
-                for item in items:
-                    db.execute(
-                        "UPDATE inventory SET qty = qty + %s WHERE item_type = %s AND item_id = %s",
-                        (item['qty'], item['item_type'], item['item_id'])
-                    )
-                
-                # Отменяем заказ
-                db.execute("UPDATE orders SET status = 'Отменен' WHERE order_id = %s", (order_id,))
+                with db.transaction() as cursor:
+                    # Возвращаем товары на склад
+                    cursor.execute("SELECT * FROM order_items WHERE order_id = %s", (order_id,))
+                    returned = {}
+                    for item in cursor.fetchall():
+                        key = (item['item_type'], item['item_id'])
+                        returned[key] = returned.get(key, 0) + item['qty']
+                    db.adjust_stock(cursor, returned)
+                    
+                    # Отменяем заказ
+                    cursor.execute("UPDATE orders SET status = 'Отменен' WHERE order_id = %s", (order_id,))
                 QMessageBox.information(dialog, 'Успех', 'Заказ отменён')
                 dialog.accept()
                 self.load_orders()
             except Exception as e:
                 QMessageBox.critical(dialog, 'Ошибка', f'Ошибка: {str(e)}')
         
-        btn_ok.clicked.connect(on_ok)
-        btn_cancel.clicked.connect(dialog.reject)
+        self.open_orders_dialog('Отмена заказа', 'Отменить заказ', on_chosen)
+    
+    def create_requests_tab(self):
+        """Входящие заявки клиентов на индивидуальные букеты"""
+        widget = QWidget()
+        layout = QVBoxLayout()
         
-        btn_layout = QHBoxLayout()
-        btn_layout.addWidget(btn_ok)
-        btn_layout.addWidget(btn_cancel)
-        layout.addLayout(btn_layout)
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(QLabel('Поиск по пожеланиям:'))
+        self.requests_search = QLineEdit()
+        self.requests_search.returnPressed.connect(self.load_requests)
+        search_layout.addWidget(self.requests_search)
         
-        dialog.setLayout(layout)
-        dialog.exec()
+        btn_search = QPushButton('Найти')
+        btn_search.clicked.connect(self.load_requests)
+        search_layout.addWidget(btn_search)
+        
+        layout.addLayout(search_layout)
+        
+        self.requests_model = RowTableModel([
+            ('ID', 'request_id', None),
+            ('Клиент', 'full_name', None),
+            ('Дата получения', 'desired_date', None),
+            ('Статус', 'status', None),
+            ('Пожелания', 'wishes', None),
+        ], runner=self.queries, key='requests', parent=self)
+        self.requests_table = create_table_view(self.requests_model)
+        layout.addWidget(self.requests_table)
+        
+        widget.setLayout(layout)
+        return widget
+    
+    def load_requests(self):
+        """Загружает заявки: последние постранично или найденные по пожеланиям"""
+        text = self.requests_search.text().strip()
+        if text:
+            self.requests_model.set_loader(lambda token: (db.search_requests(text), None))
+        else:
+            self.requests_model.set_loader(lambda token: db.fetch_page("""
+                SELECT r.request_id, c.full_name, r.desired_date, r.status, r.wishes
+                FROM custom_requests r
+                JOIN clients c ON r.client_id = c.client_id
+                WHERE {page}
+            """, key='r.request_id', token=token))
+        self.requests_model.reload(on_loaded=lambda: fit_columns(self.requests_table))
     
     def load_orders(self):
         """Загружает заказы для оплаты"""
-        orders = db.fetch_all("""
-            SELECT o.*, c.full_name,
-                   (SELECT COUNT(*) FROM payments p WHERE p.order_id = o.order_id) > 0 as is_paid
-            FROM orders o 
-            JOIN clients c ON o.client_id = c.client_id 
-            WHERE o.status IN ('Принят', 'В сборке', 'Готов')
-            ORDER BY o.order_id DESC
-        """)
-        
-        self.payment_orders_table.setRowCount(len(orders))
-        for i, order in enumerate(orders):
-            self.payment_orders_table.setItem(i, 0, QTableWidgetItem(str(order['order_id'])))
-            self.payment_orders_table.setItem(i, 1, QTableWidgetItem(order['full_name']))
-            self.payment_orders_table.setItem(i, 2, QTableWidgetItem(order['status']))
-            self.payment_orders_table.setItem(i, 3, QTableWidgetItem(f"{order['total_sum']:.2f}"))
-            self.payment_orders_table.setItem(i, 4, QTableWidgetItem('Да' if order['is_paid'] else 'Нет'))
-        
-        self.payment_orders_table.resizeColumnsToContents()
+        self.payment_orders_model.reload(on_loaded=lambda: fit_columns(self.payment_orders_table))
     
     def process_payment(self):
         """Обрабатывает оплату"""
-        row = self.payment_orders_table.currentRow()
-        if row < 0:
+        record = selected_record(self.payment_orders_table)
+        if record is None:
             QMessageBox.warning(self, 'Ошибка', 'Выберите заказ')
             return
         
-        order_id = int(self.payment_orders_table.item(row, 0).text())
-        
-        # Проверяем, не оплачен ли уже
-        payment = db.fetch_one("SELECT * FROM payments WHERE order_id = %s", (order_id,))
-        if payment:
-            QMessageBox.warning(self, 'Ошибка', 'Заказ уже оплачен')
-            return
-        
-        order = db.fetch_one("SELECT * FROM orders WHERE order_id = %s", (order_id,))
-        if not order:
-            QMessageBox.warning(self, 'Ошибка', 'Заказ не найден')
-            return
-        
+        order_id = record['order_id']
         method = self.payment_method.currentText()
         
         try:
-            db.execute(
-                "INSERT INTO payments (order_id, method, amount) VALUES (%s, %s, %s)",
-                (order_id, method, order['total_sum'])
-            )
-            
-            # Обновляем статус заказа
-            db.execute("UPDATE orders SET status = 'Выдан' WHERE order_id = %s", (order_id,))
+            operations.process_payment(order_id, method)
             
             QMessageBox.information(self, 'Успех', 'Оплата принята')
             self.load_orders()
+        except (operations.AlreadyProcessed, operations.NotFound) as e:
+            QMessageBox.warning(self, 'Ошибка', str(e))
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при оплате: {str(e)}')
 
@@ -0,0 +1,308 @@
+"""
+Бенчмарк путей данных окон без Qt
+
+Прогоняет те же запросы и функции, что стоят за кнопками и вкладками окон
+(operations, catalog_engine, item_directory), и для каждой операции считает
+p50/p95/p99, число обращений к БД и строк. Результат - JSON, который можно сравнить
+с сохранённым базовым прогоном.
+
+    python bench.py --output bench.json
+    python bench.py --generate --scales 0.01,0.1 --output bench.json
+    python bench.py --baseline bench_baseline.json
+
+Операции записи создают заказы, оплаты и закупки - запускать только на тестовой базе.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+import db
+import catalog_engine
+import datagen
+import item_directory
+import operations
+
+
+DEFAULT_ITERATIONS = 50
+DEFAULT_WARMUP = 3
+# Рост p95 больше чем на столько относительно базового прогона считается регрессией
+DEFAULT_THRESHOLD = 0.25
+
+# Таблицы, размер которых попадает в отчёт вместе с замерами
+COUNTED_TABLES = ('clients', 'flowers', 'bouquets', 'orders', 'order_items', 'write_offs',
+                  'purchase_orders', 'receipt_items')
+
+# Поля моделей каталога и доступных товаров в окне продавца
+CATALOG_FIELDS = ('item_type', 'item_id', 'name', 'attr', 'price', 'stock')
+
+
+def percentile(sorted_values, fraction):
+    # Ближайший ранг: наименьшее значение, не меньше которого fraction всех замеров
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class BenchContext:
+    """Выборки идентификаторов из текущей базы, из которых строятся параметры операций"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.client_ids = [r['client_id'] for r in db.fetch_all("SELECT client_id FROM clients ORDER BY client_id LIMIT 1000")]
+        self.seller_id = db.fetch_one("SELECT user_id FROM users WHERE role = 'SELLER' ORDER BY user_id LIMIT 1")['user_id']
+        self.supplier_ids = [r['supplier_id'] for r in db.fetch_all("SELECT supplier_id FROM suppliers")]
+        self.stock_items = db.fetch_all("""
+            SELECT i.item_type, i.item_id, i.qty FROM inventory i
+            WHERE i.qty >= 100 ORDER BY i.qty DESC LIMIT 200
+        """)
+        self.flower_names = [r['name'] for r in db.fetch_all("SELECT DISTINCT name FROM flowers")]
+        self.varieties = [r['variety'] for r in db.fetch_all("SELECT DISTINCT variety FROM flowers LIMIT 1000")]
+        bounds = db.fetch_one("SELECT MIN(order_id) AS low, MAX(order_id) AS high FROM orders")
+        self.order_range = (bounds['low'] or 0, bounds['high'] or 0)
+        self.catalog = catalog_engine.load_snapshot(list(db.CATALOG_SOURCES), [CATALOG_FIELDS])
+        self.created_orders = []
+        self.created_purchases = []
+        self.counts = {table: db.fetch_one(f"SELECT COUNT(*) AS cnt FROM {table}")['cnt'] for table in COUNTED_TABLES}
+        if not (self.client_ids and self.supplier_ids and self.stock_items and self.order_range[1]):
+            raise RuntimeError('Database has too little data for the benchmark; run datagen.py first')
+
+    def cart(self):
+        items = []
+        for row in self.rng.sample(self.stock_items, min(len(self.stock_items), self.rng.randint(1, 4))):
+            item = item_directory.lookup(row['item_type'], row['item_id'])
+            items.append({'item_type': row['item_type'], 'item_id': row['item_id'],
+                          'price': item['price'] if item else 100.0, 'qty': 1})
+        return items
+
+
+def op_apply_catalog_filter(ctx):
+    name = ctx.rng.choice(ctx.flower_names)[:3]
+    indices = ctx.catalog.filter(name=name, price_from=ctx.rng.choice((0, 100)), item_types=('FLOWER', 'BOUQUET'))
+    return ctx.catalog.rows(indices, CATALOG_FIELDS)
+
+
+def op_fill_available_items(ctx):
+    return ctx.catalog.rows(ctx.catalog.filter(in_stock_only=True), CATALOG_FIELDS)
+
+
+def op_refresh_catalog(ctx):
+    ctx.catalog = catalog_engine.load_snapshot(list(db.CATALOG_SOURCES), [CATALOG_FIELDS])
+
+
+def op_create_order(ctx):
+    order_id = operations.create_order(ctx.rng.choice(ctx.client_ids), ctx.seller_id, ctx.cart(), 0)
+    ctx.created_orders.append(order_id)
+
+
+def op_process_payment(ctx):
+    if not ctx.created_orders:
+        ctx.created_orders.append(operations.create_order(ctx.rng.choice(ctx.client_ids), ctx.seller_id, ctx.cart(), 0))
+    operations.process_payment(ctx.created_orders.pop(), ctx.rng.choice(('Наличные', 'Карта')))
+
+
+def op_load_purchase_items(ctx):
+    return operations.purchase_items(ctx.rng.choice(ctx.supplier_ids))
+
+
+def purchase_cart(ctx, supplier_id):
+    offers = operations.purchase_items(supplier_id)
+    return [{'item_type': t, 'item_id': i, 'qty': 10, 'price': float(p)}
+            for t, i, _, p in ctx.rng.sample(offers, min(len(offers), 10))]
+
+
+def op_create_purchase(ctx):
+    supplier_id = ctx.rng.choice(ctx.supplier_ids)
+    ctx.created_purchases.append(operations.create_purchase(supplier_id, purchase_cart(ctx, supplier_id)))
+
+
+def op_receive_purchase(ctx):
+    if not ctx.created_purchases:
+        supplier_id = ctx.rng.choice(ctx.supplier_ids)
+        ctx.created_purchases.append(operations.create_purchase(supplier_id, purchase_cart(ctx, supplier_id)))
+    operations.receive_purchase(ctx.created_purchases.pop())
+
+
+def op_load_writeoffs(ctx):
+    rows, _ = operations.writeoff_page()
+    return rows, operations.writeoff_flowers()
+
+
+def op_calculate_avg_price(ctx):
+    now = datetime.now()
+    month = ctx.rng.randint(1, 12)
+    year = now.year if month <= now.month else now.year - 1
+    return operations.avg_flower_price(ctx.rng.choice(ctx.flower_names), 'MONTH', year, month)
+
+
+def op_calculate_writeoff_percent(ctx):
+    return operations.writeoff_percent(ctx.rng.choice(ctx.varieties))
+
+
+def op_load_writeoff_report(ctx):
+    return operations.writeoff_report()
+
+
+def op_load_price_series(ctx):
+    today = datetime.now().date()
+    names = ctx.rng.sample(ctx.flower_names, min(len(ctx.flower_names), 5))
+    return operations.price_series(names, today.replace(year=today.year - 1, day=1), today)
+
+
+def op_load_order_details(ctx):
+    return operations.order_details(ctx.rng.randint(*ctx.order_range))
+
+
+# Имя операции - метод окна, путь данных которого она повторяет. Порядок важен:
+# оплата берёт заказы, созданные create_order, приём - закупки из create_purchase
+OPERATIONS = [
+    ('SellerWindow.refresh_catalog', op_refresh_catalog),
+    ('SellerWindow.apply_catalog_filter', op_apply_catalog_filter),
+    ('SellerWindow.fill_available_items', op_fill_available_items),
+    ('SellerWindow.create_order', op_create_order),
+    ('SellerWindow.process_payment', op_process_payment),
+    ('ManagerWindow.load_purchase_items', op_load_purchase_items),
+    ('ManagerWindow.create_purchase', op_create_purchase),
+    ('ManagerWindow.receive_purchase', op_receive_purchase),
+    ('ManagerWindow.load_writeoffs', op_load_writeoffs),
+    ('ManagerWindow.calculate_avg_price', op_calculate_avg_price),
+    ('ManagerWindow.calculate_writeoff_percent', op_calculate_writeoff_percent),
+    ('ManagerWindow.load_writeoff_report', op_load_writeoff_report),
+    ('ManagerWindow.load_price_series', op_load_price_series),
+    ('ClientWindow.load_order_details', op_load_order_details),
+]
+
+
+def measure(ctx, fn, iterations, warmup):
+    stats = db.query_stats()
+    for _ in range(warmup):
+        fn(ctx)
+    timings = []
+    round_trips = rows = 0
+    for _ in range(iterations):
+        calls_before, rows_before = stats.totals()
+        started = time.perf_counter()
+        fn(ctx)
+        timings.append((time.perf_counter() - started) * 1000)
+        calls_after, rows_after = stats.totals()
+        round_trips += calls_after - calls_before
+        rows += rows_after - rows_before
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'max_ms': round(timings[-1], 3),
+        'round_trips': round(round_trips / iterations, 2),
+        'rows': round(rows / iterations, 1),
+    }
+
+
+def run_dataset(iterations, warmup, seed, only=None):
+    ctx = BenchContext(seed)
+    results = {}
+    for name, fn in OPERATIONS:
+        if only and name not in only:
+            continue
+        results[name] = measure(ctx, fn, iterations, warmup)
+        r = results[name]
+        print(f"  {name:45} p50 {r['p50_ms']:9.2f}  p95 {r['p95_ms']:9.2f}  p99 {r['p99_ms']:9.2f} ms"
+              f"  {r['round_trips']:5.1f} rt  {r['rows']:9.1f} rows")
+    return {'counts': ctx.counts, 'operations': results}
+
+
+def compare(report, baseline, threshold):
+    """Сравнивает p95 с базовым прогоном; возвращает список регрессий"""
+    regressions = []
+    for label, dataset in report['datasets'].items():
+        base_dataset = baseline.get('datasets', {}).get(label)
+        if not base_dataset:
+            print(f"{label}: no baseline")
+            continue
+        print(f"{label}:")
+        for name, result in dataset['operations'].items():
+            base = base_dataset['operations'].get(name)
+            if not base:
+                continue
+            change = (result['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+            mark = ''
+            if change > threshold:
+                mark = '  REGRESSION'
+                regressions.append((label, name, change))
+            print(f"  {name:45} p95 {base['p95_ms']:9.2f} -> {result['p95_ms']:9.2f} ms ({change:+.0%})"
+                  f"  rt {base['round_trips']} -> {result['round_trips']}{mark}")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Бенчмарк путей данных окон')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scales', default=None,
+                        help='масштабы через запятую; с --generate база пересоздаётся datagen.py для каждого')
+    parser.add_argument('--generate', action='store_true',
+                        help='заполнить базу datagen.py --reset перед каждым масштабом (стирает данные)')
+    parser.add_argument('--label', default='current', help='имя набора данных без --scales')
+    parser.add_argument('--only', default=None, help='операции через запятую')
+    parser.add_argument('--output', default=None, help='файл для JSON с результатами')
+    parser.add_argument('--baseline', default=None, help='JSON базового прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.scales and not args.generate:
+        print("--scales needs --generate: each scale is loaded into the database before measuring")
+        return 2
+    only = set(args.only.split(',')) if args.only else None
+    # Медленные запросы бенчмарка не должны смешиваться с журналом рабочих окон
+    db.query_stats().slow_log = None
+
+    if args.scales:
+        datasets = [(f'sf{scale}', scale) for scale in args.scales.split(',')]
+    else:
+        datasets = [(args.label, None)]
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+        'datasets': {},
+    }
+    for label, scale in datasets:
+        if scale is not None:
+            if datagen.main(['--scale', scale, '--reset']) != 0:
+                return 1
+            # Справочник и кэш помнят данные прошлого набора
+            db.invalidate_tables(set(datagen.TABLE_COLUMNS) | set(datagen.DERIVED_TABLES))
+        print(f"Dataset {label}:")
+        report['datasets'][label] = run_dataset(args.iterations, args.warmup, args.seed, only)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} operation(s) slower than baseline by more than {args.threshold:.0%}")
+            status = 1
+    db.close_pool()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
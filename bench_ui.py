@@ -0,0 +1,333 @@
+"""
+Бенчмарк заполнения таблиц окон под QT_QPA_PLATFORM=offscreen
+
+Замеряет создание SellerWindow, ManagerWindow и ClientWindow и заполнение каждой их таблицы
+готовыми строками на 1 тыс., 10 тыс. и 100 тыс. строк - без БД, чтобы регрессии
+на стороне интерфейса были видны отдельно от запросов. Каждый случай выполняется
+в отдельном процессе: пиковая память одного случая не влияет на другие.
+
+    python bench_ui.py --output bench_ui.json
+    python bench_ui.py --windows SellerWindow --sizes 1000,10000
+    python bench_ui.py --baseline bench_ui_baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, date, timedelta
+
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_REPEAT = 3
+# Один случай дольше этого считается зависшим, секунды
+CASE_TIMEOUT = 600
+# Рост времени или памяти больше чем на столько относительно базового прогона - регрессия
+DEFAULT_THRESHOLD = 0.25
+
+# Модуль окна и пользователь, под которым оно открывается
+WINDOWS = {
+    'SellerWindow': ('admin_ui', {'user_id': 1, 'username': 'seller', 'role': 'SELLER', 'client_id': None}),
+    'ManagerWindow': ('chief_ui', {'user_id': 2, 'username': 'manager', 'role': 'MANAGER', 'client_id': None}),
+    'ClientWindow': ('patient_ui', {'user_id': 3, 'username': 'client1', 'role': 'CLIENT', 'client_id': 1}),
+}
+
+# Таблицы-корзины на QTableWidget: (имя, список позиций окна, метод перерисовки, поля позиции)
+CART_TABLES = {
+    'SellerWindow': [('cart', 'current_order_items', 'update_cart_table',
+                      ('item_type', 'item_id', 'name', 'price', 'qty'))],
+    'ManagerWindow': [('purchase_cart', 'current_purchase_items', 'update_purchase_cart',
+                       ('item_type', 'item_id', 'name', 'price', 'qty'))],
+    'ClientWindow': [('request_cart', 'current_request_items', 'update_request_cart',
+                      ('flower_id', 'name', 'variety', 'qty'))],
+}
+
+ITEM_TYPES = ('FLOWER', 'BOUQUET', 'PACKAGING', 'ACCESSORY')
+MONEY_FIELDS = ('price', 'total_sum', 'sum', 'supplier_price', 'amount', 'base_price', 'avg_price')
+CHOICES = {
+    'status': ('Новый', 'Принят', 'В сборке', 'Готов', 'Выдан'),
+    'reason': ('EXPIRED', 'DAMAGED', 'OTHER'),
+    'wishes': ('Основа букета - роза, цвет белый. Бюджет до 5000 рублей', 'Собрать в шляпной коробке', ''),
+    'attr': ('Красный', 'Белый', 'День рождения', '8 Марта'),
+}
+
+
+def canned_value(field, index):
+    """Правдоподобное значение поля для строки index; строки разной длины, как в живых данных"""
+    if field.endswith('_id'):
+        return index + 1
+    if field in MONEY_FIELDS:
+        return round(50 + (index * 37) % 5000 + 0.5, 2)
+    if field in ('qty', 'stock', 'written_off', 'sold', 'samples'):
+        return index % 300
+    if field == 'percent':
+        return round((index * 37) % 10000 / 100, 2)
+    if field == 'item_type':
+        return ITEM_TYPES[index % len(ITEM_TYPES)]
+    if field == 'created_at':
+        return datetime(2026, 1, 1) + timedelta(minutes=index)
+    if field == 'month':
+        return date(2026 - index // 12 % 5, index % 12 + 1, 1)
+    if field == 'desired_date':
+        return date(2026, 1, 1) + timedelta(days=index % 365)
+    if field == 'is_paid':
+        return index % 2 == 0
+    if field in CHOICES:
+        values = CHOICES[field]
+        return values[index % len(values)]
+    return f"{field.replace('_', ' ').capitalize()} {'x' * (index % 20)}{index}"
+
+
+def peak_rss_mb():
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 2 ** 20
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def window_tables(window_name, window):
+    """Таблицы окна: {имя: (представление, функция заполнения(n))}"""
+    from ui_table import RowTableModel, fit_columns
+
+    tables = {}
+    for attr, model in vars(window).items():
+        if not attr.endswith('_model') or not isinstance(model, RowTableModel):
+            continue
+        name = attr[:-len('_model')]
+        view = getattr(window, f'{name}_table')
+
+        def fill(count, model=model, view=view):
+            rows = [tuple(canned_value(field, i) for field in model.fields) for i in range(count)]
+            started = time.perf_counter()
+            model.set_rows(rows)
+            fit_columns(view)
+            return started
+
+        tables[name] = (view, fill)
+
+    for name, items_attr, update, fields in CART_TABLES[window_name]:
+        def fill(count, items_attr=items_attr, update=update, fields=fields):
+            items = getattr(window, items_attr)
+            items[:] = [{field: canned_value(field, i) for field in fields} for i in range(count)]
+            started = time.perf_counter()
+            getattr(window, update)()
+            return started
+
+        tables[name] = (getattr(window, f'{name}_table'), fill)
+    return tables
+
+
+def open_window(window_name):
+    """Создаёт окно без БД; возвращает (app, window, время импорта модуля, время создания окна) в мс"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    import importlib
+    from PyQt6.QtWidgets import QApplication
+    import ui_async
+
+    # Вкладки не запускают загрузчики ни при создании окна, ни при переключении
+    ui_async.LazyTabs.start = lambda self: None
+    ui_async.LazyTabs.ensure_loaded = lambda self, index: None
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    module_name, user = WINDOWS[window_name]
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+    window = getattr(module, window_name)(user)
+    window.show()
+    app.processEvents()
+    constructed = time.perf_counter()
+    return app, window, (imported - started) * 1000, (constructed - imported) * 1000
+
+
+def run_case(window_name, table, rows, repeat):
+    """Выполняется в дочернем процессе; возвращает замер одного случая"""
+    app, window, import_ms, construct_ms = open_window(window_name)
+    from PyQt6.QtCore import QT_VERSION_STR
+
+    result = {
+        'window': window_name,
+        'table': table,
+        'rows': rows,
+        'qt': QT_VERSION_STR,
+        'import_ms': round(import_ms, 2),
+        'construct_ms': round(construct_ms, 2),
+    }
+    if table == 'construct':
+        result['wall_ms'] = round(import_ms + construct_ms, 2)
+    else:
+        view, fill = window_tables(window_name, window)[table]
+        tabs = window.lazy_tabs.tabs
+        for index in range(tabs.count()):
+            if tabs.widget(index).isAncestorOf(view):
+                tabs.setCurrentIndex(index)
+        app.processEvents()
+        result['rss_before_mb'] = round(peak_rss_mb(), 1)
+        timings = []
+        for _ in range(repeat):
+            fill_started = fill(rows)
+            # Отрисовка видимой части входит в замер: её пользователь и ждёт
+            view.viewport().repaint()
+            app.processEvents()
+            timings.append((time.perf_counter() - fill_started) * 1000)
+        timings.sort()
+        result['wall_ms'] = round(timings[len(timings) // 2], 2)
+        result['min_ms'] = round(timings[0], 2)
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    window.close()
+    return result
+
+
+def list_cases(windows, sizes):
+    """Случаи для родительского процесса: таблицы узнаются из самих окон в дочернем процессе"""
+    cases = []
+    for window_name in windows:
+        cases.append((window_name, 'construct', 0))
+        for table in discover_tables(window_name):
+            for rows in sizes:
+                cases.append((window_name, table, rows))
+    return cases
+
+
+def discover_tables(window_name):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--list-tables', window_name],
+                          capture_output=True, text=True, env=child_env(), timeout=CASE_TIMEOUT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Could not open {window_name}: {proc.stderr.strip()}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def list_tables(window_name):
+    app, window, _, _ = open_window(window_name)
+    names = sorted(window_tables(window_name, window))
+    window.close()
+    return names
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return env
+
+
+def spawn_case(window_name, table, rows, repeat):
+    command = [sys.executable, os.path.abspath(__file__), '--case', f'{window_name}:{table}:{rows}',
+               '--repeat', str(repeat)]
+    try:
+        proc = subprocess.run(command, capture_output=True, text=True, env=child_env(), timeout=CASE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return {'window': window_name, 'table': table, 'rows': rows, 'error': f'timeout after {CASE_TIMEOUT}s'}
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'window': window_name, 'table': table, 'rows': rows, 'error': lines[-1] if lines else 'failed'}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def case_key(case):
+    return f"{case['window']}.{case['table']}@{case['rows']}"
+
+
+def compare(report, baseline, threshold):
+    base_cases = {case_key(case): case for case in baseline.get('cases', [])}
+    regressions = []
+    for case in report['cases']:
+        base = base_cases.get(case_key(case))
+        if not base or 'error' in case or 'error' in base:
+            continue
+        marks = []
+        for field in ('wall_ms', 'peak_rss_mb'):
+            if base[field] and (case[field] - base[field]) / base[field] > threshold:
+                marks.append(field)
+        if marks:
+            regressions.append((case_key(case), marks))
+        print(f"  {case_key(case):50} {base['wall_ms']:10.1f} -> {case['wall_ms']:10.1f} ms"
+              f"  {base['peak_rss_mb']:7.1f} -> {case['peak_rss_mb']:7.1f} MB"
+              f"{'  REGRESSION ' + ','.join(marks) if marks else ''}")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Бенчмарк заполнения таблиц окон без БД')
+    parser.add_argument('--windows', default=','.join(WINDOWS), help='окна через запятую')
+    parser.add_argument('--tables', default=None, help='только эти таблицы (через запятую)')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='заполнений таблицы в одном случае')
+    parser.add_argument('--output', default=None, help='файл для JSON с результатами')
+    parser.add_argument('--baseline', default=None, help='JSON базового прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--list-tables', default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Дочерние процессы: один случай или список таблиц окна, результат - JSON последней строкой
+    if args.case:
+        window_name, table, rows = args.case.split(':')
+        print(json.dumps(run_case(window_name, table, int(rows), args.repeat), ensure_ascii=False))
+        return 0
+    if args.list_tables:
+        print(json.dumps(list_tables(args.list_tables)))
+        return 0
+
+    windows = [name for name in args.windows.split(',') if name]
+    unknown = [name for name in windows if name not in WINDOWS]
+    if unknown:
+        print(f"Unknown windows: {', '.join(unknown)}; expected {', '.join(WINDOWS)}")
+        return 2
+    sizes = [int(size) for size in args.sizes.split(',')]
+    only = set(args.tables.split(',')) if args.tables else None
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'cases': [],
+    }
+    for window_name, table, rows in list_cases(windows, sizes):
+        if only and table != 'construct' and table not in only:
+            continue
+        case = spawn_case(window_name, table, rows, args.repeat)
+        report['cases'].append(case)
+        if 'error' in case:
+            print(f"  {case_key(case):50} ERROR {case['error']}")
+        else:
+            print(f"  {case_key(case):50} {case['wall_ms']:10.1f} ms  peak {case['peak_rss_mb']:7.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+    status = 1 if any('error' in case for case in report['cases']) else 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
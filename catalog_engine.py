@@ -0,0 +1,99 @@
+"""
+Каталог в памяти: колонки NumPy и поиск подстроки без запросов к БД
+"""
+import numpy as np
+import db
+
+
+# Таблицы, после записи в которые снимок каталога перечитывается
+SNAPSHOT_TABLES = {'inventory'} | {source['table'] for source in db.CATALOG_SOURCES.values()}
+
+# Период фонового обновления снимка в окнах, мс: записи других терминалов кэш процесса не видит
+REFRESH_INTERVAL_MS = 30000
+
+
+class TextColumn:
+    """Строки колонки в нижнем регистре в массиве NumPy фиксированной ширины.
+
+    Поиск подстроки - один векторный np.char.find по всей колонке, без цикла Python по строкам.
+    """
+
+    def __init__(self, values):
+        self.values = np.array([(value or '').lower() for value in values], dtype=str)
+
+    def contains(self, needle):
+        return np.char.find(self.values, needle) >= 0
+
+
+class CatalogSnapshot:
+    """Снимок каталога по колонкам. Фильтры повторяют db.build_catalog_query,
+    но выполняются в памяти за миллисекунды.
+
+    Снимок неизменяем: строится в рабочем потоке и целиком подменяется при обновлении.
+    """
+
+    def __init__(self, rows, row_fields=()):
+        self.size = len(rows)
+        self.type_names = np.array(list(db.CATALOG_SOURCES), dtype=object)
+        codes = {name: code for code, name in enumerate(self.type_names)}
+        self.type_code = np.fromiter((codes[r['item_type']] for r in rows), dtype=np.int8, count=self.size)
+        self.item_id = np.fromiter((r['item_id'] for r in rows), dtype=np.int64, count=self.size)
+        self.price = np.fromiter((float(r['price']) for r in rows), dtype=np.float64, count=self.size)
+        self.stock = np.fromiter((r['stock'] for r in rows), dtype=np.int64, count=self.size)
+        self.name = np.array([r['name'] for r in rows], dtype=object)
+        # Цвет у цветов и повод у букетов лежат в одной колонке attr
+        self.attr = np.array([r['attr'] for r in rows], dtype=object)
+        self.name_text = TextColumn(self.name)
+        self.attr_text = TextColumn(self.attr)
+        # Кортежи строк для моделей таблиц: {fields: массив кортежей}; собираются один раз на снимок
+        self._row_tuples = {}
+        for fields in row_fields:
+            self._tuples(fields)
+
+    def _is_type(self, item_types):
+        codes = [code for code, name in enumerate(self.type_names) if name in item_types]
+        return np.isin(self.type_code, codes)
+
+    def filter(self, name='', color='', occasion='', price_from=0, price_to=0,
+               item_types=None, in_stock_only=False):
+        """Возвращает индексы подходящих строк в исходном порядке"""
+        mask = np.ones(self.size, dtype=bool)
+        if item_types is not None:
+            mask &= self._is_type(item_types)
+        if name:
+            mask &= self.name_text.contains(name.lower())
+        for filter_name, value in (('color', color), ('occasion', occasion)):
+            if value:
+                # Типы без такого фильтра им не отсекаются
+                types = [t for t, source in db.CATALOG_SOURCES.items() if filter_name in source['filters']]
+                mask &= ~self._is_type(types) | self.attr_text.contains(value.lower())
+        if price_from > 0:
+            mask &= self.price >= price_from
+        if price_to > 0:
+            mask &= self.price <= price_to
+        if in_stock_only:
+            mask &= self.stock > 0
+        return np.flatnonzero(mask)
+
+    def _tuples(self, fields):
+        fields = tuple(fields)
+        tuples = self._row_tuples.get(fields)
+        if tuples is None:
+            columns = []
+            for field in fields:
+                if field == 'item_type':
+                    columns.append(self.type_names[self.type_code].tolist())
+                else:
+                    columns.append(getattr(self, field).tolist())
+            tuples = np.fromiter(zip(*columns), dtype=object, count=self.size)
+            self._row_tuples[fields] = tuples
+        return tuples
+
+    def rows(self, indices, fields):
+        """Кортежи выбранных строк с полями в порядке fields (как у RowTableModel)"""
+        return self._tuples(fields)[indices].tolist()
+
+
+def load_snapshot(item_types, row_fields=()):
+    # Вызывается в рабочем потоке QueryRunner; row_fields - поля моделей, которым снимок отдаёт строки
+    return CatalogSnapshot(db.fetch_catalog(item_types=item_types), row_fields)
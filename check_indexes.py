@@ -0,0 +1,49 @@
+"""
+Проверка, что горячие запросы идут по своим индексам
+
+На почти пустой базе оптимизатор выбирает полный скан, поэтому проверка требует
+данных datagen.py; с --generate база сначала заполняется заново.
+
+    python check_indexes.py
+    python check_indexes.py --generate 0.01
+"""
+import argparse
+import sys
+import db
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Проверка использования индексов горячими запросами')
+    parser.add_argument('--generate', type=float, default=None, metavar='SCALE',
+                        help='перед проверкой заполнить базу через datagen.py в этом масштабе (с --reset)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.generate is not None:
+        import datagen
+        if datagen.main(['--scale', str(args.generate), '--reset']):
+            return 2
+
+    too_small = db.index_check_tables_too_small()
+    if too_small:
+        for table, count in too_small.items():
+            print(f"{table}: {count} rows, need at least {db.INDEX_CHECK_MIN_ROWS[table]}")
+        print("Database is too small for meaningful plans; run datagen.py first or pass --generate SCALE")
+        return 2
+
+    results = db.check_index_usage()
+    for r in results:
+        status = 'OK  ' if r['ok'] else 'MISS'
+        print(f"{status} {r['query']} [{r['table']}] expected {r['index']}, chosen {r['chosen']}")
+    missing = [r for r in results if not r['ok']]
+    if missing:
+        print(f"{len(missing)} of {len(results)} index checks failed")
+        return 1
+    print(f"All {len(results)} index checks passed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
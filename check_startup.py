@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+
+# Бюджет на импорт всего, что нужно до показа окна входа, в миллисекундах: около двух
+# измеренных стоимостей, чтобы заметный рост времени запуска сразу валил проверку
+DEFAULT_BUDGET_MS = 120
+
+# Импорт замеряется несколько раз и берётся лучший прогон: так меньше шума от диска и планировщика
+RUNS = 5
+
+# Эти модули не должны загружаться до входа в систему
+DEFERRED_MODULES = ('admin_ui', 'chief_ui', 'patient_ui')
+
+
+def measure_imports():
+    """Импортирует main в отдельном процессе с -X importtime и возвращает {модуль: накопленное время, мкс}"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=here, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import main failed')
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+    timings = min((measure_imports() for _ in range(RUNS)), key=lambda run: run.get('main', 0))
+    total_ms = timings.get('main', 0) / 1000
+
+    failures = []
+    loaded = [name for name in DEFERRED_MODULES if name in timings]
+    if loaded:
+        failures.append(f"role modules imported at startup: {', '.join(loaded)}")
+    if total_ms > budget_ms:
+        failures.append(f"import main took {total_ms:.1f} ms, budget {budget_ms:.0f} ms")
+
+    slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:10]
+    for name, us in slowest:
+        print(f"{us / 1000:8.1f} ms  {name}")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        return 1
+    print(f"OK import main took {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
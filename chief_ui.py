@@ -3,10 +3,14 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QTabWidget, QTableWidget, QTableWidgetItem,
                              QPushButton, QComboBox, QLabel, QMessageBox,
                              QDialog, QFormLayout, QSpinBox, QDoubleSpinBox,
-                             QLineEdit, QTextEdit)
-from PyQt6.QtCore import Qt
+                             QLineEdit, QTextEdit, QCheckBox)
 import db
-from datetime import datetime
+import item_directory
+import operations
+from datetime import date, datetime
+from ui_async import QueryRunner, LazyTabs
+from ui_table import (RowTableModel, create_table_view, selected_record, fit_columns, format_money,
+                      format_percent)
 
 
 def get_item_type_ru(item_type):
@@ -29,6 +33,10 @@ def get_item_type_en(item_type_ru):
     return types_map.get(item_type_ru, item_type_ru)
 
 
+def format_month(value):
+    return value.strftime('%m.%Y')
+
+
 def get_purchase_status_ru(status):
     status_map = {
         'NEW': 'Новая',
@@ -94,11 +102,9 @@ class ManagerWindow(QMainWindow):
         super().__init__()
         self.user = user
         self.current_purchase_items = []
+        self.queries = QueryRunner(self, on_error=self.show_load_error)
         self.init_ui()
-        self.load_suppliers()
-        self.load_purchases()
-        self.load_receipts()
-        self.load_writeoffs()
+        self.lazy_tabs.start()
     
     def init_ui(self):
         self.setWindowTitle(f'Менеджер по закупкам - {self.user["username"]}')
@@ -110,16 +116,21 @@ class ManagerWindow(QMainWindow):
         layout = QVBoxLayout()
         central_widget.setLayout(layout)
         
-        # Вкладки
+        # Вкладки; данные вкладки загружаются при первом открытии, остальные подгружаются в фоне
         tabs = QTabWidget()
-        tabs.addTab(self.create_suppliers_tab(), 'Поставщики и цены')
-        tabs.addTab(self.create_purchase_tab(), 'Создать закупку')
-        tabs.addTab(self.create_receipt_tab(), 'Приём поставки')
-        tabs.addTab(self.create_writeoff_tab(), 'Списания')
-        tabs.addTab(self.create_reports_tab(), 'Отчёты')
+        self.lazy_tabs = LazyTabs(tabs, self.queries)
+        # Список поставщиков нужен и для цен, и для создания закупки
+        self.lazy_tabs.add_tab(self.create_suppliers_tab(), 'Поставщики и цены', self.load_suppliers)
+        self.lazy_tabs.add_tab(self.create_purchase_tab(), 'Создать закупку', self.load_suppliers)
+        self.lazy_tabs.add_tab(self.create_receipt_tab(), 'Приём поставки', self.load_purchases, self.load_receipts)
+        self.lazy_tabs.add_tab(self.create_writeoff_tab(), 'Списания', self.load_writeoffs)
+        self.lazy_tabs.add_tab(self.create_reports_tab(), 'Отчёты')
         
         layout.addWidget(tabs)
     
+    def show_load_error(self, error):
+        QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки данных: {str(error)}')
+    
     def create_suppliers_tab(self):
         """Вкладка поставщиков и цен"""
         widget = QWidget()
@@ -127,9 +138,13 @@ class ManagerWindow(QMainWindow):
         
         # Поставщики
         layout.addWidget(QLabel('Поставщики:'))
-        self.suppliers_table = QTableWidget()
-        self.suppliers_table.setColumnCount(4)
-        self.suppliers_table.setHorizontalHeaderLabels(['ID', 'Название', 'Телефон', 'Email'])
+        self.suppliers_model = RowTableModel([
+            ('ID', 'supplier_id', None),
+            ('Название', 'name', None),
+            ('Телефон', 'phone', None),
+            ('Email', 'email', None),
+        ], parent=self)
+        self.suppliers_table = create_table_view(self.suppliers_model)
         layout.addWidget(self.suppliers_table)
         
         # Цены поставщиков
@@ -142,9 +157,14 @@ class ManagerWindow(QMainWindow):
         filter_layout.addWidget(self.price_supplier_filter)
         layout.addLayout(filter_layout)
         
-        self.supplier_prices_table = QTableWidget()
-        self.supplier_prices_table.setColumnCount(5)
-        self.supplier_prices_table.setHorizontalHeaderLabels(['Поставщик', 'Тип', 'Товар', 'Цена', 'ID товара'])
+        self.supplier_prices_model = RowTableModel([
+            ('Поставщик', 'supplier_name', None),
+            ('Тип', 'item_type', get_item_type_ru),
+            ('Товар', 'item_name', None),
+            ('Цена', 'price', format_money),
+            ('ID товара', 'item_id', None),
+        ], parent=self)
+        self.supplier_prices_table = create_table_view(self.supplier_prices_model)
         layout.addWidget(self.supplier_prices_table)
         
         widget.setLayout(layout)
@@ -164,10 +184,14 @@ class ManagerWindow(QMainWindow):
         
         # Доступные товары
         layout.addWidget(QLabel('Доступные товары:'))
-        self.purchase_items_table = QTableWidget()
-        self.purchase_items_table.setColumnCount(4)
-        self.purchase_items_table.setHorizontalHeaderLabels(['Тип', 'ID', 'Название', 'Цена поставщика'])
-        self.purchase_items_table.cellDoubleClicked.connect(self.add_to_purchase)
+        self.purchase_items_model = RowTableModel([
+            ('Тип', 'item_type', get_item_type_ru),
+            ('ID', 'item_id', None),
+            ('Название', 'name', None),
+            ('Цена поставщика', 'price', format_money),
+        ], runner=self.queries, key='purchase_items', parent=self)
+        self.purchase_items_table = create_table_view(self.purchase_items_model)
+        self.purchase_items_table.doubleClicked.connect(self.add_to_purchase)
         layout.addWidget(self.purchase_items_table)
         
         btn_add = QPushButton('Добавить в закупку')
@@ -198,9 +222,19 @@ class ManagerWindow(QMainWindow):
         layout = QVBoxLayout()
         
         layout.addWidget(QLabel('Закупки для приёма:'))
-        self.receipt_purchases_table = QTableWidget()
-        self.receipt_purchases_table.setColumnCount(4)
-        self.receipt_purchases_table.setHorizontalHeaderLabels(['ID', 'Поставщик', 'Дата', 'Статус'])
+        self.receipt_purchases_model = RowTableModel([
+            ('ID', 'purchase_id', None),
+            ('Поставщик', 'supplier_name', None),
+            ('Дата', 'created_at', None),
+            ('Статус', 'status', get_purchase_status_ru),
+        ], runner=self.queries, key='purchases', parent=self)
+        self.receipt_purchases_model.set_loader(lambda token: db.fetch_page("""
+            SELECT po.purchase_id, s.name as supplier_name, po.created_at, po.status
+            FROM purchase_orders po
+            JOIN suppliers s ON po.supplier_id = s.supplier_id
+            WHERE {page}
+        """, key='po.purchase_id', token=token))
+        self.receipt_purchases_table = create_table_view(self.receipt_purchases_model)
         layout.addWidget(self.receipt_purchases_table)
         
         btn_receive = QPushButton('Принять поставку')
@@ -242,16 +276,23 @@ class ManagerWindow(QMainWindow):
         
         # История списаний
         layout.addWidget(QLabel('История списаний:'))
-        self.writeoffs_table = QTableWidget()
-        self.writeoffs_table.setColumnCount(6)
-        self.writeoffs_table.setHorizontalHeaderLabels(['ID', 'Цветок', 'Сорт', 'Кол-во', 'Причина', 'Дата'])
+        self.writeoffs_model = RowTableModel([
+            ('ID', 'writeoff_id', None),
+            ('Цветок', 'flower_name', None),
+            ('Сорт', 'variety', None),
+            ('Кол-во', 'qty', None),
+            ('Причина', 'reason', get_writeoff_reason_ru),
+            ('Дата', 'created_at', None),
+        ], runner=self.queries, key='writeoffs', parent=self)
+        self.writeoffs_model.set_loader(operations.writeoff_page)
+        self.writeoffs_table = create_table_view(self.writeoffs_model)
         layout.addWidget(self.writeoffs_table)
         
         widget.setLayout(layout)
         return widget
     
     def create_reports_tab(self):
-        """Вкладка отчётов с процедурой и функцией"""
+        """Вкладка отчётов: процедура, функция, списания и цены по всему ассортименту"""
         widget = QWidget()
         layout = QVBoxLayout()
         
@@ -318,9 +359,111 @@ class ManagerWindow(QMainWindow):
         func_group.setLayout(func_layout)
         layout.addWidget(func_group)
         
+        # Процент списаний по всему ассортименту одним запросом
+        report_group = QWidget()
+        report_layout = QVBoxLayout()
+        report_layout.addWidget(QLabel('Процент списаний по всем сортам за последние 3 месяца'))
+        
+        report_options = QHBoxLayout()
+        self.writeoff_report_by_flower = QCheckBox('По цветкам')
+        report_options.addWidget(self.writeoff_report_by_flower)
+        self.writeoff_report_by_month = QCheckBox('По месяцам')
+        report_options.addWidget(self.writeoff_report_by_month)
+        btn_report = QPushButton('Построить отчёт')
+        btn_report.clicked.connect(self.load_writeoff_report)
+        report_options.addWidget(btn_report)
+        report_options.addStretch()
+        report_layout.addLayout(report_options)
+        
+        self.writeoff_report_model = RowTableModel([
+            ('Сорт', 'variety', None),
+            ('Цветок', 'flower_name', None),
+            ('Месяц', 'month', None),
+            ('Списано', 'written_off', None),
+            ('Продано', 'sold', None),
+            ('% списаний', 'percent', format_percent),
+        ], parent=self)
+        self.writeoff_report_table = create_table_view(self.writeoff_report_model, sortable=True)
+        report_layout.addWidget(self.writeoff_report_table)
+        
+        report_group.setLayout(report_layout)
+        layout.addWidget(report_group, 1)
+        
+        # Ряды средних закупочных цен по месяцам для нескольких цветков
+        series_group = QWidget()
+        series_layout = QVBoxLayout()
+        series_layout.addWidget(QLabel('Средняя закупочная цена по месяцам'))
+        
+        series_form = QHBoxLayout()
+        self.series_names = QLineEdit()
+        self.series_names.setPlaceholderText('Цветки через запятую, пусто - все')
+        series_form.addWidget(self.series_names, 1)
+        today = datetime.now()
+        start_year, start_month = (today.year, today.month - 11) if today.month == 12 else (today.year - 1, today.month + 1)
+        self.series_from_year, self.series_from_month = self.create_month_fields(series_form, 'С:', start_year, start_month)
+        self.series_to_year, self.series_to_month = self.create_month_fields(series_form, 'По:', today.year, today.month)
+        btn_series = QPushButton('Построить')
+        btn_series.clicked.connect(self.load_price_series)
+        series_form.addWidget(btn_series)
+        series_layout.addLayout(series_form)
+        
+        self.price_series_model = RowTableModel([
+            ('Цветок', 'flower_name', None),
+            ('Месяц', 'month', format_month),
+            ('Средняя цена', 'avg_price', format_money),
+            ('Строк прихода', 'samples', None),
+        ], parent=self)
+        self.price_series_table = create_table_view(self.price_series_model, sortable=True)
+        series_layout.addWidget(self.price_series_table)
+        
+        series_group.setLayout(series_layout)
+        layout.addWidget(series_group, 1)
+        
         widget.setLayout(layout)
         return widget
     
+    def create_month_fields(self, form, label, year, month):
+        form.addWidget(QLabel(label))
+        year_field = QSpinBox()
+        year_field.setMinimum(2020)
+        year_field.setMaximum(2100)
+        year_field.setValue(year)
+        form.addWidget(year_field)
+        month_field = QSpinBox()
+        month_field.setMinimum(1)
+        month_field.setMaximum(12)
+        month_field.setValue(month)
+        form.addWidget(month_field)
+        return year_field, month_field
+    
+    def load_price_series(self):
+        """Средние закупочные цены по месяцам; закрытые месяцы берутся из запомненных сумм"""
+        names = [name.strip() for name in self.series_names.text().split(',') if name.strip()]
+        first_month = date(self.series_from_year.value(), self.series_from_month.value(), 1)
+        last_month = date(self.series_to_year.value(), self.series_to_month.value(), 1)
+        if first_month > last_month:
+            QMessageBox.warning(self, 'Ошибка', 'Начало периода позже конца')
+            return
+        self.queries.submit('price_series', operations.price_series, names, first_month, last_month,
+                            on_result=self.fill_price_series)
+    
+    def fill_price_series(self, rows):
+        self.price_series_model.set_rows(rows)
+        fit_columns(self.price_series_table)
+    
+    def load_writeoff_report(self):
+        """Процент списаний по всем сортам (и по цветкам/месяцам) одним запросом"""
+        by_flower = self.writeoff_report_by_flower.isChecked()
+        by_month = self.writeoff_report_by_month.isChecked()
+        self.queries.submit('writeoff_report', operations.writeoff_report, by_flower, by_month,
+                            on_result=lambda rows: self.fill_writeoff_report(rows, by_flower, by_month))
+    
+    def fill_writeoff_report(self, rows, by_flower, by_month):
+        self.writeoff_report_table.setColumnHidden(1, not by_flower)
+        self.writeoff_report_table.setColumnHidden(2, not by_month)
+        self.writeoff_report_model.set_rows(rows)
+        fit_columns(self.writeoff_report_table)
+    
     def update_period_fields(self):
         """Показывает/скрывает поле месяца в зависимости от типа периода"""
         # Простая реализация - поле всегда видно, но используется только для MONTH
@@ -328,14 +471,14 @@ class ManagerWindow(QMainWindow):
     
     def load_suppliers(self):
         """Загружает поставщиков"""
-        suppliers = db.fetch_all("SELECT * FROM suppliers ORDER BY supplier_id")
-        self.suppliers_table.setRowCount(len(suppliers))
-        for i, supplier in enumerate(suppliers):
-            self.suppliers_table.setItem(i, 0, QTableWidgetItem(str(supplier['supplier_id'])))
-            self.suppliers_table.setItem(i, 1, QTableWidgetItem(supplier['name']))
-            self.suppliers_table.setItem(i, 2, QTableWidgetItem(supplier['phone'] or ''))
-            self.suppliers_table.setItem(i, 3, QTableWidgetItem(supplier['email'] or ''))
-        self.suppliers_table.resizeColumnsToContents()
+        self.queries.submit(
+            'suppliers', db.fetch_all, "SELECT * FROM suppliers ORDER BY supplier_id", cached=True,
+            on_result=self.fill_suppliers
+        )
+    
+    def fill_suppliers(self, suppliers):
+        self.suppliers_model.set_rows(suppliers)
+        fit_columns(self.suppliers_table)
         
         # Обновляем фильтр
         self.price_supplier_filter.clear()
@@ -354,40 +497,25 @@ class ManagerWindow(QMainWindow):
         """Загружает цены поставщиков"""
         supplier_id = self.price_supplier_filter.currentData()
         
+        sql = """
+            SELECT sp.*, s.name as supplier_name
+            FROM supplier_prices sp
+            JOIN suppliers s ON sp.supplier_id = s.supplier_id
+        """
+        params = None
         if supplier_id:
-            sql = """
-                SELECT sp.*, s.name as supplier_name,
-                       CASE sp.item_type
-                           WHEN 'FLOWER' THEN (SELECT name FROM flowers WHERE flower_id = sp.item_id)
-                           WHEN 'PACKAGING' THEN (SELECT name FROM packaging WHERE packaging_id = sp.item_id)
-                           WHEN 'ACCESSORY' THEN (SELECT name FROM accessories WHERE accessory_id = sp.item_id)
-                       END as item_name
-                FROM supplier_prices sp
-                JOIN suppliers s ON sp.supplier_id = s.supplier_id
-                WHERE sp.supplier_id = %s
-            """
-            prices = db.fetch_all(sql, (supplier_id,))
-        else:
-            sql = """
-                SELECT sp.*, s.name as supplier_name,
-                       CASE sp.item_type
-                           WHEN 'FLOWER' THEN (SELECT name FROM flowers WHERE flower_id = sp.item_id)
-                           WHEN 'PACKAGING' THEN (SELECT name FROM packaging WHERE packaging_id = sp.item_id)
-                           WHEN 'ACCESSORY' THEN (SELECT name FROM accessories WHERE accessory_id = sp.item_id)
-                       END as item_name
-                FROM supplier_prices sp
-                JOIN suppliers s ON sp.supplier_id = s.supplier_id
-            """
-            prices = db.fetch_all(sql)
-        
-        self.supplier_prices_table.setRowCount(len(prices))
-        for i, price in enumerate(prices):
-            self.supplier_prices_table.setItem(i, 0, QTableWidgetItem(price['supplier_name']))
-            self.supplier_prices_table.setItem(i, 1, QTableWidgetItem(get_item_type_ru(price['item_type'])))
-            self.supplier_prices_table.setItem(i, 2, QTableWidgetItem(price['item_name']))
-            self.supplier_prices_table.setItem(i, 3, QTableWidgetItem(f"{price['price']:.2f}"))
-            self.supplier_prices_table.setItem(i, 4, QTableWidgetItem(str(price['item_id'])))
-        self.supplier_prices_table.resizeColumnsToContents()
+            sql += " WHERE sp.supplier_id = %s"
+            params = (supplier_id,)
+        
+        def query():
+            # Названия товаров из справочника вместо подзапроса на каждую строку
+            return item_directory.with_names(db.fetch_all(sql, params, cached=True))
+        
+        self.queries.submit('supplier_prices', query, on_result=self.fill_supplier_prices)
+    
+    def fill_supplier_prices(self, prices):
+        self.supplier_prices_model.set_rows(prices)
+        fit_columns(self.supplier_prices_table)
         
         # Загружаем товары для закупки
         self.load_purchase_items()
@@ -396,66 +524,28 @@ class ManagerWindow(QMainWindow):
         """Загружает товары для закупки (с ценами поставщиков)"""
         supplier_id = self.purchase_supplier.currentData()
         if not supplier_id:
-            self.purchase_items_table.setRowCount(0)
+            self.purchase_items_model.clear()
             return
         
-        items = []
-        
-        # Цветы с ценами поставщика
-        sql = """
-            SELECT f.*, COALESCE(sp.price, f.price * 0.8) as supplier_price
-            FROM flowers f
-            LEFT JOIN supplier_prices sp ON sp.supplier_id = %s AND sp.item_type = 'FLOWER' AND sp.item_id = f.flower_id
-            WHERE f.is_active = 1
-        """
-        flowers = db.fetch_all(sql, (supplier_id,))
-        for f in flowers:
-            items.append(('FLOWER', f['flower_id'], f['name'], f['supplier_price']))
-        
-        # Упаковка
-        sql = """
-            SELECT p.*, COALESCE(sp.price, p.price * 0.8) as supplier_price
-            FROM packaging p
-            LEFT JOIN supplier_prices sp ON sp.supplier_id = %s AND sp.item_type = 'PACKAGING' AND sp.item_id = p.packaging_id
-        """
-        packaging = db.fetch_all(sql, (supplier_id,))
-        for p in packaging:
-            items.append(('PACKAGING', p['packaging_id'], p['name'], p['supplier_price']))
-        
-        # Аксессуары
-        sql = """
-            SELECT a.*, COALESCE(sp.price, a.price * 0.8) as supplier_price
-            FROM accessories a
-            LEFT JOIN supplier_prices sp ON sp.supplier_id = %s AND sp.item_type = 'ACCESSORY' AND sp.item_id = a.accessory_id
-        """
-        accessories = db.fetch_all(sql, (supplier_id,))
-        for a in accessories:
-            items.append(('ACCESSORY', a['accessory_id'], a['name'], a['supplier_price']))
-        
-        self.purchase_items_table.setRowCount(len(items))
-        for i, (item_type, item_id, name, price) in enumerate(items):
-            # Сохраняем английское значение в userData
-            type_item = QTableWidgetItem(get_item_type_ru(item_type))
-            type_item.setData(Qt.ItemDataRole.UserRole, item_type)
-            self.purchase_items_table.setItem(i, 0, type_item)
-            self.purchase_items_table.setItem(i, 1, QTableWidgetItem(str(item_id)))
-            self.purchase_items_table.setItem(i, 2, QTableWidgetItem(name))
-            self.purchase_items_table.setItem(i, 3, QTableWidgetItem(f'{price:.2f}'))
-        self.purchase_items_table.resizeColumnsToContents()
+        self.queries.submit('purchase_items', operations.purchase_items, supplier_id,
+                            on_result=self.fill_purchase_items)
+    
+    def fill_purchase_items(self, items):
+        self.purchase_items_model.set_rows(items)
+        fit_columns(self.purchase_items_table)
     
     def add_to_purchase(self):
         """Добавляет товар в закупку"""
-        row = self.purchase_items_table.currentRow()
-        if row < 0:
+        record = selected_record(self.purchase_items_table)
+        if record is None:
             QMessageBox.warning(self, 'Ошибка', 'Выберите товар')
             return
         
-        # Получаем оригинальное английское значение из userData
-        type_item = self.purchase_items_table.item(row, 0)
-        item_type = type_item.data(Qt.ItemDataRole.UserRole) or get_item_type_en(type_item.text())
-        item_id = int(self.purchase_items_table.item(row, 1).text())
-        name = self.purchase_items_table.item(row, 2).text()
-        price = float(self.purchase_items_table.item(row, 3).text())
+        # В модели хранится исходное английское значение типа
+        item_type = record['item_type']
+        item_id = record['item_id']
+        name = record['name']
+        price = float(record['price'])
         
         # Проверяем, есть ли уже
         for item in self.current_purchase_items:
@@ -508,18 +598,7 @@ class ManagerWindow(QMainWindow):
             return
         
         try:
-            # Создаём закупку
-            purchase_id = db.execute(
-                "INSERT INTO purchase_orders (supplier_id, status) VALUES (%s, %s)",
-                (supplier_id, 'NEW')
-            )
-            
-            # Добавляем позиции
-            for item in self.current_purchase_items:
-                db.execute(
-                    "INSERT INTO purchase_items (purchase_id, item_type, item_id, qty, price) VALUES (%s, %s, %s, %s, %s)",
-                    (purchase_id, item['item_type'], item['item_id'], item['qty'], item['price'])
-                )
+            purchase_id = operations.create_purchase(supplier_id, self.current_purchase_items)
             
             QMessageBox.information(self, 'Успех', f'Закупка #{purchase_id} создана')
             self.current_purchase_items.clear()
@@ -530,80 +609,29 @@ class ManagerWindow(QMainWindow):
     
     def load_purchases(self):
         """Загружает закупки"""
-        purchases = db.fetch_all("""
-            SELECT po.*, s.name as supplier_name
-            FROM purchase_orders po
-            JOIN suppliers s ON po.supplier_id = s.supplier_id
-            ORDER BY po.purchase_id DESC
-        """)
-        
-        self.receipt_purchases_table.setRowCount(len(purchases))
-        for i, purchase in enumerate(purchases):
-            self.receipt_purchases_table.setItem(i, 0, QTableWidgetItem(str(purchase['purchase_id'])))
-            self.receipt_purchases_table.setItem(i, 1, QTableWidgetItem(purchase['supplier_name']))
-            self.receipt_purchases_table.setItem(i, 2, QTableWidgetItem(str(purchase['created_at'])))
-            self.receipt_purchases_table.setItem(i, 3, QTableWidgetItem(get_purchase_status_ru(purchase['status'])))
-        self.receipt_purchases_table.resizeColumnsToContents()
+        self.receipt_purchases_model.reload(on_loaded=lambda: fit_columns(self.receipt_purchases_table))
     
     def receive_purchase(self):
         """Принимает поставку"""
-        row = self.receipt_purchases_table.currentRow()
-        if row < 0:
+        record = selected_record(self.receipt_purchases_table)
+        if record is None:
             QMessageBox.warning(self, 'Ошибка', 'Выберите закупку')
             return
         
-        purchase_id = int(self.receipt_purchases_table.item(row, 0).text())
-        
-        purchase = db.fetch_one("SELECT * FROM purchase_orders WHERE purchase_id = %s", (purchase_id,))
-        if not purchase:
-            QMessageBox.warning(self, 'Ошибка', 'Закупка не найдена')
-            return
-        
-        if purchase['status'] == 'RECEIVED':
-            QMessageBox.warning(self, 'Ошибка', 'Поставка уже принята')
-            return
+        purchase_id = record['purchase_id']
         
         try:
-            # Создаём приход
-            receipt_id = db.execute(
-                "INSERT INTO receipts (purchase_id, received_at) VALUES (%s, NOW())",
-                (purchase_id,)
-            )
-            
-            # Получаем позиции закупки
-            items = db.fetch_all("SELECT * FROM purchase_items WHERE purchase_id = %s", (purchase_id,))
-            
-            # Создаём позиции прихода и увеличиваем остатки
-            for item in items:
-                db.execute(
-                    "INSERT INTO receipt_items (receipt_id, item_type, item_id, qty, buy_price) VALUES (%s, %s, %s, %s, %s)",
-                    (receipt_id, item['item_type'], item['item_id'], item['qty'], item['price'])
-                )
-                
-                # Увеличиваем остатки
-                # Проверяем, есть ли запись в inventory
-                inv = db.fetch_one(
-                    "SELECT * FROM inventory WHERE item_type = %s AND item_id = %s",
-                    (item['item_type'], item['item_id'])
-                )
-                if inv:
-                    db.execute(
-                        "UPDATE inventory SET qty = qty + %s WHERE item_type = %s AND item_id = %s",
-                        (item['qty'], item['item_type'], item['item_id'])
-                    )
-                else:
-                    db.execute(
-                        "INSERT INTO inventory (item_type, item_id, qty) VALUES (%s, %s, %s)",
-                        (item['item_type'], item['item_id'], item['qty'])
-                    )
-            db.execute(
-                "UPDATE purchase_orders SET status = 'RECEIVED' WHERE purchase_id = %s",
-                (purchase_id,)
-            )
+            receipt_id = operations.receive_purchase(purchase_id)
             
             QMessageBox.information(self, 'Успех', f'Поставка #{receipt_id} принята, остатки обновлены')
             self.load_receipts()
             self.load_purchases()
+        except operations.NotFound as e:
+            QMessageBox.warning(self, 'Ошибка', str(e))
+        except operations.AlreadyProcessed as e:
+            # Поставку могли принять с другого терминала - обновляем список
+            QMessageBox.warning(self, 'Ошибка', str(e))
+            self.load_purchases()
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при приёме поставки: {str(e)}')
     
@@ -612,68 +640,49 @@ class ManagerWindow(QMainWindow):
         pass
     
     def load_writeoffs(self):
-        writeoffs = db.fetch_all("""
-            SELECT wo.*, f.name as flower_name, f.variety
-            FROM write_offs wo
-            JOIN flowers f ON wo.item_id = f.flower_id
-            ORDER BY wo.created_at DESC
-        """)
-        
-        self.writeoffs_table.setRowCount(len(writeoffs))
-        for i, wo in enumerate(writeoffs):
-            self.writeoffs_table.setItem(i, 0, QTableWidgetItem(str(wo['writeoff_id'])))
-            self.writeoffs_table.setItem(i, 1, QTableWidgetItem(wo['flower_name']))
-            self.writeoffs_table.setItem(i, 2, QTableWidgetItem(wo['variety']))
-            self.writeoffs_table.setItem(i, 3, QTableWidgetItem(str(wo['qty'])))
-            self.writeoffs_table.setItem(i, 4, QTableWidgetItem(get_writeoff_reason_ru(wo['reason'])))
-            self.writeoffs_table.setItem(i, 5, QTableWidgetItem(str(wo['created_at'])))
-        self.writeoffs_table.resizeColumnsToContents()
-        
-        # Загружаем цветы для списания
-        flowers = db.fetch_all("SELECT flower_id, name, variety FROM flowers WHERE is_active = 1 ORDER BY name, variety")
+        # История списаний постранично, цветы для списания отдельным запросом
+        self.writeoffs_model.reload(on_loaded=lambda: fit_columns(self.writeoffs_table))
+        self.queries.submit('writeoff_flowers', operations.writeoff_flowers, on_result=self.fill_writeoff_flowers)
+    
+    def fill_writeoff_flowers(self, flowers):
+        # Заполняем цветы для списания
         self.writeoff_flower.clear()
         for flower in flowers:
             self.writeoff_flower.addItem(f"{flower['name']} - {flower['variety']}", flower['flower_id'])
     
     def process_writeoff(self):
         flower_id = self.writeoff_flower.currentData()
-        if not flower_id:
-            text = self.writeoff_flower.currentText().strip()
-            if not text:
-                QMessageBox.warning(self, 'Ошибка', 'Выберите или введите цветок')
-                return
-
-            flower = db.fetch_one("SELECT flower_id FROM flowers WHERE name LIKE %s LIMIT 1", (f'%{text}%',))
-            if not flower:
-                QMessageBox.warning(self, 'Ошибка', 'Цветок не найден')
-                return
-            flower_id = flower['flower_id']
-        
         qty = self.writeoff_qty.value()
         reason = self.writeoff_reason.currentData()
+        if flower_id:
+            self.write_off_flower(flower_id, qty, reason)
+            return
 
-        inv = db.fetch_one(
-            "SELECT qty FROM inventory WHERE item_type = 'FLOWER' AND item_id = %s",
-            (flower_id,)
-        )
-        if not inv or inv['qty'] < qty:
-            QMessageBox.warning(self, 'Ошибка', 'Недостаточно товара на складе')
+        text = self.writeoff_flower.currentText().strip()
+        if not text:
+            QMessageBox.warning(self, 'Ошибка', 'Выберите или введите цветок')
             return
-        
-        try:
-            db.execute(
-                "INSERT INTO write_offs (item_type, item_id, qty, reason, created_at) VALUES ('FLOWER', %s, %s, %s, NOW())",
-                (flower_id, qty, reason)
-            )
 
-            db.execute(
-                "UPDATE inventory SET qty = qty - %s WHERE item_type = 'FLOWER' AND item_id = %s",
-                (qty, flower_id)
-            )
+        # Самый релевантный цветок по названию, сорту и цвету; поиск идёт в фоне
+        def found(items):
+            if not items:
+                QMessageBox.warning(self, 'Ошибка', 'Цветок не найден')
+                return
+            self.write_off_flower(items[0]['item_id'], qty, reason)
+
+        self.queries.submit('writeoff_flower_search', db.search_catalog, text, item_types=('FLOWER',), limit=1,
+                            on_result=found)
+    
+    def write_off_flower(self, flower_id, qty, reason):
+        try:
+            operations.process_writeoff(flower_id, qty, reason)
             
             QMessageBox.information(self, 'Успех', 'Товар списан')
             self.writeoff_qty.setValue(1)
             self.load_writeoffs()
+        except db.StockShortage as e:
+            available = e.shortfalls[0]['available']
+            QMessageBox.warning(self, 'Ошибка', f'Недостаточно товара на складе (в наличии: {available})')
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при списании: {str(e)}')
     
@@ -688,20 +697,11 @@ class ManagerWindow(QMainWindow):
         month = self.proc_month.value()
         
         try:
-            conn = db.get_connection()
-            with conn.cursor() as cursor:
-                if period_type == 'MONTH':
-                    cursor.callproc('get_avg_flower_price', (flower_name, period_type, year, month))
-                else:
-                    cursor.callproc('get_avg_flower_price', (flower_name, period_type, year, 0))
-                
-                result = cursor.fetchone()
-                if result:
-                    avg_price = result['avg_price']
-                    self.proc_result.setText(f'Результат: {avg_price:.2f} ₽')
-                else:
-                    self.proc_result.setText('Результат: Данные не найдены')
-            conn.close()
+            avg_price = operations.avg_flower_price(flower_name, period_type, year, month)
+            if avg_price is not None:
+                self.proc_result.setText(f'Результат: {avg_price:.2f} ₽')
+            else:
+                self.proc_result.setText('Результат: Данные не найдены')
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при вызове процедуры: {str(e)}')
             self.proc_result.setText('Результат: Ошибка')
@@ -714,9 +714,8 @@ class ManagerWindow(QMainWindow):
             return
         
         try:
-            result = db.fetch_one("SELECT get_writeoff_percent(%s) as percent", (variety,))
-            if result:
-                percent = result['percent']
+            percent = operations.writeoff_percent(variety)
+            if percent is not None:
                 self.func_result.setText(f'Результат: {percent:.2f}%')
             else:
                 self.func_result.setText('Результат: Данные не найдены')
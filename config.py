@@ -8,3 +8,26 @@ DB_CONFIG = {
     'autocommit': False
 }
 
+POOL_CONFIG = {
+    'min_size': 1,
+    'max_size': 10,
+    'idle_timeout': 300,
+    'acquire_timeout': 10
+}
+
+# Кэш результатов fetch_all/fetch_one(cached=True); ttl в секундах. Записи других терминалов
+# кэш не видит, поэтому ttl короткий: он лишь гасит повторы при открытии вкладок и выборе в списках
+CACHE_CONFIG = {
+    'max_entries': 256,
+    'ttl': 5
+}
+
+# Статистика запросов: операторы дольше slow_query_ms пишутся в slow_log (JSON по строке).
+# Отчёт db.dump_query_report() при выходе из приложения пишется в report_path или в файл из
+# переменной окружения FLOWER_QUERY_REPORT; по умолчанию отчёт не сохраняется
+STATS_CONFIG = {
+    'enabled': True,
+    'slow_query_ms': 200,
+    'slow_log': 'slow_queries.log',
+    'report_path': None
+}
@@ -0,0 +1,665 @@
+"""
+Генератор синтетических данных для замеров производительности
+
+Заполняет существующую схему в заданном масштабе. Масштаб 1 - около 10 тыс. клиентов,
+2 тыс. товаров, 1 млн заказов с позициями, 200 тыс. списаний, закупки и поставки.
+Идентификаторы выдаются по порядку дат, как в живой базе. При одинаковых --seed и
+--end-date данные получаются одинаковыми.
+
+    python datagen.py --scale 0.01 --reset
+    python datagen.py --scale 10 --reset --method load
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, date, timedelta
+import pymysql
+from pymysql.cursors import DictCursor
+from config import DB_CONFIG
+import db
+
+
+# Объёмы при масштабе 1 и нижняя граница при маленьком масштабе
+BASE_COUNTS = {
+    'clients': 10_000,
+    'skus': 2_000,
+    'sellers': 20,
+    'suppliers': 50,
+    'purchase_orders': 20_000,
+    'orders': 1_000_000,
+    'write_offs': 200_000,
+    'custom_requests': 20_000,
+}
+MIN_COUNTS = {
+    'clients': 10,
+    'skus': 20,
+    'sellers': 2,
+    'suppliers': 3,
+    'purchase_orders': 10,
+    'orders': 100,
+    'write_offs': 20,
+    'custom_requests': 10,
+}
+
+# Доли товаров по типам
+SKU_SHARES = {'FLOWER': 0.6, 'BOUQUET': 0.2, 'PACKAGING': 0.1, 'ACCESSORY': 0.1}
+# Доля позиций заказа по типам товара
+ORDER_LINE_TYPES = (('FLOWER', 55), ('BOUQUET', 25), ('PACKAGING', 10), ('ACCESSORY', 10))
+# Доля клиентов с учётной записью для входа
+CLIENT_ACCOUNT_SHARE = 0.2
+
+# Часы работы магазина, секунды от полуночи
+OPEN_SECONDS = 9 * 3600
+CLOSE_SECONDS = 21 * 3600
+
+# Столбцы таблиц в порядке записи; порядок таблиц - порядок очистки при --reset
+TABLE_COLUMNS = {
+    'clients': ('client_id', 'full_name', 'phone', 'email', 'created_at'),
+    'users': ('user_id', 'username', 'password_hash', 'role', 'client_id'),
+    'flowers': ('flower_id', 'name', 'variety', 'color', 'price', 'shelf_life_days', 'is_active'),
+    'bouquets': ('bouquet_id', 'name', 'occasion', 'base_price', 'is_active'),
+    'bouquet_items': ('bouquet_id', 'flower_id', 'qty'),
+    'packaging': ('packaging_id', 'name', 'price'),
+    'accessories': ('accessory_id', 'name', 'price'),
+    'inventory': ('item_type', 'item_id', 'qty'),
+    'suppliers': ('supplier_id', 'name', 'phone', 'email'),
+    'supplier_prices': ('supplier_id', 'item_type', 'item_id', 'price'),
+    'purchase_orders': ('purchase_id', 'supplier_id', 'created_at', 'status'),
+    'purchase_items': ('purchase_item_id', 'purchase_id', 'item_type', 'item_id', 'qty', 'price'),
+    'receipts': ('receipt_id', 'purchase_id', 'received_at', 'note'),
+    'receipt_items': ('receipt_item_id', 'receipt_id', 'item_type', 'item_id', 'qty', 'buy_price'),
+    'orders': ('order_id', 'client_id', 'created_by_user_id', 'created_at', 'status', 'discount_percent', 'total_sum'),
+    'order_items': ('order_item_id', 'order_id', 'item_type', 'item_id', 'qty', 'price', 'sum'),
+    'payments': ('payment_id', 'order_id', 'paid_at', 'method', 'amount'),
+    'custom_requests': ('request_id', 'client_id', 'desired_date', 'wishes', 'status', 'created_at'),
+    'custom_request_items': ('request_item_id', 'request_id', 'flower_id', 'qty'),
+    'write_offs': ('writeoff_id', 'item_type', 'item_id', 'qty', 'reason', 'created_at'),
+}
+
+# Таблицы, которые приложение заполняет само по данным из TABLE_COLUMNS; очищаются после загрузки
+DERIVED_TABLES = ('flower_price_months',)
+
+MALE_NAMES = ('Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Иван', 'Михаил',
+              'Евгений', 'Николай', 'Павел', 'Владимир', 'Олег', 'Роман', 'Артём', 'Кирилл')
+FEMALE_NAMES = ('Анна', 'Мария', 'Елена', 'Ольга', 'Татьяна', 'Наталья', 'Ирина', 'Светлана',
+                'Екатерина', 'Юлия', 'Дарья', 'Алина', 'Ксения', 'Виктория', 'Полина', 'Софья')
+LAST_NAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+              'Михайлов', 'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов',
+              'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров')
+PATRONYMIC_ROOTS = ('Александров', 'Дмитриев', 'Сергеев', 'Андреев', 'Алексеев', 'Иванов',
+                    'Михайлов', 'Николаев', 'Павлов', 'Владимиров', 'Олегов', 'Петров')
+EMAIL_DOMAINS = ('mail.ru', 'yandex.ru', 'gmail.com', 'bk.ru', 'inbox.ru')
+
+# Название цветка, вес популярности, диапазон цены и срок хранения в днях
+FLOWER_KINDS = (
+    ('Роза', 30, (90, 400), 7),
+    ('Тюльпан', 12, (60, 180), 5),
+    ('Хризантема', 8, (80, 220), 12),
+    ('Гербера', 6, (70, 200), 8),
+    ('Лилия', 6, (150, 420), 8),
+    ('Пион', 5, (200, 600), 5),
+    ('Гвоздика', 6, (50, 150), 12),
+    ('Ирис', 3, (70, 190), 5),
+    ('Орхидея', 3, (300, 900), 14),
+    ('Альстромерия', 4, (90, 240), 10),
+    ('Эустома', 5, (120, 320), 9),
+    ('Гортензия', 4, (350, 900), 7),
+    ('Ранункулюс', 3, (150, 380), 6),
+    ('Фрезия', 2, (90, 230), 7),
+    ('Калла', 2, (200, 500), 8),
+    ('Подсолнух', 2, (120, 300), 6),
+    ('Нарцисс', 2, (50, 140), 5),
+    ('Гиацинт', 2, (120, 280), 6),
+)
+VARIETY_WORDS = ('Red', 'White', 'Pink', 'Yellow', 'Grand', 'Sweet', 'Royal', 'Double', 'Spray',
+                 'Mini', 'Classic', 'Vintage', 'Snow', 'Golden', 'Purple', 'Coral', 'Deep', 'Pastel')
+VARIETY_NAMES = ('Naomi', 'Avalanche', 'Explorer', 'Freedom', 'Mondial', 'Vendela', 'Esperance',
+                 'Aqua', 'Memory', 'Pearl', 'Princess', 'Star', 'Dream', 'Bella', 'Lady', 'Magic',
+                 'Queen', 'Spider', 'Santini', 'Bacardi', 'Viking', 'Dolce', 'Sunset', 'Harmony')
+COLORS = ('Красный', 'Белый', 'Розовый', 'Жёлтый', 'Оранжевый', 'Фиолетовый', 'Бордовый',
+          'Кремовый', 'Голубой', 'Зелёный', 'Персиковый', 'Сиреневый')
+
+BOUQUET_NAMES = ('Любовь', 'Нежность', 'Радость', 'Весна', 'Рассвет', 'Комплимент', 'Признание',
+                 'Улыбка', 'Вдохновение', 'Праздник', 'Мечта', 'Гармония', 'Очарование', 'Лето')
+OCCASIONS = ('День рождения', '8 Марта', 'Юбилей', 'Свадьба', '14 февраля', '1 сентября',
+             'Выпускной', 'Без повода', 'Извинение', 'Выписка из роддома')
+PACKAGING_NAMES = ('Крафтовая бумага', 'Плёнка', 'Коробка подарочная', 'Фетр', 'Корзина',
+                   'Шляпная коробка', 'Сетка', 'Органза', 'Матовая плёнка', 'Тишью')
+ACCESSORY_NAMES = ('Лента атласная', 'Открытка', 'Ваза стеклянная', 'Топпер', 'Мягкая игрушка',
+                   'Конфеты', 'Воздушный шар', 'Свеча', 'Подкормка для цветов', 'Брошь')
+SIZES = ('S', 'M', 'L', 'XL', '30 см', '40 см', '50 см', '60 см')
+
+SUPPLIER_PREFIXES = ('ООО', 'ИП', 'АО')
+SUPPLIER_NAMES = ('Цветы оптом', 'Голландия Флора', 'Флора Трейд', 'Сад и букет', 'Эквадор Роуз',
+                  'Кенийский цветок', 'Упаковка Плюс', 'Декор Опт', 'Зелёный мир', 'Флорист Маркет')
+
+WISH_TEMPLATES = (
+    'Основа букета - {flower}, цвет {color}',
+    'Без лилий, у получателя аллергия',
+    'Добавить открытку с надписью "С днём рождения"',
+    'Бюджет до {budget} рублей',
+    'Собрать в шляпной коробке',
+    'Пастельные оттенки, без ярких цветов',
+    'Доставка к {hour}:00, позвонить за час',
+    'Побольше зелени и эвкалипта',
+    'Букет невесты, небольшой и лёгкий',
+    'Композиция в корзине на юбилей',
+    'Стебли не короче 60 см',
+    'Упаковка в крафт, лента в цвет',
+)
+
+ORDER_RECENT_STATUSES = (('Новый', 15), ('Принят', 20), ('В сборке', 15), ('Готов', 10),
+                         ('Выдан', 35), ('Отменен', 5))
+ORDER_OLD_STATUSES = (('Выдан', 91), ('Отменен', 8), ('Готов', 1))
+PURCHASE_RECENT_STATUSES = (('NEW', 40), ('SENT', 45), ('RECEIVED', 10), ('CANCELLED', 5))
+PURCHASE_OLD_STATUSES = (('RECEIVED', 88), ('CANCELLED', 9), ('SENT', 3))
+WRITEOFF_REASONS = (('EXPIRED', 70), ('DAMAGED', 25), ('OTHER', 5))
+# Заказы моложе стольких дней ещё могут быть не выданы
+OPEN_ORDER_DAYS = 3
+OPEN_PURCHASE_DAYS = 7
+
+
+def scaled_counts(scale):
+    return {name: max(MIN_COUNTS[name], round(count * scale)) for name, count in BASE_COUNTS.items()}
+
+
+def day_weight(day):
+    """Относительный спрос в день: выходные, 14 февраля, 8 Марта, 1 сентября и конец года"""
+    weight = 1.3 if day.weekday() >= 5 else 1.0
+    month_day = (day.month, day.day)
+    if month_day == (3, 8):
+        weight *= 8
+    elif month_day == (3, 7):
+        weight *= 5
+    elif month_day in ((3, 5), (3, 6)):
+        weight *= 2.5
+    elif month_day == (2, 14):
+        weight *= 4
+    elif month_day in ((2, 12), (2, 13)):
+        weight *= 2
+    elif month_day == (9, 1):
+        weight *= 3
+    elif day.month == 12 and day.day >= 25:
+        weight *= 1.8
+    elif day.month == 1 and day.day <= 8:
+        weight *= 0.6
+    return weight
+
+
+def spread(total, days, weight):
+    """Распределяет total по дням пропорционально весам; дробные остатки переносятся дальше"""
+    weights = [weight(day) for day in days]
+    scale = total / sum(weights)
+    carry = 0.0
+    left = total
+    for index, (day, day_weight_value) in enumerate(zip(days, weights)):
+        exact = day_weight_value * scale + carry
+        count = left if index == len(days) - 1 else min(left, int(exact))
+        carry = exact - count
+        left -= count
+        if count:
+            yield day, count
+
+
+def pick(rng, weighted):
+    return rng.choices([value for value, _ in weighted], [weight for _, weight in weighted])[0]
+
+
+def skewed(rng, items, power=2.0):
+    # Начало списка популярнее: небольшая часть товаров и клиентов даёт основной оборот
+    return items[int(len(items) * rng.random() ** power)]
+
+
+def day_times(rng, day, count):
+    base = datetime(day.year, day.month, day.day)
+    return [base + timedelta(seconds=s) for s in sorted(rng.randrange(OPEN_SECONDS, CLOSE_SECONDS)
+                                                        for _ in range(count))]
+
+
+def money(value):
+    return round(value, 2)
+
+
+def tsv_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    text = str(value)
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class BulkWriter:
+    """Буферизует строки по таблицам и пишет их пачками.
+
+    method='insert' - многострочные INSERT (executemany в PyMySQL склеивает строки в один оператор),
+    method='load' - LOAD DATA LOCAL INFILE из временного файла. Каждая пачка фиксируется отдельно.
+    """
+
+    def __init__(self, conn, method='insert', batch_rows=None):
+        self.conn = conn
+        self.method = method
+        self.batch_rows = batch_rows or (100_000 if method == 'load' else 5_000)
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, table, row):
+        rows = self.buffers.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.batch_rows:
+            self.flush(table)
+
+    def flush(self, table=None):
+        tables = [table] if table else list(self.buffers)
+        for name in tables:
+            rows = self.buffers.get(name)
+            if not rows:
+                continue
+            if self.method == 'load':
+                self._load(name, rows)
+            else:
+                self._insert(name, rows)
+            self.conn.commit()
+            self.counts[name] = self.counts.get(name, 0) + len(rows)
+            self.buffers[name] = []
+
+    def _insert(self, table, rows):
+        columns = TABLE_COLUMNS[table]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        with self.conn.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def _load(self, table, rows):
+        columns = TABLE_COLUMNS[table]
+        handle, path = tempfile.mkstemp(prefix=f'datagen_{table}_', suffix='.tsv')
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8', newline='\n') as data:
+                for row in rows:
+                    data.write('\t'.join(tsv_value(value) for value in row))
+                    data.write('\n')
+            with self.conn.cursor() as cursor:
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 "
+                    f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(columns)})",
+                    (path,)
+                )
+        except pymysql.err.OperationalError as e:
+            # Сервер или клиент запретил local_infile - дописываем этой и следующими пачками через INSERT
+            print(f"LOAD DATA LOCAL is not available ({e}), falling back to multi-row INSERT")
+            self.conn.rollback()
+            self.method = 'insert'
+            self._insert(table, rows)
+        finally:
+            os.remove(path)
+
+
+class DataGenerator:
+    def __init__(self, writer, scale=1.0, seed=42, end_date=None, months=24):
+        self.writer = writer
+        self.rng = random.Random(seed)
+        self.counts = scaled_counts(scale)
+        self.end = end_date or date.today()
+        self.start = self.end - timedelta(days=round(months * 30.4))
+        self.days = [self.start + timedelta(days=n) for n in range((self.end - self.start).days + 1)]
+        self.now = datetime(self.end.year, self.end.month, self.end.day, CLOSE_SECONDS // 3600)
+        self.client_ids = []
+        self.seller_ids = []
+        self.skus = {item_type: [] for item_type in SKU_SHARES}
+        self.prices = {}
+        self.flower_names = {}
+        self.supplier_items = {}
+
+    def run(self):
+        steps = (
+            ('clients and users', self.generate_clients),
+            ('catalog', self.generate_catalog),
+            ('suppliers', self.generate_suppliers),
+            ('purchases and receipts', self.generate_purchases),
+            ('orders', self.generate_orders),
+            ('write-offs', self.generate_write_offs),
+            ('custom requests', self.generate_requests),
+            ('inventory', self.generate_inventory),
+        )
+        for title, step in steps:
+            started = time.perf_counter()
+            step()
+            self.writer.flush()
+            print(f"  {title}: {time.perf_counter() - started:.1f}s")
+
+    def person_name(self):
+        rng = self.rng
+        last = rng.choice(LAST_NAMES)
+        root = rng.choice(PATRONYMIC_ROOTS)
+        if rng.random() < 0.6:
+            return f"{last}а {rng.choice(FEMALE_NAMES)} {root}на"
+        return f"{last} {rng.choice(MALE_NAMES)} {root}ич"
+
+    def generate_clients(self):
+        rng = self.rng
+        registered_from = self.start - timedelta(days=365)
+        span = (self.now - datetime(registered_from.year, registered_from.month, registered_from.day)).total_seconds()
+        moments = sorted(rng.randrange(int(span)) for _ in range(self.counts['clients']))
+        first = datetime(registered_from.year, registered_from.month, registered_from.day)
+        for client_id, offset in enumerate(moments, start=1):
+            email = f"client{client_id}@{rng.choice(EMAIL_DOMAINS)}" if rng.random() < 0.7 else None
+            phone = f"+7-9{rng.randrange(10, 100)}-{rng.randrange(100, 1000)}-{rng.randrange(10, 100)}-{rng.randrange(10, 100)}"
+            self.writer.add('clients', (client_id, self.person_name(), phone, email, first + timedelta(seconds=offset)))
+            self.client_ids.append(client_id)
+
+        # Учётные записи как в seed_data: пароль совпадает с логином
+        user_id = 0
+        for username, role in [('seller', 'SELLER'), ('manager', 'MANAGER')] + [
+                (f'seller{n}', 'SELLER') for n in range(2, self.counts['sellers'] + 1)]:
+            user_id += 1
+            self.writer.add('users', (user_id, username, db.hash_password(username), role, None))
+            if role == 'SELLER':
+                self.seller_ids.append(user_id)
+        for client_id in self.client_ids:
+            if client_id <= 3 or rng.random() < CLIENT_ACCOUNT_SHARE:
+                user_id += 1
+                username = f'client{client_id}'
+                self.writer.add('users', (user_id, username, db.hash_password(username), 'CLIENT', client_id))
+
+    def varieties(self, count):
+        combos = [f'{word} {name}' for word in VARIETY_WORDS for name in VARIETY_NAMES]
+        self.rng.shuffle(combos)
+        result = combos[:count]
+        generation = 2
+        while len(result) < count:
+            result.extend(f'{combo} {generation}' for combo in combos[:count - len(result)])
+            generation += 1
+        return result
+
+    def generate_catalog(self):
+        rng = self.rng
+        total = self.counts['skus']
+        sizes = {item_type: max(1, round(total * share)) for item_type, share in SKU_SHARES.items()}
+
+        kinds = [(kind, weight) for kind, weight, _, _ in FLOWER_KINDS]
+        kind_info = {kind: (price_range, shelf_life) for kind, _, price_range, shelf_life in FLOWER_KINDS}
+        # Сортов меньше, чем цветов: один сорт встречается в нескольких цветах
+        varieties = self.varieties(max(1, int(sizes['FLOWER'] * 0.6)))
+        for flower_id in range(1, sizes['FLOWER'] + 1):
+            name = pick(rng, kinds)
+            (low, high), shelf_life = kind_info[name]
+            price = money(rng.uniform(low, high))
+            active = 0 if rng.random() < 0.05 else 1
+            self.writer.add('flowers', (flower_id, name, rng.choice(varieties), rng.choice(COLORS),
+                                        price, shelf_life, active))
+            self.flower_names[flower_id] = name
+            self.prices[('FLOWER', flower_id)] = price
+            if active:
+                self.skus['FLOWER'].append(flower_id)
+
+        flower_ids = list(self.flower_names)
+        for bouquet_id in range(1, sizes['BOUQUET'] + 1):
+            price = money(rng.uniform(1500, 12000))
+            active = 0 if rng.random() < 0.05 else 1
+            name = f'Букет "{rng.choice(BOUQUET_NAMES)}" №{bouquet_id}'
+            self.writer.add('bouquets', (bouquet_id, name, rng.choice(OCCASIONS), price, active))
+            for flower_id in rng.sample(flower_ids, min(len(flower_ids), rng.randint(2, 5))):
+                self.writer.add('bouquet_items', (bouquet_id, flower_id, rng.randint(1, 15)))
+            self.prices[('BOUQUET', bouquet_id)] = price
+            if active:
+                self.skus['BOUQUET'].append(bouquet_id)
+
+        for item_type, table, names, (low, high) in (('PACKAGING', 'packaging', PACKAGING_NAMES, (30, 300)),
+                                                     ('ACCESSORY', 'accessories', ACCESSORY_NAMES, (20, 1500))):
+            for item_id in range(1, sizes[item_type] + 1):
+                price = money(rng.uniform(low, high))
+                self.writer.add(table, (item_id, f'{rng.choice(names)} {rng.choice(SIZES)}', price))
+                self.prices[(item_type, item_id)] = price
+                self.skus[item_type].append(item_id)
+
+    def generate_suppliers(self):
+        rng = self.rng
+        purchasable = [('FLOWER', flower_id) for flower_id in self.flower_names] + [
+            (item_type, item_id) for item_type in ('PACKAGING', 'ACCESSORY') for item_id in self.skus[item_type]]
+        for supplier_id in range(1, self.counts['suppliers'] + 1):
+            name = f'{rng.choice(SUPPLIER_PREFIXES)} "{rng.choice(SUPPLIER_NAMES)}" {supplier_id}'
+            phone = f'+7-495-{rng.randrange(100, 1000)}-{rng.randrange(10, 100)}-{rng.randrange(10, 100)}'
+            self.writer.add('suppliers', (supplier_id, name, phone, f'sales{supplier_id}@supplier.ru'))
+            items = rng.sample(purchasable, max(1, int(len(purchasable) * rng.uniform(0.1, 0.4))))
+            items.sort()
+            offers = []
+            for item_type, item_id in items:
+                # Закупочная цена - 40-70% от розничной
+                price = money(self.prices[(item_type, item_id)] * rng.uniform(0.4, 0.7))
+                self.writer.add('supplier_prices', (supplier_id, item_type, item_id, price))
+                offers.append((item_type, item_id, price))
+            self.supplier_items[supplier_id] = offers
+
+    def seasonal_price(self, price, moment):
+        # Перед 14 февраля и 8 Марта цветы у поставщиков дорожают
+        if moment.month == 2 or (moment.month == 3 and moment.day <= 8):
+            price *= 1.4
+        return money(price * self.rng.uniform(0.9, 1.1))
+
+    def generate_purchases(self):
+        rng = self.rng
+        supplier_ids = list(self.supplier_items)
+        purchase_id = purchase_item_id = receipt_id = receipt_item_id = 0
+        # Закупки идут с опережением спроса на несколько дней
+        weight = lambda day: day_weight(day + timedelta(days=4))
+        for day, count in spread(self.counts['purchase_orders'], self.days, weight):
+            age = (self.end - day).days
+            statuses = PURCHASE_RECENT_STATUSES if age < OPEN_PURCHASE_DAYS else PURCHASE_OLD_STATUSES
+            for created_at in day_times(rng, day, count):
+                purchase_id += 1
+                supplier_id = skewed(rng, supplier_ids, 1.5)
+                status = pick(rng, statuses)
+                self.writer.add('purchase_orders', (purchase_id, supplier_id, created_at, status))
+                offers = self.supplier_items[supplier_id]
+                lines = []
+                for item_type, item_id, price in rng.sample(offers, min(len(offers), rng.randint(5, 20))):
+                    purchase_item_id += 1
+                    qty = rng.randrange(10, 510, 10) if item_type == 'FLOWER' else rng.randrange(5, 105, 5)
+                    self.writer.add('purchase_items', (purchase_item_id, purchase_id, item_type, item_id, qty, price))
+                    lines.append((item_type, item_id, qty, price))
+                if status != 'RECEIVED':
+                    continue
+                received_at = min(created_at + timedelta(days=rng.randint(1, 4), hours=rng.randint(0, 6)), self.now)
+                receipt_id += 1
+                self.writer.add('receipts', (receipt_id, purchase_id, received_at, None))
+                for item_type, item_id, qty, price in lines:
+                    receipt_item_id += 1
+                    # Иногда привозят меньше заказанного
+                    received = qty if rng.random() < 0.9 else max(1, int(qty * rng.uniform(0.7, 1.0)))
+                    self.writer.add('receipt_items', (receipt_item_id, receipt_id, item_type, item_id, received,
+                                                      self.seasonal_price(price, received_at)))
+                # Поставка без заявки: докупка на рынке
+                if rng.random() < 0.05:
+                    receipt_id += 1
+                    self.writer.add('receipts', (receipt_id, None, received_at, 'Докупка без заявки'))
+                    for _ in range(rng.randint(1, 4)):
+                        flower_id = skewed(rng, self.skus['FLOWER'])
+                        receipt_item_id += 1
+                        price = self.prices[('FLOWER', flower_id)] * 0.6
+                        self.writer.add('receipt_items', (receipt_item_id, receipt_id, 'FLOWER', flower_id,
+                                                          rng.randrange(10, 110, 10),
+                                                          self.seasonal_price(price, received_at)))
+
+    def generate_orders(self):
+        rng = self.rng
+        order_id = order_item_id = payment_id = 0
+        line_types = [item_type for item_type, _ in ORDER_LINE_TYPES if self.skus[item_type]]
+        line_weights = [weight for item_type, weight in ORDER_LINE_TYPES if self.skus[item_type]]
+        growth_from = self.start.toordinal()
+        growth_span = max(1, len(self.days))
+        # Оборот плавно растёт за период
+        weight = lambda day: day_weight(day) * (0.8 + 0.4 * (day.toordinal() - growth_from) / growth_span)
+        for day, count in spread(self.counts['orders'], self.days, weight):
+            age = (self.end - day).days
+            statuses = ORDER_RECENT_STATUSES if age < OPEN_ORDER_DAYS else ORDER_OLD_STATUSES
+            for created_at in day_times(rng, day, count):
+                order_id += 1
+                status = pick(rng, statuses)
+                discount = 0 if rng.random() < 0.8 else rng.choice((5, 10, 15))
+                total = 0.0
+                chosen = set()
+                for _ in range(rng.choices((1, 2, 3, 4), (35, 35, 20, 10))[0]):
+                    item_type = rng.choices(line_types, line_weights)[0]
+                    item_id = skewed(rng, self.skus[item_type])
+                    if (item_type, item_id) in chosen:
+                        continue
+                    chosen.add((item_type, item_id))
+                    qty = rng.randint(1, 25) if item_type == 'FLOWER' else rng.randint(1, 2)
+                    price = self.prices[(item_type, item_id)]
+                    line_sum = money(price * qty)
+                    total += line_sum
+                    order_item_id += 1
+                    self.writer.add('order_items', (order_item_id, order_id, item_type, item_id, qty, price, line_sum))
+                total = money(total * (1 - discount / 100))
+                self.writer.add('orders', (order_id, skewed(rng, self.client_ids, 1.5), rng.choice(self.seller_ids),
+                                           created_at, status, discount, total))
+                # Оплата переводит заказ в "Выдан"
+                if status == 'Выдан':
+                    payment_id += 1
+                    paid_at = min(created_at + timedelta(minutes=rng.randint(1, 240)), self.now)
+                    method = 'Карта' if rng.random() < 0.65 else 'Наличные'
+                    self.writer.add('payments', (payment_id, order_id, paid_at, method, total))
+
+    def generate_write_offs(self):
+        rng = self.rng
+        writeoff_id = 0
+        flowers = list(self.flower_names)
+        # Больше всего списывают через пару дней после пиков продаж
+        weight = lambda day: day_weight(day - timedelta(days=2))
+        for day, count in spread(self.counts['write_offs'], self.days, weight):
+            for created_at in day_times(rng, day, count):
+                writeoff_id += 1
+                self.writer.add('write_offs', (writeoff_id, 'FLOWER', skewed(rng, flowers, 1.5),
+                                               rng.randint(1, 10), pick(rng, WRITEOFF_REASONS), created_at))
+
+    def wishes(self):
+        rng = self.rng
+        parts = []
+        for template in rng.sample(WISH_TEMPLATES, rng.randint(1, 3)):
+            flower = self.flower_names[skewed(rng, self.skus['FLOWER'])].lower()
+            parts.append(template.format(flower=flower, color=rng.choice(COLORS).lower(),
+                                         budget=rng.randrange(2000, 20000, 500), hour=rng.randint(10, 20)))
+        return '. '.join(parts)
+
+    def generate_requests(self):
+        rng = self.rng
+        request_id = request_item_id = 0
+        for day, count in spread(self.counts['custom_requests'], self.days, day_weight):
+            for created_at in day_times(rng, day, count):
+                request_id += 1
+                desired = created_at.date() + timedelta(days=rng.randint(1, 14))
+                if desired < self.end:
+                    status = 'Собрана' if rng.random() < 0.8 else 'Отменена'
+                else:
+                    status = 'Новая' if rng.random() < 0.6 else 'В работе'
+                self.writer.add('custom_requests', (request_id, skewed(rng, self.client_ids, 1.5), desired,
+                                                    self.wishes(), status, created_at))
+                for flower_id in rng.sample(self.skus['FLOWER'], min(len(self.skus['FLOWER']), rng.randint(1, 4))):
+                    request_item_id += 1
+                    self.writer.add('custom_request_items', (request_item_id, request_id, flower_id,
+                                                             rng.randint(3, 51)))
+
+    def generate_inventory(self):
+        rng = self.rng
+        for item_type in SKU_SHARES:
+            for item_id in sorted(item_id for kind, item_id in self.prices if kind == item_type):
+                # Примерно десятая часть товаров закончилась
+                qty = 0 if rng.random() < 0.1 else rng.randint(1, 500 if item_type == 'FLOWER' else 50)
+                self.writer.add('inventory', (item_type, item_id, qty))
+
+
+def connect(local_infile=False):
+    return pymysql.connect(
+        host=DB_CONFIG['host'],
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        database=DB_CONFIG['database'],
+        port=DB_CONFIG['port'],
+        charset=DB_CONFIG['charset'],
+        cursorclass=DictCursor,
+        autocommit=False,
+        local_infile=local_infile
+    )
+
+
+def database_is_empty(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT (SELECT COUNT(*) FROM orders) + (SELECT COUNT(*) FROM clients) AS cnt")
+        return cursor.fetchone()['cnt'] == 0
+
+
+def reset_tables(conn):
+    with conn.cursor() as cursor:
+        for table in reversed(list(TABLE_COLUMNS)):
+            cursor.execute(f"TRUNCATE TABLE {table}")
+    conn.commit()
+
+
+def clear_derived_tables(conn):
+    # Сгенерированная история меняет закрытые месяцы, запомненные по старым данным
+    with conn.cursor() as cursor:
+        for table in DERIVED_TABLES:
+            cursor.execute(f"TRUNCATE TABLE {table}")
+    conn.commit()
+
+
+def analyze_tables(conn):
+    # Свежая статистика, чтобы планы запросов соответствовали новому объёму
+    with conn.cursor() as cursor:
+        cursor.execute(f"ANALYZE TABLE {', '.join(TABLE_COLUMNS)}")
+        cursor.fetchall()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Заполнение базы синтетическими данными')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='масштаб: 1 - около 10 тыс. клиентов и 1 млн заказов (по умолчанию 1)')
+    parser.add_argument('--seed', type=int, default=42, help='зерно генератора случайных чисел')
+    parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                        help='последний день истории, ГГГГ-ММ-ДД (по умолчанию сегодня)')
+    parser.add_argument('--months', type=int, default=24, help='длина истории в месяцах')
+    parser.add_argument('--method', choices=('insert', 'load'), default='insert',
+                        help='insert - многострочные INSERT, load - LOAD DATA LOCAL INFILE')
+    parser.add_argument('--batch', type=int, default=None, help='строк в одной пачке записи')
+    parser.add_argument('--reset', action='store_true', help='очистить все таблицы с данными перед загрузкой')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db.run_migrations()
+    db.save_schema_fingerprint()
+
+    conn = connect(local_infile=args.method == 'load')
+    try:
+        with conn.cursor() as cursor:
+            # Ключи и ссылки генератор выдаёт сам; проверки на каждую строку только замедляют загрузку
+            cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+        if args.reset:
+            reset_tables(conn)
+        elif not database_is_empty(conn):
+            print("Database already contains data; run with --reset to replace it")
+            return 1
+
+        counts = scaled_counts(args.scale)
+        print(f"Generating scale {args.scale}: " + ', '.join(f'{name}={count}' for name, count in counts.items()))
+        started = time.perf_counter()
+        writer = BulkWriter(conn, args.method, args.batch)
+        DataGenerator(writer, args.scale, args.seed, args.end_date, args.months).run()
+        clear_derived_tables(conn)
+        analyze_tables(conn)
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+
+    total = sum(writer.counts.values())
+    for table in TABLE_COLUMNS:
+        print(f"{table:22} {writer.counts.get(table, 0):>12,}")
+    print(f"{total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s, method={writer.method})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,18 @@
 import pymysql
 from pymysql.cursors import DictCursor
-from config import DB_CONFIG
+from pymysql.constants import SERVER_STATUS
+from config import DB_CONFIG, POOL_CONFIG, CACHE_CONFIG, STATS_CONFIG
+from contextlib import contextmanager
+from collections import deque, OrderedDict
 from datetime import datetime, timedelta
+from functools import lru_cache
 import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
 
 
 def get_connection():
@@ -18,55 +28,942 @@ def get_connection():
     )
 
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений с MySQL"""
+
+    def __init__(self, min_size=1, max_size=10, idle_timeout=300, acquire_timeout=10,
+                 connect=get_connection):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f'Invalid pool size: min={min_size}, max={max_size}')
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self._connect = connect
+        # Свободные соединения: (conn, время возврата); берём с конца, старые лежат в начале
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'borrowed': 0,
+            'returned': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'ping_failures': 0,
+            'expired': 0,
+        }
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            conn = self._create()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+
+    def _create(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _prune_locked(self):
+        # Закрываем соединения, простоявшие дольше idle_timeout, но не опускаемся ниже min_size
+        expired = []
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size:
+            conn, released_at = self._idle[0]
+            if now - released_at < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats['expired'] += 1
+            self._stats['closed'] += 1
+            expired.append(conn)
+        return expired
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError('Connection pool is closed')
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No free connection in pool after {self.acquire_timeout}s '
+                        f'(max_size={self.max_size})'
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.monotonic() - started
+            self._stats['borrowed'] += 1
+            expired = self._prune_locked()
+
+        for old in expired:
+            self._discard(old)
+
+        if conn is None:
+            return self._create()
+
+        # Проверяем, что соединение живо (сервер мог закрыть его по wait_timeout)
+        try:
+            conn.ping(reconnect=False)
+        except Exception:
+            with self._cond:
+                self._stats['ping_failures'] += 1
+                self._stats['closed'] += 1
+            self._discard(conn)
+            return self._create()
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard and conn.open:
+            try:
+                # Незакрытая транзакция держит старый снимок данных, сбрасываем её
+                if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if not conn.open:
+            discard = True
+
+        with self._cond:
+            self._stats['returned'] += 1
+            if discard or self._closed:
+                self._size -= 1
+                self._stats['closed'] += 1
+                to_close = [conn]
+            else:
+                self._idle.append((conn, time.monotonic()))
+                to_close = self._prune_locked()
+            self._cond.notify()
+
+        for old in to_close:
+            self._discard(old)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**POOL_CONFIG)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    if _pool is None:
+        return None
+    return _pool.stats()
+
+
+# Таблицы, которые читает запрос, и таблица, которую пишет оператор
+READ_TABLES_RE = re.compile(r'\b(?:FROM|JOIN)\s+`?([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+WRITE_TABLE_RE = re.compile(
+    r'^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE\s+(?:TABLE\s+)?'
+    r'|ALTER\s+TABLE|DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?)\s*`?([A-Za-z_][A-Za-z0-9_]*)',
+    re.IGNORECASE
+)
 
 
-def fetch_all(sql, params=None):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(sql, params)
-            return cursor.fetchall()
-    finally:
-        conn.close()
+def read_tables(sql):
+    return {name.lower() for name in READ_TABLES_RE.findall(sql)}
+
+
+def written_tables(sql):
+    match = WRITE_TABLE_RE.match(sql)
+    if not match:
+        return set()
+    tables = {match.group(1).lower()}
+    # UPDATE/DELETE с JOIN может менять любую из таблиц - сбрасываем все
+    if re.match(r'\s*(?:UPDATE|DELETE)\b', sql, re.IGNORECASE):
+        tables |= read_tables(sql)
+    return tables
+
+
+class ResultCache:
+    """LRU-кэш результатов запросов с TTL и сбросом по записи в таблицы.
+
+    У каждой таблицы есть счётчик версий, запись в таблицу его увеличивает. Запись кэша
+    хранит версии своих таблиц на момент начала запроса, поэтому результат, прочитанный
+    параллельно с записью, при следующем обращении считается устаревшим.
+    Записи из других процессов кэш не видит - их ограничивает только TTL, поэтому он
+    должен быть порядка секунд.
+    """
+
+    def __init__(self, max_entries=256, ttl=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'invalidations': 0}
+
+    def versions(self, tables):
+        with self._lock:
+            return tuple((table, self._versions.get(table, 0)) for table in sorted(tables))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires_at, versions, result = entry
+            if time.monotonic() > expires_at or any(self._versions.get(t, 0) != v for t, v in versions):
+                del self._entries[key]
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, versions, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, versions, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, tables):
+        if not tables:
+            return
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            stale = [key for key, (_, versions, _) in self._entries.items()
+                     if any(t in tables for t, _ in versions)]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += 1
+            listeners = list(self._listeners)
+        # Запись уже зафиксирована: ошибка слушателя не должна выглядеть как ошибка записи
+        for listener in listeners:
+            try:
+                listener(tables)
+            except Exception as e:
+                print(f"Cache invalidation listener {listener!r} failed: {e}")
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = ResultCache(**CACHE_CONFIG)
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def add_invalidation_listener(listener):
+    """listener(tables) вызывается после фиксации записи в таблицы из этого процесса"""
+    _cache.add_listener(listener)
+
+
+def remove_invalidation_listener(listener):
+    _cache.remove_listener(listener)
+
+
+def invalidate_tables(tables):
+    _cache.invalidate({table.lower() for table in tables})
+
+
+def _cached_fetch(sql, params, fetch):
+    key = (sql, params if params is None else tuple(params))
+    entry = _cache.get(key)
+    if entry is not None:
+        return entry[2]
+    # Версии берём до запроса: запись, прошедшая во время чтения, сделает результат устаревшим
+    versions = _cache.versions(read_tables(sql))
+    result = fetch(sql, params)
+    _cache.put(key, versions, result)
+    return result
+
+
+class TrackedCursor:
+    """Курсор транзакции, запоминающий таблицы, в которые шла запись"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.written = set()
+
+    def execute(self, sql, params=None):
+        self.written |= written_tables(sql)
+        return self._cursor.execute(sql, params)
+
+    def executemany(self, sql, params_list):
+        self.written |= written_tables(sql)
+        return self._cursor.executemany(sql, params_list)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# Нормализация SQL: литералы и списки параметров заменяются метками, чтобы один оператор
+# с разными значениями попадал в одну строку статистики
+SQL_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+SQL_NUMBER_RE = re.compile(r'(?<![\w.])\d+(?:\.\d+)?\b')
+SQL_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SQL_ROWS_RE = re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+')
+SQL_UNION_RE = re.compile(r'(?:\s+UNION ALL SELECT \?(?:\s*,\s*\?)*)+', re.IGNORECASE)
 
+# Верхние границы корзин гистограммы времени выполнения, мс
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
 
-def fetch_one(sql, params=None):
-    conn = get_connection()
+# Модули, через которые запрос проходит к БД; вызывающим считается первый кадр вне их
+INFRASTRUCTURE_FILES = {'db.py', 'ui_async.py', 'contextlib.py', 'threading.py'}
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    text = SQL_STRING_RE.sub('?', sql)
+    text = text.replace('%s', '?')
+    text = SQL_NUMBER_RE.sub('?', text)
+    text = ' '.join(text.split())
+    text = SQL_LIST_RE.sub('(?+)', text)
+    text = SQL_ROWS_RE.sub('(?+), ...', text)
+    text = SQL_UNION_RE.sub(' UNION ALL SELECT ...', text)
+    return text
+
+
+def caller_label():
+    """Метод окна (модуль.Класс.метод), из которого пришёл запрос"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if filename not in INFRASTRUCTURE_FILES:
+            return f"{filename[:-3] if filename.endswith('.py') else filename}.{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+    return None
+
+
+_query_origin = threading.local()
+
+
+@contextmanager
+def query_context(caller, task=None):
+    """Помечает запросы текущего потока вызывающим методом окна.
+
+    Нужен в рабочих потоках: там на стеке нет метода окна, отправившего запрос.
+    """
+    previous = getattr(_query_origin, 'value', None)
+    _query_origin.value = (caller, task)
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(sql, params)
-            return cursor.fetchone()
+        yield
     finally:
-        conn.close()
+        _query_origin.value = previous
+
+
+def current_origin():
+    origin = getattr(_query_origin, 'value', None)
+    if origin is not None:
+        return origin
+    return caller_label(), None
+
+
+class QueryStats:
+    """Статистика по нормализованным операторам и журнал медленных запросов.
+
+    По каждому оператору считаются вызовы, ошибки, время (сумма, максимум, гистограмма),
+    строки и ожидание соединения из пула. Запросы дольше slow_query_ms пишутся
+    в slow_log строкой JSON вместе с методом окна, который их вызвал.
+    """
+
+    def __init__(self, enabled=True, slow_query_ms=200, slow_log=None, report_path=None):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.slow_log = slow_log
+        self.report_path = report_path
+        self._statements = {}
+        self._slow_count = 0
+        self._started_at = datetime.now()
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def record(self, sql, elapsed, rows=0, wait=0.0, error=None):
+        if not self.enabled:
+            return
+        key = normalize_sql(sql)
+        elapsed_ms = elapsed * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound),
+                      len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            stat = self._statements.get(key)
+            if stat is None:
+                stat = self._statements[key] = {
+                    'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                    'wait_ms': 0.0, 'slow': 0, 'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            stat['calls'] += 1
+            stat['total_ms'] += elapsed_ms
+            stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+            stat['rows'] += max(rows, 0)
+            stat['wait_ms'] += wait * 1000
+            stat['histogram'][bucket] += 1
+            if error is not None:
+                stat['errors'] += 1
+            slow = self.slow_query_ms is not None and elapsed_ms >= self.slow_query_ms
+            if slow:
+                stat['slow'] += 1
+                self._slow_count += 1
+        if slow:
+            self._log_slow(sql, key, elapsed_ms, rows, wait, error)
+
+    def _log_slow(self, sql, key, elapsed_ms, rows, wait, error):
+        if not self.slow_log:
+            return
+        caller, task = current_origin()
+        entry = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'duration_ms': round(elapsed_ms, 2),
+            'wait_ms': round(wait * 1000, 2),
+            'rows': rows,
+            'caller': caller,
+            'task': task,
+            'thread': threading.current_thread().name,
+            'statement': key,
+            'sql': ' '.join(sql.split())[:2000],
+            'error': str(error) if error is not None else None,
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        try:
+            with self._log_lock:
+                with open(self.slow_log, 'a', encoding='utf-8') as log:
+                    log.write(line + '\n')
+        except OSError as e:
+            print(f"Could not write slow query log: {e}")
+
+    def totals(self):
+        """(операторов, строк) с начала сбора - для замера одной операции по разнице"""
+        with self._lock:
+            return (sum(stat['calls'] for stat in self._statements.values()),
+                    sum(stat['rows'] for stat in self._statements.values()))
+
+    def report(self):
+        with self._lock:
+            statements = {key: dict(stat, histogram=list(stat['histogram']))
+                          for key, stat in self._statements.items()}
+            slow_count = self._slow_count
+        bounds = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        rows = []
+        for key, stat in statements.items():
+            stat['avg_ms'] = stat['total_ms'] / stat['calls']
+            stat['histogram'] = dict(zip(bounds, stat['histogram']))
+            for field in ('total_ms', 'max_ms', 'avg_ms', 'wait_ms'):
+                stat[field] = round(stat[field], 3)
+            rows.append(dict(statement=key, **stat))
+        rows.sort(key=lambda stat: stat['total_ms'], reverse=True)
+        return {
+            'started_at': self._started_at.isoformat(timespec='seconds'),
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'slow_query_ms': self.slow_query_ms,
+            'slow_queries': slow_count,
+            'statements': rows,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow_count = 0
+            self._started_at = datetime.now()
+
+
+_stats = QueryStats(**STATS_CONFIG)
+
+
+def query_stats():
+    return _stats
+
+
+def query_report():
+    """Статистика запросов вместе с состоянием пула и кэша"""
+    report = _stats.report()
+    report['pool'] = pool_stats()
+    report['cache'] = cache_stats()
+    return report
+
+
+def dump_query_report(path=None):
+    path = path or _stats.report_path
+    with open(path, 'w', encoding='utf-8') as report_file:
+        json.dump(query_report(), report_file, ensure_ascii=False, indent=2)
+    return path
+
+
+class TimedCursor:
+    """Курсор, отдающий время каждого оператора в статистику запросов.
+
+    Ожидание соединения из пула приписывается первому оператору на этом соединении.
+    """
+
+    def __init__(self, cursor, wait=0.0):
+        self._cursor = cursor
+        self._wait = wait
+
+    def _timed(self, sql, call):
+        wait, self._wait = self._wait, 0.0
+        started = time.perf_counter()
+        try:
+            result = call()
+        except Exception as e:
+            _stats.record(sql, time.perf_counter() - started, 0, wait, e)
+            raise
+        _stats.record(sql, time.perf_counter() - started, self._cursor.rowcount, wait)
+        return result
+
+    def execute(self, sql, params=None):
+        return self._timed(sql, lambda: self._cursor.execute(sql, params))
+
+    def executemany(self, sql, params_list):
+        return self._timed(sql, lambda: self._cursor.executemany(sql, params_list))
+
+    def callproc(self, procname, args=()):
+        return self._timed(f'CALL {procname}', lambda: self._cursor.callproc(procname, args))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@contextmanager
+def _timed_cursor():
+    """Соединение из пула и курсор с замером; отдаёт (conn, cursor)"""
+    started = time.perf_counter()
+    with get_pool().connection() as conn:
+        wait = time.perf_counter() - started
+        with conn.cursor() as cursor:
+            yield conn, TimedCursor(cursor, wait)
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def _fetch_all(sql, params=None):
+    with _timed_cursor() as (conn, cursor):
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _fetch_one(sql, params=None):
+    with _timed_cursor() as (conn, cursor):
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def fetch_all(sql, params=None, cached=False):
+    # cached=True - для редко меняющихся справочных запросов; вызывающий получает свою копию строк
+    if not cached:
+        return _fetch_all(sql, params)
+    return [dict(row) for row in _cached_fetch(sql, params, _fetch_all)]
+
+
+def fetch_one(sql, params=None, cached=False):
+    if not cached:
+        return _fetch_one(sql, params)
+    row = _cached_fetch(sql, params, _fetch_one)
+    return dict(row) if row is not None else None
+
+
+def call_procedure(name, args=()):
+    """Вызывает хранимую процедуру на соединении из пула и возвращает её первый набор строк"""
+    with _timed_cursor() as (conn, cursor):
+        cursor.callproc(name, args)
+        return cursor.fetchall()
+
+
+# Размер страницы для длинных списков в окнах
+PAGE_SIZE = 500
+
+
+def page_query(sql, params=None, key='id', token=None, limit=PAGE_SIZE, descending=True):
+    """Запрос страницы для fetch_page: (sql, params) с подставленным условием {page}, ORDER BY и LIMIT"""
+    args = tuple(params or ())
+    if token is None:
+        condition = 'TRUE'
+    else:
+        condition = f"{key} {'<' if descending else '>'} %s"
+        args += (token,)
+    return f"{sql.format(page=condition)} ORDER BY {key} {'DESC' if descending else 'ASC'} LIMIT %s", args + (limit,)
+
+
+def fetch_page(sql, params=None, key='id', token=None, page_size=PAGE_SIZE, descending=True):
+    """Страница списка по ключу (keyset): WHERE key < token ORDER BY key DESC LIMIT n.
+
+    sql - запрос без ORDER BY с меткой {page} в WHERE, например
+    "SELECT ... FROM orders o WHERE o.client_id = %s AND {page}"; метка должна стоять
+    после остальных параметров. Возвращает (rows, next_token), next_token None на последней странице.
+    В отличие от OFFSET время страницы не растёт с глубиной прокрутки.
+    """
+    page_sql, args = page_query(sql, params, key, token, page_size + 1, descending)
+    # Лишняя строка в LIMIT показывает, есть ли продолжение, без COUNT(*)
+    rows = fetch_all(page_sql, args)
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, rows[-1][key.split('.')[-1]]
+    return rows, None
 
 
 def execute(sql, params=None):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cursor:
+    with _timed_cursor() as (conn, cursor):
+        try:
             cursor.execute(sql, params)
             conn.commit()
-            return cursor.lastrowid
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-
-def executemany(sql, params_list):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cursor:
+            lastrowid = cursor.lastrowid
+        except Exception as e:
+            conn.rollback()
+            raise e
+    invalidate_tables(written_tables(sql))
+    return lastrowid
+
+
+def executemany(sql, params_list, cursor=None):
+    # Внутри db.transaction() пакет пишется курсором транзакции без отдельного COMMIT
+    if cursor is not None:
+        cursor.executemany(sql, params_list)
+        return
+    with _timed_cursor() as (conn, cursor):
+        try:
             cursor.executemany(sql, params_list)
             conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        except Exception as e:
+            conn.rollback()
+            raise e
+    invalidate_tables(written_tables(sql))
+
+
+@contextmanager
+def transaction():
+    """Единица работы: все операторы идут через один курсор и фиксируются одним COMMIT"""
+    with _timed_cursor() as (conn, cursor):
+        tracked = TrackedCursor(cursor)
+        try:
+            yield tracked
+            conn.commit()
+        except Exception:
+            if conn.open:
+                conn.rollback()
+            raise
+    # Кэш сбрасываем только после COMMIT (до него другие соединения видят старые данные)
+    # и вне обработчика ошибок: зафиксированная запись не должна откатываться и повторяться
+    invalidate_tables(tracked.written)
+
+
+def values_table(columns, rows):
+    """Строит производную таблицу из строк Python: (SELECT %s AS a, %s AS b UNION ALL SELECT %s, %s ...)"""
+    first = 'SELECT ' + ', '.join(f'%s AS {column}' for column in columns)
+    other = 'SELECT ' + ', '.join(['%s'] * len(columns))
+    sql = ' UNION ALL '.join([first] + [other] * (len(rows) - 1))
+    params = [value for row in rows for value in row]
+    return sql, params
+
+
+# Порядок значений ENUM item_type в индексе unique_item; строки inventory блокируем в этом же порядке
+ITEM_TYPE_ORDER = {'FLOWER': 1, 'BOUQUET': 2, 'PACKAGING': 3, 'ACCESSORY': 4}
+
+
+def _lock_order(key):
+    item_type, item_id = key
+    return ITEM_TYPE_ORDER.get(item_type, len(ITEM_TYPE_ORDER) + 1), item_id
+
+
+class StockShortage(Exception):
+    """Не хватает остатков; shortfalls: [{'item_type', 'item_id', 'requested', 'available'}]"""
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__('Insufficient stock: ' + ', '.join(
+            f"{s['item_type']}#{s['item_id']} requested {s['requested']}, available {s['available']}"
+            for s in shortfalls
+        ))
+
+
+def adjust_stock(cursor, deltas):
+    """Меняет остатки в обе стороны: deltas = {(item_type, item_id): изменение количества}.
+
+    Все строки inventory блокируются один раз одним SELECT ... FOR UPDATE в порядке ключа
+    unique_item, поэтому параллельные терминалы не блокируют друг друга крест-накрест, даже
+    если одна транзакция и возвращает, и резервирует товар. Уменьшения проверяются по
+    заблокированным остаткам, затем все изменения применяются одним UPDATE с условием,
+    что остаток не уйдёт в минус. При нехватке бросает StockShortage только по позициям,
+    которым не хватило; откат делает db.transaction(). Позиции без строки inventory
+    при увеличении пропускаются. Вызывайте последним оператором транзакции, чтобы
+    блокировки строк держались как можно меньше.
+    """
+    keys = sorted((key for key, delta in deltas.items() if delta), key=_lock_order)
+    if not keys:
+        return
+    stock = _lock_stock(cursor, keys)
+
+    def shortfall(key, available):
+        return {'item_type': key[0], 'item_id': key[1], 'requested': -deltas[key], 'available': available}
+
+    shortfalls = [shortfall(key, stock.get(key, 0)) for key in keys
+                  if deltas[key] < 0 and stock.get(key, 0) < -deltas[key]]
+    if shortfalls:
+        raise StockShortage(shortfalls)
+
+    present = [key for key in keys if key in stock]
+    if not present:
+        return
+    derived, params = values_table(('item_type', 'item_id', 'delta'), [(*key, deltas[key]) for key in present])
+    cursor.execute(f"""
+        UPDATE inventory inv
+        JOIN ({derived}) AS d ON inv.item_type = d.item_type AND inv.item_id = d.item_id
+        SET inv.qty = inv.qty + d.delta
+        WHERE inv.qty + d.delta >= 0
+    """, params)
+    if cursor.rowcount != len(present):
+        # Строки заблокированы нами, поэтому не изменилась только та, что не прошла условие
+        current = _lock_stock(cursor, present)
+        failed = [shortfall(key, current[key]) for key in present
+                  if deltas[key] < 0 and current.get(key) == stock[key]]
+        if failed:
+            raise StockShortage(failed)
+
+
+def _lock_stock(cursor, keys):
+    cursor.execute(
+        "SELECT item_type, item_id, qty FROM inventory WHERE (item_type, item_id) IN ("
+        + ', '.join(['(%s, %s)'] * len(keys)) + ") ORDER BY item_type, item_id FOR UPDATE",
+        [value for key in keys for value in key]
+    )
+    return {(row['item_type'], row['item_id']): row['qty'] for row in cursor.fetchall()}
+
+
+def reserve_stock(cursor, requested):
+    """Списывает остатки под заказ: requested = {(item_type, item_id): количество}; см. adjust_stock"""
+    adjust_stock(cursor, {key: -qty for key, qty in requested.items() if qty > 0})
+
+
+# Продаваемые типы товаров для каталога; filters - по каким колонкам у типа есть текстовый фильтр
+CATALOG_SOURCES = {
+    'FLOWER': {'table': 'flowers', 'id': 'flower_id', 'price': 'price', 'attr': 'color',
+               'active': True, 'filters': {'color': 'color'}, 'search': ('name', 'variety', 'color')},
+    'BOUQUET': {'table': 'bouquets', 'id': 'bouquet_id', 'price': 'base_price', 'attr': 'occasion',
+                'active': True, 'filters': {'occasion': 'occasion'}, 'search': ('name', 'occasion')},
+    'PACKAGING': {'table': 'packaging', 'id': 'packaging_id', 'price': 'price', 'attr': None,
+                  'active': False, 'filters': {}, 'search': None},
+    'ACCESSORY': {'table': 'accessories', 'id': 'accessory_id', 'price': 'price', 'attr': None,
+                  'active': False, 'filters': {}, 'search': None},
+}
+
+
+def build_catalog_query(name=None, color=None, occasion=None, price_from=0, price_to=0,
+                        item_types=('FLOWER', 'BOUQUET'), in_stock_only=False):
+    """Один UNION ALL по всем запрошенным типам товаров с остатками.
+
+    Фильтр по цвету действует только на цветы, по поводу - только на букеты;
+    остальные типы по этим фильтрам не отсекаются. Возвращает (sql, params) или (None, ()).
+    """
+    parts = []
+    params = []
+    text_filters = {'color': color, 'occasion': occasion}
+    for item_type in item_types:
+        source = CATALOG_SOURCES[item_type]
+        attr = f"COALESCE(t.{source['attr']}, '')" if source['attr'] else "''"
+        conditions = []
+        if source['active']:
+            conditions.append("t.is_active = 1")
+        if name:
+            conditions.append("t.name LIKE %s")
+            params.append(f'%{name}%')
+        for filter_name, column in source['filters'].items():
+            if text_filters[filter_name]:
+                conditions.append(f"t.{column} LIKE %s")
+                params.append(f'%{text_filters[filter_name]}%')
+        if price_from > 0:
+            conditions.append(f"t.{source['price']} >= %s")
+            params.append(price_from)
+        if price_to > 0:
+            conditions.append(f"t.{source['price']} <= %s")
+            params.append(price_to)
+        if in_stock_only:
+            conditions.append("COALESCE(i.qty, 0) > 0")
+        sql = f"""SELECT '{item_type}' AS item_type, t.{source['id']} AS item_id, t.name, {attr} AS attr,
+                  t.{source['price']} AS price, COALESCE(i.qty, 0) AS stock
+           FROM {source['table']} t
+           LEFT JOIN inventory i ON i.item_type = '{item_type}' AND i.item_id = t.{source['id']}"""
+        if conditions:
+            sql += "\n           WHERE " + " AND ".join(conditions)
+        parts.append(sql)
+    if not parts:
+        return None, ()
+    return "\nUNION ALL\n".join(parts), tuple(params)
+
+
+def fetch_catalog(**filters):
+    # Все типы товаров одним запросом и одним соединением
+    sql, params = build_catalog_query(**filters)
+    if sql is None:
+        return []
+    return fetch_all(sql, params or None)
+
+
+# Слова короче ngram_token_size (по умолчанию 2) не попадают в FULLTEXT индекс
+NGRAM_TOKEN_SIZE = 2
+SEARCH_LIMIT = 100
+
+
+def search_terms(text):
+    return [word for word in re.split(r'\W+', text.lower()) if word]
+
+
+def _search_condition(columns, terms):
+    """Условие и выражение релевантности для поиска по колонкам: (where, score, params).
+
+    Все слова должны встретиться (+"слово" в BOOLEAN MODE ищет последовательность n-грамм,
+    то есть подстроку). Если какое-то слово короче n-граммы, индекс его не найдёт -
+    тогда поиск идёт через LIKE, а релевантность - совпадение с начала первой колонки.
+    """
+    if all(len(term) >= NGRAM_TOKEN_SIZE for term in terms):
+        match = f"MATCH({', '.join(columns)}) AGAINST (%s IN BOOLEAN MODE)"
+        query = ' '.join(f'+"{term}"' for term in terms)
+        return match, match, [query], [query]
+    text = f"CONCAT_WS(' ', {', '.join(columns)})"
+    where = ' AND '.join(f"{text} LIKE %s" for _ in terms)
+    return where, f"({columns[0]} LIKE %s)", [f'%{term}%' for term in terms], [f'{terms[0]}%']
+
+
+def search_catalog(text, item_types=('FLOWER', 'BOUQUET'), limit=SEARCH_LIMIT):
+    """Ранжированный поиск по каталогу; строки как у fetch_catalog плюс score"""
+    terms = search_terms(text)
+    if not terms:
+        return []
+    parts = []
+    params = []
+    for item_type in item_types:
+        source = CATALOG_SOURCES[item_type]
+        if not source['search']:
+            continue
+        columns = [f't.{column}' for column in source['search']]
+        where, score, where_params, score_params = _search_condition(columns, terms)
+        attr = f"COALESCE(t.{source['attr']}, '')" if source['attr'] else "''"
+        parts.append(
+            f"""SELECT '{item_type}' AS item_type, t.{source['id']} AS item_id, t.name, {attr} AS attr,
+                  t.{source['price']} AS price, COALESCE(i.qty, 0) AS stock, {score} AS score
+           FROM {source['table']} t
+           LEFT JOIN inventory i ON i.item_type = '{item_type}' AND i.item_id = t.{source['id']}
+           WHERE {where}{' AND t.is_active = 1' if source['active'] else ''}"""
+        )
+        params += score_params + where_params
+    if not parts:
+        return []
+    sql = "\nUNION ALL\n".join(parts) + "\nORDER BY score DESC, name LIMIT %s"
+    return fetch_all(sql, tuple(params) + (limit,))
+
+
+def search_requests(text, limit=SEARCH_LIMIT):
+    """Ранжированный поиск заявок на букет по пожеланиям"""
+    terms = search_terms(text)
+    if not terms:
+        return []
+    where, score, where_params, score_params = _search_condition(['r.wishes'], terms)
+    return fetch_all(
+        f"""SELECT r.request_id, c.full_name, r.desired_date, r.status, r.wishes, {score} AS score
+            FROM custom_requests r
+            JOIN clients c ON r.client_id = c.client_id
+            WHERE {where}
+            ORDER BY score DESC, r.request_id DESC
+            LIMIT %s""",
+        tuple(score_params + where_params) + (limit,)
+    )
 
 
 def create_database_if_not_exists():
@@ -103,24 +1000,24 @@ def run_migrations():
                     applied_at DATETIME NOT NULL
                 )
             """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_state (
+                    id TINYINT PRIMARY KEY,
+                    version VARCHAR(50) NOT NULL DEFAULT '',
+                    fingerprint CHAR(64) NOT NULL,
+                    updated_at DATETIME NOT NULL
+                )
+            """)
+            # Таблица могла быть создана сборкой, ещё не хранившей версию схемы
+            cursor.execute("SHOW COLUMNS FROM schema_state LIKE 'version'")
+            if not cursor.fetchall():
+                cursor.execute("ALTER TABLE schema_state ADD COLUMN version VARCHAR(50) NOT NULL DEFAULT '' AFTER id")
             conn.commit()
 
             cursor.execute("SELECT version FROM schema_migrations")
             applied = {row['version'] for row in cursor.fetchall()}
 
-            migrations = [
-                ('001_create_users_clients', MIGRATION_001, None),
-                ('002_catalog', MIGRATION_002, None),
-                ('003_inventory', MIGRATION_003, None),
-                ('004_suppliers_purchase', MIGRATION_004, None),
-                ('005_orders_payments', MIGRATION_005, None),
-                ('006_custom_requests', MIGRATION_006, None),
-                ('007_writeoffs', MIGRATION_007, None),
-                ('008_procedure_avg_price', MIGRATION_008, MIGRATION_008_CREATE),
-                ('009_function_writeoff_percent', MIGRATION_009, MIGRATION_009_CREATE),
-            ]
-
-            for migration_item in migrations:
+            for migration_item in MIGRATIONS:
                 if len(migration_item) == 3:
                     version, sql, create_sql = migration_item
                 else:
@@ -351,6 +1248,31 @@ CREATE TABLE IF NOT EXISTS write_offs (
 );
 """
 
+# Запросы тел процедуры и функции отчётов; их же проверяет check_index_usage.
+# Параметры подставляются именами переменных процедуры или %s
+AVG_FLOWER_PRICE_SQL = """SELECT COALESCE(AVG(ri.buy_price), 0) AS avg_price
+    FROM receipt_items ri
+    INNER JOIN flowers f ON ri.item_id = f.flower_id AND ri.item_type = 'FLOWER'
+    INNER JOIN receipts r ON ri.receipt_id = r.receipt_id
+    WHERE f.name = {name}
+      AND r.received_at >= {start}
+      AND r.received_at < {end}"""
+
+WRITEOFF_QTY_SQL = """SELECT COALESCE(SUM(wo.qty), 0){into}
+    FROM write_offs wo
+    INNER JOIN flowers f ON wo.item_id = f.flower_id
+    WHERE f.variety = {variety}
+      AND wo.created_at >= DATE_SUB(NOW(), INTERVAL 3 MONTH)"""
+
+SOLD_QTY_SQL = """SELECT COALESCE(SUM(oi.qty), 0){into}
+    FROM order_items oi
+    INNER JOIN orders o ON oi.order_id = o.order_id
+    INNER JOIN flowers f ON oi.item_id = f.flower_id
+    WHERE f.variety = {variety}
+      AND oi.item_type = 'FLOWER'
+      AND o.status != 'Отменен'
+      AND o.created_at >= DATE_SUB(NOW(), INTERVAL 3 MONTH)"""
+
 MIGRATION_008 = """DROP PROCEDURE IF EXISTS get_avg_flower_price"""
 MIGRATION_008_CREATE = """
 CREATE PROCEDURE get_avg_flower_price(
@@ -371,13 +1293,7 @@ BEGIN
         SET end_date = DATE_ADD(start_date, INTERVAL 1 YEAR);
     END IF;
     
-    SELECT COALESCE(AVG(ri.buy_price), 0) AS avg_price
-    FROM receipt_items ri
-    INNER JOIN flowers f ON ri.item_id = f.flower_id AND ri.item_type = 'FLOWER'
-    INNER JOIN receipts r ON ri.receipt_id = r.receipt_id
-    WHERE f.name = p_name
-      AND r.received_at >= start_date
-      AND r.received_at < end_date;
+    """ + AVG_FLOWER_PRICE_SQL.format(name='p_name', start='start_date', end='end_date') + """;
 END;
 """
 
@@ -393,20 +1309,9 @@ BEGIN
     DECLARE total_qty INT DEFAULT 0;
     DECLARE result DECIMAL(5,2) DEFAULT 0;
     
-    SELECT COALESCE(SUM(wo.qty), 0) INTO writeoff_qty
-    FROM write_offs wo
-    INNER JOIN flowers f ON wo.item_id = f.flower_id
-    WHERE f.variety = p_variety
-      AND wo.created_at >= DATE_SUB(NOW(), INTERVAL 3 MONTH);
+    """ + WRITEOFF_QTY_SQL.format(into=' INTO writeoff_qty', variety='p_variety') + """;
     
-    SELECT COALESCE(SUM(oi.qty), 0) INTO sold_qty
-    FROM order_items oi
-    INNER JOIN orders o ON oi.order_id = o.order_id
-    INNER JOIN flowers f ON oi.item_id = f.flower_id
-    WHERE f.variety = p_variety
-      AND oi.item_type = 'FLOWER'
-      AND o.status != 'Отменен'
-      AND o.created_at >= DATE_SUB(NOW(), INTERVAL 3 MONTH);
+    """ + SOLD_QTY_SQL.format(into=' INTO sold_qty', variety='p_variety') + """;
     
     SET total_qty = writeoff_qty + sold_qty;
     
@@ -418,6 +1323,202 @@ BEGIN
 END;
 """
 
+MIGRATION_010 = """
+ALTER TABLE orders
+    ADD INDEX idx_orders_status_id (status, order_id),
+    ADD INDEX idx_orders_client_id (client_id, order_id),
+    ADD INDEX idx_orders_created_status (created_at, status);
+
+ALTER TABLE order_items
+    ADD INDEX idx_order_items_item (item_type, item_id, order_id, qty);
+
+ALTER TABLE write_offs
+    ADD INDEX idx_write_offs_item_created (item_id, created_at, qty),
+    ADD INDEX idx_write_offs_created (created_at);
+
+ALTER TABLE receipts
+    ADD INDEX idx_receipts_received_at (received_at);
+
+ALTER TABLE receipt_items
+    ADD INDEX idx_receipt_items_item (item_type, item_id, receipt_id, buy_price);
+
+ALTER TABLE flowers
+    ADD INDEX idx_flowers_name_variety (name, variety),
+    ADD INDEX idx_flowers_variety (variety);
+"""
+
+# Полнотекстовый поиск; парсер ngram режет текст на n-граммы и работает с кириллицей без словаря
+MIGRATION_011 = """
+ALTER TABLE flowers
+    ADD FULLTEXT INDEX ft_flowers_search (name, variety, color) WITH PARSER ngram;
+
+ALTER TABLE bouquets
+    ADD FULLTEXT INDEX ft_bouquets_search (name, occasion) WITH PARSER ngram;
+
+ALTER TABLE custom_requests
+    ADD FULLTEXT INDEX ft_custom_requests_wishes (wishes) WITH PARSER ngram;
+"""
+
+# Суммы закупочных цен цветков по закрытым месяцам: месяц после закрытия не меняется,
+# поэтому ряды средних цен читают его отсюда, а не из приходов
+MIGRATION_012 = """
+CREATE TABLE IF NOT EXISTS flower_price_months (
+    flower_name VARCHAR(100) NOT NULL,
+    month DATE NOT NULL,
+    price_sum DECIMAL(14,2) NOT NULL,
+    samples INT NOT NULL,
+    computed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (flower_name, month)
+);
+"""
+
+MIGRATIONS = [
+    ('001_create_users_clients', MIGRATION_001, None),
+    ('002_catalog', MIGRATION_002, None),
+    ('003_inventory', MIGRATION_003, None),
+    ('004_suppliers_purchase', MIGRATION_004, None),
+    ('005_orders_payments', MIGRATION_005, None),
+    ('006_custom_requests', MIGRATION_006, None),
+    ('007_writeoffs', MIGRATION_007, None),
+    ('008_procedure_avg_price', MIGRATION_008, MIGRATION_008_CREATE),
+    ('009_function_writeoff_percent', MIGRATION_009, MIGRATION_009_CREATE),
+    ('010_hot_path_indexes', MIGRATION_010, None),
+    ('011_fulltext_search', MIGRATION_011, None),
+    ('012_flower_price_months', MIGRATION_012, None),
+]
+
+
+def schema_fingerprint():
+    # Меняется при добавлении миграции или правке её SQL
+    digest = hashlib.sha256()
+    for version, sql, create_sql in MIGRATIONS:
+        for part in (version, sql, create_sql or ''):
+            digest.update(part.encode())
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# Последняя миграция этой сборки. Номера миграций дополнены нулями, поэтому версии
+# сравниваются как строки и в Python, и в SQL
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_is_current():
+    """Быстрая проверка при запуске: один запрос вместо прохода по миграциям и наполнению.
+
+    Схему, которую довела до более новой версии другая сборка, старая сборка не трогает.
+    """
+    try:
+        row = fetch_one("SELECT version, fingerprint FROM schema_state WHERE id = 1")
+    except pymysql.err.MySQLError:
+        # Нет базы, таблицы schema_state или столбца version - нужна полная инициализация
+        return False
+    if row is None:
+        return False
+    if row['version'] != SCHEMA_VERSION:
+        return row['version'] > SCHEMA_VERSION
+    return row['fingerprint'] == schema_fingerprint()
+
+
+def save_schema_fingerprint():
+    # Версия только растёт: сборка со старым набором миграций не перезаписывает более новую
+    execute(
+        """INSERT IGNORE INTO schema_state (id, version, fingerprint, updated_at) VALUES (1, %s, %s, NOW())""",
+        (SCHEMA_VERSION, schema_fingerprint())
+    )
+    execute(
+        """UPDATE schema_state SET version = %s, fingerprint = %s, updated_at = NOW()
+           WHERE id = 1 AND version <= %s""",
+        (SCHEMA_VERSION, schema_fingerprint(), SCHEMA_VERSION)
+    )
+
+
+def prepare_database():
+    if schema_is_current():
+        return False
+    run_migrations()
+    seed_data()
+    save_schema_fingerprint()
+    return True
+
+
+# Списки заказов в окнах (запросы для fetch_page с меткой {page}); по ним же проверяются индексы
+SELLER_ORDERS_SQL = """
+    SELECT o.order_id, c.full_name, o.status, o.total_sum,
+           (SELECT COUNT(*) FROM payments p WHERE p.order_id = o.order_id) > 0 as is_paid
+    FROM orders o 
+    JOIN clients c ON o.client_id = c.client_id 
+    WHERE o.status IN ('Принят', 'В сборке', 'Готов') AND {page}
+"""
+
+CLIENT_ORDERS_SQL = """
+    SELECT o.order_id, o.created_at, o.status, o.total_sum,
+           (SELECT COUNT(*) FROM payments p WHERE p.order_id = o.order_id) > 0 as is_paid
+    FROM orders o 
+    WHERE o.client_id = %s AND {page}
+"""
+
+# Горячие запросы UI и индексы, которые они должны использовать: {алиас таблицы в EXPLAIN: индекс}.
+# SQL берётся из тех же констант, что выполняют окна и хранимые процедуры
+INDEX_CHECKS = [
+    (
+        'SellerWindow.load_orders',
+        *page_query(SELLER_ORDERS_SQL, key='o.order_id', token=1000000),
+        {'o': 'idx_orders_status_id'},
+    ),
+    (
+        'ClientWindow.load_orders',
+        *page_query(CLIENT_ORDERS_SQL, (1,), key='o.order_id', token=1000000),
+        {'o': 'idx_orders_client_id'},
+    ),
+    (
+        'get_writeoff_percent: write_offs',
+        WRITEOFF_QTY_SQL.format(into='', variety='%s'),
+        ('Red Naomi',),
+        {'f': 'idx_flowers_variety', 'wo': 'idx_write_offs_item_created'},
+    ),
+    (
+        'get_writeoff_percent: order_items',
+        SOLD_QTY_SQL.format(into='', variety='%s'),
+        ('Red Naomi',),
+        {'f': 'idx_flowers_variety', 'oi': 'idx_order_items_item'},
+    ),
+    (
+        'get_avg_flower_price',
+        AVG_FLOWER_PRICE_SQL.format(name='%s', start='%s', end='%s'),
+        ('Роза', datetime(2000, 1, 1), datetime(2100, 1, 1)),
+        {'f': 'idx_flowers_name_variety', 'ri': 'idx_receipt_items_item', 'r': 'idx_receipts_received_at'},
+    ),
+]
+
+# На меньших таблицах оптимизатор законно выбирает полный скан, и проверка ничего не доказывает
+INDEX_CHECK_MIN_ROWS = {'orders': 10000, 'order_items': 10000, 'write_offs': 1000, 'receipt_items': 1000}
+
+
+def index_check_tables_too_small():
+    """Таблицы, в которых меньше строк, чем нужно для осмысленной проверки планов: {таблица: строк}"""
+    counts = {table: fetch_one(f"SELECT COUNT(*) AS cnt FROM {table}")['cnt'] for table in INDEX_CHECK_MIN_ROWS}
+    return {table: count for table, count in counts.items() if count < INDEX_CHECK_MIN_ROWS[table]}
+
+
+def check_index_usage():
+    """Прогоняет EXPLAIN по INDEX_CHECKS; индекс считается задействованным, только если
+    оптимизатор выбрал именно его. Запускать на базе, заполненной datagen.py"""
+    results = []
+    for name, sql, params, expected in INDEX_CHECKS:
+        plan = {row['table']: row for row in fetch_all('EXPLAIN ' + sql, params)}
+        for table, index in expected.items():
+            row = plan.get(table)
+            chosen = row['key'] if row else None
+            results.append({
+                'query': name,
+                'table': table,
+                'index': index,
+                'chosen': chosen,
+                'ok': chosen == index,
+            })
+    return results
+
 
 def seed_data():
     conn = get_connection()
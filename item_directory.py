@@ -0,0 +1,162 @@
+"""
+Справочник товаров: название, цена и признак активности по (item_type, item_id)
+"""
+import threading
+import time
+import db
+
+
+# Через сколько секунд справочник перечитывается целиком
+DIRECTORY_TTL = 300
+# Не чаще одного перечитывания за столько секунд при промахе по неизвестному товару
+MISS_RELOAD_INTERVAL = 5
+
+# Запись в эти таблицы из этого процесса сбрасывает справочник
+DIRECTORY_TABLES = {source['table'] for source in db.CATALOG_SOURCES.values()}
+
+
+class ItemDirectory:
+    """Все товары всех типов, загруженные одним запросом.
+
+    Читается из любого потока: словарь заменяется целиком при перезагрузке. Устаревший
+    (по TTL или после записи в таблицы товаров) справочник продолжает отдаваться, пока
+    фоновый поток перечитывает его, поэтому обращение из окна не ждёт БД. Синхронно
+    справочник загружается только в первый раз.
+    """
+
+    def __init__(self, ttl=DIRECTORY_TTL):
+        self.ttl = ttl
+        self._items = {}
+        self._loaded_at = None
+        # Увеличивается при каждой записи в таблицы товаров; перезагрузка, начатая
+        # до записи, не снимает признак устаревания
+        self._generation = 0
+        self._expired = False
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def reload(self):
+        generation = self._generation
+        parts = []
+        for item_type, source in db.CATALOG_SOURCES.items():
+            active = 't.is_active' if source['active'] else '1'
+            parts.append(
+                f"SELECT '{item_type}' AS item_type, t.{source['id']} AS item_id, t.name, "
+                f"t.{source['price']} AS price, {active} AS is_active FROM {source['table']} t"
+            )
+        rows = db.fetch_all("\nUNION ALL\n".join(parts))
+        items = {
+            (row['item_type'], row['item_id']): {
+                'name': row['name'],
+                'price': float(row['price']),
+                'active': bool(row['is_active']),
+            }
+            for row in rows
+        }
+        loaded_at = time.monotonic()
+        with self._lock:
+            self._items = items
+            self._loaded_at = loaded_at
+            if self._generation == generation:
+                self._expired = False
+        return loaded_at
+
+    def _background_reload(self):
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"Item directory reload failed: {e}")
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def schedule_reload(self):
+        """Перечитывает справочник в фоновом потоке; повторный вызов во время загрузки ничего не делает"""
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_reload, name='item-directory-reload', daemon=True).start()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._expired = True
+
+    def on_tables_changed(self, tables):
+        if tables & DIRECTORY_TABLES:
+            self.invalidate()
+
+    def ensure_fresh(self):
+        """Перечитывает справочник, если он не загружен или устарел; возвращает его возраст в секундах.
+
+        Блокирует вызывающий поток - для предзагрузки из рабочего потока.
+        """
+        loaded_at = self._loaded_at
+        if loaded_at is None or self._expired or time.monotonic() - loaded_at > self.ttl:
+            loaded_at = self.reload()
+        return time.monotonic() - loaded_at
+
+    def current(self):
+        """Возраст справочника в секундах без ожидания БД: устаревший отдаётся как есть,
+        а перезагрузка уходит в фоновый поток"""
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            return self.ensure_fresh()
+        age = time.monotonic() - loaded_at
+        if self._expired or age > self.ttl:
+            self.schedule_reload()
+        return age
+
+    def lookup(self, item_type, item_id):
+        age = self.current()
+        item = self._items.get((item_type, item_id))
+        if item is None and age > MISS_RELOAD_INTERVAL:
+            # Товар мог появиться после загрузки справочника; появится после фоновой загрузки
+            self.schedule_reload()
+        return item
+
+    def name(self, item_type, item_id):
+        item = self.lookup(item_type, item_id)
+        return item['name'] if item else f'{item_type} #{item_id}'
+
+    def with_names(self, rows, field='item_name'):
+        """Дописывает в строки запроса название товара вместо подзапроса CASE в SQL"""
+        for row in rows:
+            row[field] = self.name(row['item_type'], row['item_id'])
+        return rows
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_directory():
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = ItemDirectory()
+                db.add_invalidation_listener(_directory.on_tables_changed)
+    return _directory
+
+
+def preload():
+    # Загружает справочник заранее, чтобы первое обращение из окна не ждало БД
+    get_directory().ensure_fresh()
+
+
+def lookup(item_type, item_id):
+    return get_directory().lookup(item_type, item_id)
+
+
+def name(item_type, item_id):
+    return get_directory().name(item_type, item_id)
+
+
+def with_names(rows, field='item_name'):
+    return get_directory().with_names(rows, field)
+
+
+def invalidate():
+    get_directory().invalidate()
@@ -0,0 +1,538 @@
+"""
+Генератор нагрузки: несколько терминалов продавцов, клиенты и менеджер на одной базе
+
+Рабочие потоки - это терминалы. Они выполняют сценарии окон в заданной пропорции:
+    seller  - фильтр каталога, корзина, create_order, process_payment
+    client  - каталог, load_orders, pay_order, submit_request
+    manager - receive_purchase, process_writeoff
+Сценарии приходят пуассоновским потоком с интенсивностью --rate в секунду (задержка
+считается от момента прихода, поэтому в неё входит и очередь к терминалам);
+с --rate 0 каждый терминал выполняет сценарии подряд без пауз.
+
+Отчёт: пропускная способность, p50/p95/p99 по сценариям и шагам, ожидания блокировок
+строк InnoDB (SHOW GLOBAL STATUS), взаимоблокировки (ошибки 1213 и счётчик
+lock_deadlocks), таймауты блокировок и отрицательные остатки в inventory.
+
+    python loadgen.py --workers 8 --rate 20 --duration 60
+    python loadgen.py --workers 16 --rate 0 --mix seller=70,client=25,manager=5 --output rush.json
+
+Сценарии создают заказы, оплаты, заявки, приходы и списания - запускать только на тестовой базе.
+"""
+import argparse
+import json
+import platform
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+import pymysql
+import db
+import catalog_engine
+import operations
+from bench import percentile
+
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 10.0
+DEFAULT_DURATION = 60
+DEFAULT_MIX = 'seller=60,client=30,manager=10'
+# Как часто проверять остатки на отрицательные значения, секунд
+DEFAULT_CHECK_INTERVAL = 1.0
+# Доля позиций корзин и заявок, приходящихся на самые ходовые цветы (розы к 8 марта);
+# списывает менеджер тоже их
+DEFAULT_HOT_SHARE = 0.5
+HOT_ITEMS = 20
+# Доля клиентских сценариев, которые заканчиваются заявкой на букет
+REQUEST_SHARE = 0.3
+
+# Коды ошибок MySQL, которые считаются отдельно
+ER_DUP_ENTRY = 1062
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+
+# Отказы бизнес-логики: ожидаемы при конкуренции терминалов и ошибкой не считаются
+REJECTIONS = (db.StockShortage, operations.AlreadyProcessed, operations.NotFound)
+
+# Типы товаров в фильтре каталога продавца и в окне клиента
+CATALOG_TYPES = ('FLOWER', 'BOUQUET')
+CATALOG_FIELDS = ('item_type', 'item_id', 'name', 'price', 'stock')
+PAYMENT_METHODS = ('Наличные', 'Карта')
+WRITEOFF_REASONS = ('EXPIRED', 'DAMAGED', 'OTHER')
+
+
+def classify(error):
+    """Исход сценария по исключению: ok, rejected, deadlock, lock_timeout, conflict, pool_timeout, error"""
+    if error is None:
+        return 'ok'
+    if isinstance(error, REJECTIONS):
+        return 'rejected'
+    if isinstance(error, db.PoolTimeout):
+        return 'pool_timeout'
+    if isinstance(error, pymysql.MySQLError) and error.args:
+        code = error.args[0]
+        if code == ER_LOCK_DEADLOCK:
+            return 'deadlock'
+        if code == ER_LOCK_WAIT_TIMEOUT:
+            return 'lock_timeout'
+        if code == ER_DUP_ENTRY:
+            # Два терминала оплатили один заказ: второй платёж отбит уникальным ключом
+            return 'conflict'
+    return 'error'
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in FLOWS:
+            raise ValueError(f"Unknown flow '{name}', expected one of: {', '.join(FLOWS)}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError('Flow mix has no positive weights')
+    return mix
+
+
+class LoadContext:
+    """Идентификаторы из текущей базы, общие для всех терминалов"""
+
+    def __init__(self, hot_share):
+        self.hot_share = hot_share
+        self.client_ids = [r['client_id'] for r in db.fetch_all("SELECT client_id FROM clients ORDER BY client_id LIMIT 5000")]
+        self.seller_ids = [r['user_id'] for r in db.fetch_all("SELECT user_id FROM users WHERE role = 'SELLER'")]
+        self.supplier_ids = [r['supplier_id'] for r in db.fetch_all("SELECT supplier_id FROM suppliers")]
+        self.hot_flowers = [r['item_id'] for r in db.fetch_all(f"""
+            SELECT item_id FROM inventory
+            WHERE item_type = 'FLOWER' AND qty > 0
+            ORDER BY qty DESC LIMIT {HOT_ITEMS}
+        """)]
+        if not (self.client_ids and self.seller_ids and self.supplier_ids and self.hot_flowers):
+            raise RuntimeError('Database has too little data for the load test; run datagen.py first')
+
+
+class Terminal:
+    """Состояние одного терминала: свой генератор случайных чисел и свой снимок каталога"""
+
+    def __init__(self, ctx, recorder, mix, seed):
+        self.ctx = ctx
+        self.recorder = recorder
+        self.mix = mix
+        self.rng = random.Random(seed)
+        self.catalog = None
+        self.seller_id = self.rng.choice(ctx.seller_ids)
+
+    def step(self, flow, name, fn, *args):
+        """Выполняет шаг сценария с замером; исключение шага заканчивает сценарий"""
+        started = time.perf_counter()
+        error = None
+        try:
+            with db.query_context(f'loadgen.{flow}', name):
+                return fn(*args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.recorder.record_step(f'{flow}.{name}', time.perf_counter() - started, classify(error))
+
+    def hot_or(self, candidates):
+        """Ходовой цветок с вероятностью hot_share, иначе случайная строка из candidates"""
+        if not candidates or self.rng.random() < self.ctx.hot_share:
+            return ('FLOWER', self.rng.choice(self.ctx.hot_flowers))
+        return self.rng.choice(candidates)
+
+
+def catalog_price(catalog, key):
+    item_type, item_id = key
+    indices = catalog.filter(item_types=(item_type,))
+    match = indices[catalog.item_id[indices] == item_id]
+    return float(catalog.price[match[0]]) if len(match) else 100.0
+
+
+def seller_flow(term):
+    if term.catalog is None:
+        term.catalog = term.step('seller', 'refresh_catalog', catalog_engine.load_snapshot,
+                                 list(db.CATALOG_SOURCES), [CATALOG_FIELDS])
+
+    def pick_items():
+        catalog = term.catalog
+        prefix = catalog.name[term.rng.randrange(catalog.size)][:3] if catalog.size else ''
+        indices = catalog.filter(name=prefix, item_types=CATALOG_TYPES, in_stock_only=True)
+        if not len(indices):
+            indices = catalog.filter(in_stock_only=True)
+        rows = catalog.rows(indices, CATALOG_FIELDS)
+        prices = {(row[0], row[1]): row[3] for row in rows}
+        cart = {}
+        for _ in range(term.rng.randint(1, 4)):
+            key = term.hot_or([(row[0], row[1]) for row in rows])
+            cart[key] = cart.get(key, 0) + term.rng.randint(1, 3)
+        return [{'item_type': key[0], 'item_id': key[1], 'qty': qty,
+                 'price': prices.get(key) or catalog_price(catalog, key)} for key, qty in cart.items()]
+
+    items = term.step('seller', 'apply_catalog_filter', pick_items)
+    order_id = term.step('seller', 'create_order', operations.create_order,
+                         term.rng.choice(term.ctx.client_ids), term.seller_id, items, 0)
+    # Окно продавца перечитывает каталог после каждого заказа
+    term.catalog = term.step('seller', 'refresh_catalog', catalog_engine.load_snapshot,
+                             list(db.CATALOG_SOURCES), [CATALOG_FIELDS])
+    term.step('seller', 'process_payment', operations.process_payment, order_id, term.rng.choice(PAYMENT_METHODS))
+
+
+def client_flow(term):
+    client_id = term.rng.choice(term.ctx.client_ids)
+
+    # Каждый клиентский сценарий - новый сеанс окна клиента со своим снимком каталога
+    catalog = term.step('client', 'catalog', catalog_engine.load_snapshot, CATALOG_TYPES)
+    in_stock = catalog.filter(price_from=term.rng.choice((0, 500, 1000)), item_types=('FLOWER',), in_stock_only=True)
+
+    orders, _ = term.step('client', 'load_orders', operations.client_orders_page, client_id)
+    unpaid = [order['order_id'] for order in orders if not order['is_paid'] and order['status'] != 'Отменен']
+    if unpaid:
+        term.step('client', 'pay_order', operations.pay_order, term.rng.choice(unpaid), term.rng.choice(PAYMENT_METHODS))
+
+    if term.rng.random() < REQUEST_SHARE:
+        flower_ids = [int(flower_id) for flower_id in catalog.item_id[in_stock]]
+        items = {}
+        for _ in range(term.rng.randint(1, 3)):
+            _, flower_id = term.hot_or([('FLOWER', flower_id) for flower_id in flower_ids])
+            items[flower_id] = items.get(flower_id, 0) + term.rng.randint(1, 15)
+        desired_date = date.today() + timedelta(days=term.rng.randint(1, 7))
+        term.step('client', 'submit_request', operations.submit_request, client_id, desired_date, None,
+                  [{'flower_id': flower_id, 'qty': qty} for flower_id, qty in items.items()])
+
+
+def pending_purchase(term):
+    """Закупка, ожидающая приёма; если таких нет, менеджер создаёт новую"""
+    pending = db.fetch_all("""
+        SELECT purchase_id FROM purchase_orders
+        WHERE status IN ('NEW', 'SENT')
+        ORDER BY purchase_id DESC LIMIT 20
+    """)
+    if pending:
+        return term.rng.choice(pending)['purchase_id']
+    supplier_id = term.rng.choice(term.ctx.supplier_ids)
+    offers = operations.purchase_items(supplier_id)
+    items = [{'item_type': t, 'item_id': i, 'qty': term.rng.randint(10, 50), 'price': float(p)}
+             for t, i, _, p in term.rng.sample(offers, min(len(offers), 10))]
+    return operations.create_purchase(supplier_id, items)
+
+
+def manager_flow(term):
+    purchase_id = term.step('manager', 'load_purchases', pending_purchase, term)
+    term.step('manager', 'receive_purchase', operations.receive_purchase, purchase_id)
+    term.step('manager', 'process_writeoff', operations.process_writeoff,
+              term.rng.choice(term.ctx.hot_flowers), term.rng.randint(1, 5), term.rng.choice(WRITEOFF_REASONS))
+
+
+FLOWS = {
+    'seller': seller_flow,
+    'client': client_flow,
+    'manager': manager_flow,
+}
+
+
+class Recorder:
+    """Замеры сценариев и шагов из всех терминалов"""
+
+    def __init__(self):
+        self.flows = {}
+        self.steps = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _add(table, name, outcome, **samples):
+        entry = table.get(name)
+        if entry is None:
+            entry = table[name] = {'outcomes': {}, **{key: [] for key in samples}}
+        entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+        for key, value in samples.items():
+            entry[key].append(value)
+
+    def record_flow(self, flow, latency, service, outcome):
+        with self._lock:
+            self._add(self.flows, flow, outcome, latency=latency, service=service)
+
+    def record_step(self, name, elapsed, outcome):
+        with self._lock:
+            self._add(self.steps, name, outcome, service=elapsed)
+
+    def outcomes(self):
+        totals = {}
+        with self._lock:
+            for entry in self.flows.values():
+                for outcome, count in entry['outcomes'].items():
+                    totals[outcome] = totals.get(outcome, 0) + count
+        return totals
+
+
+def summarize(samples):
+    values = sorted(value * 1000 for value in samples)
+    if not values:
+        return {}
+    return {
+        'p50_ms': round(percentile(values, 0.50), 3),
+        'p95_ms': round(percentile(values, 0.95), 3),
+        'p99_ms': round(percentile(values, 0.99), 3),
+        'max_ms': round(values[-1], 3),
+        'mean_ms': round(sum(values) / len(values), 3),
+    }
+
+
+class StockWatcher(threading.Thread):
+    """Периодически ищет строки inventory с qty < 0 и запоминает новые"""
+
+    def __init__(self, interval):
+        super().__init__(name='stock-watcher', daemon=True)
+        self.interval = interval
+        self.initial = {(r['item_type'], r['item_id']): r['qty'] for r in negative_stock()}
+        self.incidents = {}
+        self.max_negative_rows = len(self.initial)
+        self._stop_event = threading.Event()
+
+    def check(self):
+        rows = negative_stock()
+        self.max_negative_rows = max(self.max_negative_rows, len(rows))
+        for row in rows:
+            key = (row['item_type'], row['item_id'])
+            if key in self.initial:
+                continue
+            incident = self.incidents.get(key)
+            if incident is None:
+                self.incidents[key] = {'item_type': key[0], 'item_id': key[1], 'min_qty': row['qty'],
+                                       'first_seen': datetime.now().isoformat(timespec='milliseconds')}
+            else:
+                incident['min_qty'] = min(incident['min_qty'], row['qty'])
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Stock check failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        # Последняя проверка после того, как все терминалы остановились
+        self.check()
+
+
+def negative_stock():
+    return db.fetch_all("SELECT item_type, item_id, qty FROM inventory WHERE qty < 0")
+
+
+def server_counters():
+    """Счётчики блокировок InnoDB; lock_deadlocks берётся из INNODB_METRICS, если он доступен"""
+    rows = db.fetch_all("""
+        SHOW GLOBAL STATUS WHERE Variable_name IN
+            ('Innodb_row_lock_waits', 'Innodb_row_lock_time', 'Innodb_row_lock_time_max')
+    """)
+    counters = {row['Variable_name']: int(row['Value']) for row in rows}
+    try:
+        row = db.fetch_one("SELECT `COUNT` AS cnt FROM information_schema.INNODB_METRICS WHERE NAME = 'lock_deadlocks'")
+        counters['lock_deadlocks'] = int(row['cnt']) if row else None
+    except pymysql.MySQLError:
+        counters['lock_deadlocks'] = None
+    return counters
+
+
+def server_delta(before, after):
+    def delta(name):
+        if before.get(name) is None or after.get(name) is None:
+            return None
+        return after[name] - before[name]
+
+    return {
+        'row_lock_waits': delta('Innodb_row_lock_waits'),
+        'row_lock_time_ms': delta('Innodb_row_lock_time'),
+        # Максимум за всё время работы сервера, а не за прогон
+        'row_lock_time_max_ms': after.get('Innodb_row_lock_time_max'),
+        'deadlocks': delta('lock_deadlocks'),
+    }
+
+
+def worker(term, arrivals, stop, think):
+    """Терминал: берёт сценарии из очереди (или выполняет подряд без очереди) до остановки"""
+    while not stop.is_set():
+        if arrivals is not None:
+            try:
+                flow, arrived = arrivals.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        else:
+            flow, arrived = term.rng.choices(list(term.mix), weights=list(term.mix.values()))[0], time.perf_counter()
+        started = time.perf_counter()
+        error = None
+        try:
+            FLOWS[flow](term)
+        except Exception as e:
+            error = e
+        finished = time.perf_counter()
+        outcome = classify(error)
+        term.recorder.record_flow(flow, finished - arrived, finished - started, outcome)
+        if outcome == 'error':
+            print(f"{flow}: {type(error).__name__}: {error}")
+        if arrivals is None and think:
+            stop.wait(think)
+
+
+def dispatch(arrivals, mix, rate, rng, stop, counters):
+    """Пуассоновский поток сценариев: интервалы между приходами экспоненциальные"""
+    names, weights = list(mix), list(mix.values())
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        next_at += rng.expovariate(rate)
+        delay = next_at - time.perf_counter()
+        if delay > 0 and stop.wait(delay):
+            break
+        arrivals.put((rng.choices(names, weights=weights)[0], next_at))
+        counters['offered'] += 1
+
+
+def run(args, mix):
+    ctx = LoadContext(args.hot_share)
+    recorder = Recorder()
+    stop = threading.Event()
+    arrivals = queue.Queue() if args.rate > 0 else None
+    counters = {'offered': 0}
+
+    terminals = [Terminal(ctx, recorder, mix, args.seed * 1000 + index) for index in range(args.workers)]
+
+    watcher = StockWatcher(args.check_interval)
+    before = server_counters()
+    db.query_stats().reset()
+
+    threads = [threading.Thread(target=worker, name=f'terminal-{index}',
+                                args=(term, arrivals, stop, args.think / 1000), daemon=True)
+               for index, term in enumerate(terminals)]
+    if arrivals is not None:
+        threads.append(threading.Thread(target=dispatch, name='dispatcher', daemon=True,
+                                        args=(arrivals, mix, args.rate, random.Random(args.seed), stop, counters)))
+    started = time.perf_counter()
+    watcher.start()
+    for thread in threads:
+        thread.start()
+    try:
+        stop.wait(args.duration)
+    except KeyboardInterrupt:
+        print("Interrupted, stopping terminals")
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    watcher.stop()
+    after = server_counters()
+
+    outcomes = recorder.outcomes()
+    completed = sum(outcomes.values())
+    return {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': {
+            'workers': args.workers, 'rate': args.rate, 'duration': args.duration, 'think_ms': args.think,
+            'mix': mix, 'hot_share': args.hot_share, 'seed': args.seed,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'offered': counters['offered'] if arrivals is not None else completed,
+        'completed': completed,
+        # Пришедшие сценарии, до которых терминалы не успели дойти
+        'backlog': arrivals.qsize() if arrivals is not None else 0,
+        'throughput_per_s': round(completed / elapsed, 3) if elapsed else None,
+        'ok_per_s': round(outcomes.get('ok', 0) / elapsed, 3) if elapsed else None,
+        'outcomes': outcomes,
+        'flows': {
+            name: {
+                'count': len(entry['latency']),
+                'outcomes': entry['outcomes'],
+                'latency': summarize(entry['latency']),
+                'service': summarize(entry['service']),
+            }
+            for name, entry in sorted(recorder.flows.items())
+        },
+        'steps': {
+            name: {'count': len(entry['service']), 'outcomes': entry['outcomes'], **summarize(entry['service'])}
+            for name, entry in sorted(recorder.steps.items())
+        },
+        'locks': dict(server_delta(before, after),
+                      deadlock_errors=outcomes.get('deadlock', 0),
+                      lock_wait_timeouts=outcomes.get('lock_timeout', 0)),
+        'negative_stock': {
+            'before': len(watcher.initial),
+            'max_rows': watcher.max_negative_rows,
+            'incidents': list(watcher.incidents.values()),
+        },
+        'pool': db.pool_stats(),
+        'statements': db.query_stats().report()['statements'][:10],
+    }
+
+
+def print_report(report):
+    print(f"{report['completed']} flows in {report['elapsed_s']:.1f}s: "
+          f"{report['throughput_per_s']:.2f}/s, ok {report['ok_per_s']:.2f}/s, backlog {report['backlog']}")
+    print("  outcomes: " + ', '.join(f"{k} {v}" for k, v in sorted(report['outcomes'].items())))
+    for name, flow in report['flows'].items():
+        latency = flow['latency']
+        print(f"  {name:8} {flow['count']:6}  p50 {latency['p50_ms']:9.2f}  p95 {latency['p95_ms']:9.2f}"
+              f"  p99 {latency['p99_ms']:9.2f} ms")
+    for name, step in report['steps'].items():
+        print(f"    {name:32} {step['count']:6}  p50 {step['p50_ms']:9.2f}  p95 {step['p95_ms']:9.2f}"
+              f"  p99 {step['p99_ms']:9.2f} ms")
+    locks = report['locks']
+    print(f"  row lock waits {locks['row_lock_waits']}, lock time {locks['row_lock_time_ms']} ms, "
+          f"deadlocks {locks['deadlocks']} (errors {locks['deadlock_errors']}), "
+          f"lock wait timeouts {locks['lock_wait_timeouts']}")
+    pool = report['pool']
+    if pool:
+        print(f"  pool waits {pool['waits']} ({pool['wait_time']:.2f}s), timeouts {pool['timeouts']}")
+    incidents = report['negative_stock']['incidents']
+    print(f"  negative stock incidents: {len(incidents)}")
+    for incident in incidents:
+        print(f"    {incident['item_type']}#{incident['item_id']} qty {incident['min_qty']} at {incident['first_seen']}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Генератор нагрузки с нескольких терминалов')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='число терминалов (потоков)')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help='сценариев в секунду на все терминалы; 0 - каждый терминал без пауз')
+    parser.add_argument('--think', type=float, default=0, help='пауза между сценариями при --rate 0, мс')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='секунд')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='веса сценариев, например seller=60,client=30,manager=10')
+    parser.add_argument('--hot-share', type=float, default=DEFAULT_HOT_SHARE,
+                        help=f'доля позиций из {HOT_ITEMS} самых ходовых цветов')
+    parser.add_argument('--check-interval', type=float, default=DEFAULT_CHECK_INTERVAL,
+                        help='период проверки отрицательных остатков, секунд')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='файл для JSON с результатами')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(e)
+        return 2
+    if args.workers < 1:
+        print("--workers must be at least 1")
+        return 2
+    # У каждого терминала своё соединение, как у отдельных рабочих мест
+    db.POOL_CONFIG['max_size'] = max(db.POOL_CONFIG['max_size'], args.workers + 2)
+    # Медленные запросы нагрузки не должны смешиваться с журналом рабочих окон
+    db.query_stats().slow_log = None
+
+    report = run(args, mix)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+    db.close_pool()
+    # Отрицательный остаток - нарушение инварианта склада, прогон считается проваленным
+    return 1 if report['negative_stock']['incidents'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
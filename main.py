@@ -1,12 +1,37 @@
 
+import os
 import sys
+import importlib
+import threading
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import Qt
 import db
 from auth import LoginWindow
-from admin_ui import SellerWindow
-from chief_ui import ManagerWindow
-from patient_ui import ClientWindow
+
+
+# Путь к отчёту по запросам на выходе, если он не задан в STATS_CONFIG['report_path']
+QUERY_REPORT_ENV = 'FLOWER_QUERY_REPORT'
+
+
+# Окна ролей импортируются только после входа: пользователю нужно одно из трёх
+ROLE_WINDOWS = {
+    'SELLER': ('admin_ui', 'SellerWindow'),
+    'MANAGER': ('chief_ui', 'ManagerWindow'),
+    'CLIENT': ('patient_ui', 'ClientWindow'),
+}
+
+
+def load_role_window(role):
+    module_name, class_name = ROLE_WINDOWS[role]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def prewarm_role_windows():
+    # Пока пользователь вводит пароль, модули окон загружаются в фоне
+    for module_name, _ in ROLE_WINDOWS.values():
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Prewarm of {module_name} failed: {e}")
 
 
 class FlowerShopApp:
@@ -17,16 +42,22 @@ class FlowerShopApp:
     
     def run(self):
         try:
-            # Инициализация БД
+            # Инициализация БД: миграции и наполнение только если схема устарела
             print("Запуск бд")
-            db.run_migrations()
-            db.seed_data()
+            if db.prepare_database():
+                print("бд обновлена")
             print("бд готова!")
             login_window = LoginWindow(self.on_login_success)
             login_window.show()
             self.current_window = login_window
+            threading.Thread(target=prewarm_role_windows, daemon=True).start()
             
-            sys.exit(self.app.exec())
+            exit_code = self.app.exec()
+            report_path = os.environ.get(QUERY_REPORT_ENV) or db.query_stats().report_path
+            if report_path:
+                print(f"Отчёт по запросам: {db.dump_query_report(report_path)}")
+            db.close_pool()
+            sys.exit(exit_code)
         except Exception as e:
             print(f"Error starting application: {e}")
             import traceback
@@ -39,16 +70,11 @@ class FlowerShopApp:
 
         role = user['role']
         
-        if role == 'SELLER':
-            window = SellerWindow(user)
-        elif role == 'MANAGER':
-            window = ManagerWindow(user)
-        elif role == 'CLIENT':
-            window = ClientWindow(user)
-        else:
+        if role not in ROLE_WINDOWS:
             print(f"Unknown role: {role}")
             return
         
+        window = load_role_window(role)(user)
         window.show()
         self.current_window = window
 
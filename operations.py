@@ -0,0 +1,409 @@
+"""
+Операции магазина без Qt: их вызывают окна, бенчмарк и генератор нагрузки
+"""
+from datetime import date, timedelta
+import db
+import item_directory
+
+
+class NotFound(Exception):
+    pass
+
+
+class AlreadyProcessed(Exception):
+    """Заказ уже оплачен или поставка уже принята"""
+    pass
+
+
+def create_order(client_id, user_id, items, discount):
+    """Создаёт заказ со статусом 'Новый' и резервирует остатки; возвращает order_id.
+
+    items - позиции корзины: [{'item_type', 'item_id', 'price', 'qty'}].
+    При нехватке остатков бросает db.StockShortage, заказ не создаётся.
+    """
+    total = sum(item['price'] * item['qty'] for item in items)
+    total_with_discount = total * (1 - discount / 100)
+
+    with db.transaction() as cursor:
+        cursor.execute(
+            """INSERT INTO orders (client_id, created_by_user_id, status, discount_percent, total_sum)
+               VALUES (%s, %s, %s, %s, %s)""",
+            (client_id, user_id, 'Новый', discount, total_with_discount)
+        )
+        order_id = cursor.lastrowid
+
+        # Добавляем позиции одним многострочным INSERT
+        db.executemany(
+            """INSERT INTO order_items (order_id, item_type, item_id, qty, price, sum)
+               VALUES (%s, %s, %s, %s, %s, %s)""",
+            [(order_id, item['item_type'], item['item_id'], item['qty'], item['price'],
+              item['price'] * item['qty']) for item in items],
+            cursor=cursor
+        )
+
+        # Резервируем остатки по всем позициям последним шагом, чтобы строки склада
+        # были заблокированы только до COMMIT
+        requested = {}
+        for item in items:
+            key = (item['item_type'], item['item_id'])
+            requested[key] = requested.get(key, 0) + item['qty']
+        db.reserve_stock(cursor, requested)
+    return order_id
+
+
+def process_payment(order_id, method):
+    """Оплата заказа продавцом: платёж и статус 'Выдан' в одной транзакции"""
+    payment = db.fetch_one("SELECT * FROM payments WHERE order_id = %s", (order_id,))
+    if payment:
+        raise AlreadyProcessed('Заказ уже оплачен')
+
+    order = db.fetch_one("SELECT * FROM orders WHERE order_id = %s", (order_id,))
+    if not order:
+        raise NotFound('Заказ не найден')
+
+    with db.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO payments (order_id, method, amount) VALUES (%s, %s, %s)",
+            (order_id, method, order['total_sum'])
+        )
+
+        # Обновляем статус заказа
+        cursor.execute("UPDATE orders SET status = 'Выдан' WHERE order_id = %s", (order_id,))
+
+
+def client_orders_page(client_id, token=None):
+    """Страница заказов клиента с признаком оплаты, новые сверху"""
+    return db.fetch_page(db.CLIENT_ORDERS_SQL, (client_id,), key='o.order_id', token=token)
+
+
+def pay_order(order_id, method):
+    """Оплата заказа клиентом: только платёж, статус заказа не меняется"""
+    payment = db.fetch_one("SELECT * FROM payments WHERE order_id = %s", (order_id,))
+    if payment:
+        raise AlreadyProcessed('Заказ уже оплачен')
+
+    order = db.fetch_one("SELECT * FROM orders WHERE order_id = %s", (order_id,))
+    if not order:
+        raise NotFound('Заказ не найден')
+
+    db.execute(
+        "INSERT INTO payments (order_id, method, amount) VALUES (%s, %s, %s)",
+        (order_id, method, order['total_sum'])
+    )
+
+
+def submit_request(client_id, desired_date, wishes, items):
+    """Создаёт заявку на индивидуальный букет; items: [{'flower_id', 'qty'}]; возвращает request_id"""
+    with db.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO custom_requests (client_id, desired_date, wishes, status) VALUES (%s, %s, %s, 'Новая')",
+            (client_id, desired_date, wishes if wishes else None)
+        )
+        request_id = cursor.lastrowid
+
+        # Добавляем позиции
+        for item in items:
+            cursor.execute(
+                "INSERT INTO custom_request_items (request_id, flower_id, qty) VALUES (%s, %s, %s)",
+                (request_id, item['flower_id'], item['qty'])
+            )
+    return request_id
+
+
+def purchase_items(supplier_id):
+    """Товары для закупки с ценами поставщика: [(item_type, item_id, name, supplier_price)]"""
+    items = []
+
+    # Цветы с ценами поставщика
+    sql = """
+        SELECT f.*, COALESCE(sp.price, f.price * 0.8) as supplier_price
+        FROM flowers f
+        LEFT JOIN supplier_prices sp ON sp.supplier_id = %s AND sp.item_type = 'FLOWER' AND sp.item_id = f.flower_id
+        WHERE f.is_active = 1
+    """
+    flowers = db.fetch_all(sql, (supplier_id,), cached=True)
+    for f in flowers:
+        items.append(('FLOWER', f['flower_id'], f['name'], f['supplier_price']))
+
+    # Упаковка
+    sql = """
+        SELECT p.*, COALESCE(sp.price, p.price * 0.8) as supplier_price
+        FROM packaging p
+        LEFT JOIN supplier_prices sp ON sp.supplier_id = %s AND sp.item_type = 'PACKAGING' AND sp.item_id = p.packaging_id
+    """
+    packaging = db.fetch_all(sql, (supplier_id,), cached=True)
+    for p in packaging:
+        items.append(('PACKAGING', p['packaging_id'], p['name'], p['supplier_price']))
+
+    # Аксессуары
+    sql = """
+        SELECT a.*, COALESCE(sp.price, a.price * 0.8) as supplier_price
+        FROM accessories a
+        LEFT JOIN supplier_prices sp ON sp.supplier_id = %s AND sp.item_type = 'ACCESSORY' AND sp.item_id = a.accessory_id
+    """
+    accessories = db.fetch_all(sql, (supplier_id,), cached=True)
+    for a in accessories:
+        items.append(('ACCESSORY', a['accessory_id'], a['name'], a['supplier_price']))
+    return items
+
+
+def create_purchase(supplier_id, items):
+    """Создаёт закупку со статусом NEW; items: [{'item_type', 'item_id', 'qty', 'price'}]"""
+    with db.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO purchase_orders (supplier_id, status) VALUES (%s, %s)",
+            (supplier_id, 'NEW')
+        )
+        purchase_id = cursor.lastrowid
+
+        # Добавляем позиции
+        for item in items:
+            cursor.execute(
+                "INSERT INTO purchase_items (purchase_id, item_type, item_id, qty, price) VALUES (%s, %s, %s, %s, %s)",
+                (purchase_id, item['item_type'], item['item_id'], item['qty'], item['price'])
+            )
+    return purchase_id
+
+
+def receive_purchase(purchase_id):
+    """Принимает поставку по закупке: приход, позиции прихода и остатки; возвращает receipt_id"""
+    purchase = db.fetch_one("SELECT * FROM purchase_orders WHERE purchase_id = %s", (purchase_id,))
+    if not purchase:
+        raise NotFound('Закупка не найдена')
+
+    if purchase['status'] == 'RECEIVED':
+        raise AlreadyProcessed('Поставка уже принята')
+
+    with db.transaction() as cursor:
+        # Помечаем закупку полученной; строка закупки блокируется до COMMIT,
+        # поэтому повторный приём с другого терминала не пройдёт
+        cursor.execute(
+            "UPDATE purchase_orders SET status = 'RECEIVED' WHERE purchase_id = %s AND status != 'RECEIVED'",
+            (purchase_id,)
+        )
+        if cursor.rowcount == 0:
+            raise AlreadyProcessed('Поставка уже принята')
+
+        # Создаём приход
+        cursor.execute(
+            "INSERT INTO receipts (purchase_id, received_at) VALUES (%s, NOW())",
+            (purchase_id,)
+        )
+        receipt_id = cursor.lastrowid
+
+        # Позиции прихода одним INSERT ... SELECT из позиций закупки
+        cursor.execute(
+            """INSERT INTO receipt_items (receipt_id, item_type, item_id, qty, buy_price)
+               SELECT %s, item_type, item_id, qty, price
+               FROM purchase_items
+               WHERE purchase_id = %s""",
+            (receipt_id, purchase_id)
+        )
+
+        # Увеличиваем остатки одним upsert по ключу unique_item
+        cursor.execute(
+            """INSERT INTO inventory (item_type, item_id, qty)
+               SELECT item_type, item_id, qty FROM (
+                   SELECT item_type, item_id, SUM(qty) AS qty
+                   FROM purchase_items
+                   WHERE purchase_id = %s
+                   GROUP BY item_type, item_id
+               ) AS received
+               ON DUPLICATE KEY UPDATE qty = inventory.qty + received.qty""",
+            (purchase_id,)
+        )
+    return receipt_id
+
+
+def writeoff_page(token=None):
+    """Страница истории списаний, новые сверху"""
+    return db.fetch_page("""
+        SELECT wo.writeoff_id, f.name as flower_name, f.variety, wo.qty, wo.reason, wo.created_at
+        FROM write_offs wo
+        JOIN flowers f ON wo.item_id = f.flower_id
+        WHERE {page}
+    """, key='wo.writeoff_id', token=token)
+
+
+def process_writeoff(flower_id, qty, reason):
+    """Списывает цветок со склада; при нехватке остатка бросает db.StockShortage"""
+    with db.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO write_offs (item_type, item_id, qty, reason, created_at) VALUES ('FLOWER', %s, %s, %s, NOW())",
+            (flower_id, qty, reason)
+        )
+
+        # Проверка остатка и списание одним условным UPDATE
+        db.reserve_stock(cursor, {('FLOWER', flower_id): qty})
+
+
+def writeoff_flowers():
+    return db.fetch_all(
+        "SELECT flower_id, name, variety FROM flowers WHERE is_active = 1 ORDER BY name, variety",
+        cached=True
+    )
+
+
+def avg_flower_price(flower_name, period_type, year, month):
+    """Средняя закупочная цена цветка за месяц или год (процедура get_avg_flower_price) или None"""
+    rows = db.call_procedure('get_avg_flower_price',
+                             (flower_name, period_type, year, month if period_type == 'MONTH' else 0))
+    return rows[0]['avg_price'] if rows else None
+
+
+# Месяц считается закрытым через сутки после окончания: запас на разницу часовых поясов
+# рабочего места и сервера БД
+PRICE_MONTH_GRACE = timedelta(days=1)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def flower_names():
+    return [row['name'] for row in db.fetch_all("SELECT DISTINCT name FROM flowers ORDER BY name", cached=True)]
+
+
+def price_series(names, first_month, last_month):
+    """Средняя закупочная цена по месяцам для нескольких цветков за период.
+
+    Считается как в процедуре get_avg_flower_price (среднее buy_price строк прихода),
+    но одним сгруппированным запросом на все цветки и месяцы. Суммы закрытых месяцев
+    запоминаются в flower_price_months и дальше читаются оттуда; из приходов каждый раз
+    пересчитывается только текущий месяц (и закрытые месяцы, которых ещё нет в таблице).
+    names пустой - все цветки. Возвращает [{'flower_name', 'month', 'avg_price', 'samples'}]
+    по каждому цветку и месяцу, avg_price = None, если приходов не было.
+    """
+    known = {name.casefold(): name for name in flower_names()}
+    names = [known[name.casefold()] for name in names if name.casefold() in known] if names else list(known.values())
+    names = list(dict.fromkeys(names))
+    today = date.today()
+    first_month = month_start(first_month)
+    last_month = min(month_start(last_month), month_start(today))
+    if not names or first_month > last_month:
+        return []
+
+    months = [first_month]
+    while months[-1] < last_month:
+        months.append(next_month(months[-1]))
+    open_from = month_start(today - PRICE_MONTH_GRACE)
+    closed = [month for month in months if month < open_from]
+    name_list = ', '.join(['%s'] * len(names))
+
+    totals = {}
+    if closed:
+        for row in db.fetch_all(f"""
+            SELECT flower_name, month, price_sum, samples FROM flower_price_months
+            WHERE flower_name IN ({name_list}) AND month BETWEEN %s AND %s
+        """, (*names, closed[0], closed[-1])):
+            totals[(row['flower_name'], row['month'])] = (row['price_sum'], row['samples'])
+
+    missing = [(name, month) for name in names for month in closed if (name, month) not in totals]
+    ranges = []
+    if missing:
+        ranges.append((min(month for _, month in missing), next_month(max(month for _, month in missing))))
+    if last_month >= open_from:
+        ranges.append((max(first_month, open_from), next_month(last_month)))
+
+    if ranges:
+        computed = {}
+        for row in db.fetch_all(f"""
+            SELECT f.name, YEAR(r.received_at) AS year, MONTH(r.received_at) AS month,
+                   SUM(ri.buy_price) AS price_sum, COUNT(*) AS samples
+            FROM receipts r
+            JOIN receipt_items ri ON ri.receipt_id = r.receipt_id AND ri.item_type = 'FLOWER'
+            JOIN flowers f ON f.flower_id = ri.item_id
+            WHERE f.name IN ({name_list})
+              AND ({' OR '.join(['(r.received_at >= %s AND r.received_at < %s)'] * len(ranges))})
+            GROUP BY f.name, year, month
+        """, (*names, *(bound for period in ranges for bound in period))):
+            name = known.get(row['name'].casefold(), row['name'])
+            computed[(name, date(row['year'], row['month'], 1))] = (row['price_sum'], row['samples'])
+
+        if missing:
+            # Месяцы без приходов тоже запоминаются, чтобы не пересчитывать их снова
+            db.executemany(
+                """INSERT INTO flower_price_months (flower_name, month, price_sum, samples)
+                   VALUES (%s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE flower_name = flower_name""",
+                [(name, month, *computed.get((name, month), (0, 0))) for name, month in missing]
+            )
+        for name in names:
+            for month in months:
+                if month >= open_from or (name, month) not in totals:
+                    totals[(name, month)] = computed.get((name, month), (0, 0))
+
+    series = []
+    for name in names:
+        for month in months:
+            price_sum, samples = totals[(name, month)]
+            series.append({
+                'flower_name': name,
+                'month': month,
+                'avg_price': round(price_sum / samples, 2) if samples else None,
+                'samples': samples,
+            })
+    return series
+
+
+def writeoff_percent(variety):
+    """Процент списаний сорта за последние 3 месяца (функция get_writeoff_percent) или None"""
+    result = db.fetch_one("SELECT get_writeoff_percent(%s) as percent", (variety,))
+    return result['percent'] if result else None
+
+
+# Окно, за которое считается процент списаний (как в функции get_writeoff_percent)
+WRITEOFF_WINDOW_MONTHS = 3
+
+
+def writeoff_report(by_flower=False, by_month=False, months=WRITEOFF_WINDOW_MONTHS):
+    """Процент списаний по всем сортам за последние months месяцев одним запросом.
+
+    Считает то же, что get_writeoff_percent: списано / (списано + продано в неотменённых
+    заказах), но для всего ассортимента сразу: списания и продажи агрегируются
+    по цветку (и месяцу) в одном проходе, затем сворачиваются до сорта. by_flower и
+    by_month добавляют в группировку цветок и месяц; в строках без них эти поля - None.
+    Попадают только сорта, по которым за окно были списания или продажи.
+    """
+    month_wo = "DATE_FORMAT(wo.created_at, '%%Y-%%m')" if by_month else None
+    month_o = "DATE_FORMAT(o.created_at, '%%Y-%%m')" if by_month else None
+    group = ['f.variety']
+    if by_flower:
+        group += ['f.flower_id', 'f.name']
+    if by_month:
+        group.append('m.month')
+    return db.fetch_all(f"""
+        SELECT f.variety,
+               {'f.name' if by_flower else 'NULL'} AS flower_name,
+               {'m.month' if by_month else 'NULL'} AS month,
+               SUM(m.written_off) AS written_off,
+               SUM(m.sold) AS sold,
+               COALESCE(ROUND(100 * SUM(m.written_off) / NULLIF(SUM(m.written_off) + SUM(m.sold), 0), 2), 0) AS percent
+        FROM (
+            SELECT wo.item_id AS flower_id, {month_wo or 'NULL'} AS month, SUM(wo.qty) AS written_off, 0 AS sold
+            FROM write_offs wo
+            WHERE wo.created_at >= DATE_SUB(NOW(), INTERVAL %s MONTH)
+            GROUP BY {', '.join(filter(None, ['wo.item_id', month_wo]))}
+            UNION ALL
+            SELECT oi.item_id, {month_o or 'NULL'}, 0, SUM(oi.qty)
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.order_id AND oi.item_type = 'FLOWER'
+            WHERE o.created_at >= DATE_SUB(NOW(), INTERVAL %s MONTH)
+              AND o.status != 'Отменен'
+            GROUP BY {', '.join(filter(None, ['oi.item_id', month_o]))}
+        ) AS m
+        JOIN flowers f ON f.flower_id = m.flower_id
+        GROUP BY {', '.join(group)}
+        ORDER BY percent DESC, {', '.join(group)}
+    """, (months, months))
+
+
+def order_details(order_id):
+    # Названия товаров из справочника вместо подзапроса на каждую строку
+    return item_directory.with_names(db.fetch_all(
+        "SELECT item_type, item_id, price, qty, sum FROM order_items WHERE order_id = %s", (order_id,)
+    ))
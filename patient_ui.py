@@ -6,9 +6,14 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QComboBox, QLabel, QMessageBox,
                              QLineEdit, QTextEdit, QDateEdit, QSpinBox,
                              QDoubleSpinBox)
-from PyQt6.QtCore import Qt, QDate
+from PyQt6.QtCore import QDate, QTimer
 import db
+import catalog_engine
+import operations
 from datetime import datetime, timedelta
+from ui_async import QueryRunner, LazyTabs, TableWatcher
+from ui_table import (RowTableModel, create_table_view, selected_record, fit_columns,
+                      format_money, format_yes_no)
 
 
 def get_item_type_ru(item_type):
@@ -22,6 +27,17 @@ def get_item_type_ru(item_type):
     return types_map.get(item_type, item_type)
 
 
+# Значения фильтра «Тип» в каталоге и соответствующие типы товаров
+CATALOG_TYPE_FILTERS = {
+    'Все': ('FLOWER', 'BOUQUET'),
+    'Цветы': ('FLOWER',),
+    'Букеты': ('BOUQUET',),
+}
+
+# Задержка живого фильтра каталога после последнего изменения, мс
+FILTER_DELAY_MS = 150
+
+
 class ClientWindow(QMainWindow):
     """Главное окно клиента"""
     
@@ -30,10 +46,13 @@ class ClientWindow(QMainWindow):
         self.user = user
         self.client_id = user.get('client_id')
         self.current_request_items = []
+        self.catalog = None
+        self.queries = QueryRunner(self, on_error=self.show_load_error)
         self.init_ui()
-        self.load_catalog()
-        self.load_orders()
-        self.load_requests()
+        # Остатки в каталоге меняют продавцы и закупки с других терминалов
+        self.catalog_watcher = TableWatcher(self, catalog_engine.SNAPSHOT_TABLES,
+                                            catalog_engine.REFRESH_INTERVAL_MS, self.refresh_loaded_catalog)
+        self.lazy_tabs.start()
     
     def init_ui(self):
         self.setWindowTitle(f'Клиент - {self.user["username"]}')
@@ -45,14 +64,18 @@ class ClientWindow(QMainWindow):
         layout = QVBoxLayout()
         central_widget.setLayout(layout)
         
-        # Вкладки
+        # Вкладки; данные вкладки загружаются при первом открытии, остальные подгружаются в фоне
         tabs = QTabWidget()
-        tabs.addTab(self.create_catalog_tab(), 'Каталог')
-        tabs.addTab(self.create_request_tab(), 'Заявка на букет')
-        tabs.addTab(self.create_orders_tab(), 'Мои заказы')
+        self.lazy_tabs = LazyTabs(tabs, self.queries)
+        self.lazy_tabs.add_tab(self.create_catalog_tab(), 'Каталог', self.refresh_catalog)
+        self.lazy_tabs.add_tab(self.create_request_tab(), 'Заявка на букет', self.load_requests)
+        self.lazy_tabs.add_tab(self.create_orders_tab(), 'Мои заказы', self.load_orders)
         
         layout.addWidget(tabs)
     
+    def show_load_error(self, error):
+        QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки данных: {str(error)}')
+    
     def create_catalog_tab(self):
         """Вкладка каталога с фильтрацией"""
         widget = QWidget()
@@ -87,10 +110,23 @@ class ClientWindow(QMainWindow):
         
         layout.addLayout(filter_layout)
         
+        # Живой фильтр по цене с задержкой
+        self.catalog_filter_timer = QTimer(self)
+        self.catalog_filter_timer.setSingleShot(True)
+        self.catalog_filter_timer.setInterval(FILTER_DELAY_MS)
+        self.catalog_filter_timer.timeout.connect(self.apply_catalog_filter)
+        self.catalog_price_from.valueChanged.connect(self.schedule_catalog_filter)
+        self.catalog_price_to.valueChanged.connect(self.schedule_catalog_filter)
+        
         # Таблица каталога
-        self.catalog_table = QTableWidget()
-        self.catalog_table.setColumnCount(5)
-        self.catalog_table.setHorizontalHeaderLabels(['Тип', 'ID', 'Название', 'Цена', 'Остаток'])
+        self.catalog_model = RowTableModel([
+            ('Тип', 'item_type', get_item_type_ru),
+            ('ID', 'item_id', None),
+            ('Название', 'name', None),
+            ('Цена', 'price', format_money),
+            ('Остаток', 'stock', None),
+        ], parent=self)
+        self.catalog_table = create_table_view(self.catalog_model)
         layout.addWidget(self.catalog_table)
         
         widget.setLayout(layout)
@@ -103,10 +139,14 @@ class ClientWindow(QMainWindow):
         
         # Доступные цветы
         layout.addWidget(QLabel('Доступные цветы:'))
-        self.request_flowers_table = QTableWidget()
-        self.request_flowers_table.setColumnCount(4)
-        self.request_flowers_table.setHorizontalHeaderLabels(['ID', 'Название', 'Сорт', 'Цвет'])
-        self.request_flowers_table.cellDoubleClicked.connect(self.add_to_request)
+        self.request_flowers_model = RowTableModel([
+            ('ID', 'flower_id', None),
+            ('Название', 'name', None),
+            ('Сорт', 'variety', None),
+            ('Цвет', 'color', None),
+        ], parent=self)
+        self.request_flowers_table = create_table_view(self.request_flowers_model)
+        self.request_flowers_table.doubleClicked.connect(self.add_to_request)
         layout.addWidget(self.request_flowers_table)
         
         btn_add = QPushButton('Добавить цветок')
@@ -158,17 +198,28 @@ class ClientWindow(QMainWindow):
         
         # Список заказов
         layout.addWidget(QLabel('Мои заказы:'))
-        self.orders_table = QTableWidget()
-        self.orders_table.setColumnCount(5)
-        self.orders_table.setHorizontalHeaderLabels(['ID', 'Дата', 'Статус', 'Сумма', 'Оплачен'])
-        self.orders_table.cellClicked.connect(self.load_order_details)
+        self.orders_model = RowTableModel([
+            ('ID', 'order_id', None),
+            ('Дата', 'created_at', None),
+            ('Статус', 'status', None),
+            ('Сумма', 'total_sum', format_money),
+            ('Оплачен', 'is_paid', format_yes_no),
+        ], runner=self.queries, key='orders', parent=self)
+        self.orders_model.set_loader(lambda token: operations.client_orders_page(self.client_id, token))
+        self.orders_table = create_table_view(self.orders_model)
+        self.orders_table.clicked.connect(self.load_order_details)
         layout.addWidget(self.orders_table)
         
         # Детали заказа
         layout.addWidget(QLabel('Детали заказа:'))
-        self.order_details_table = QTableWidget()
-        self.order_details_table.setColumnCount(5)
-        self.order_details_table.setHorizontalHeaderLabels(['Тип', 'Название', 'Цена', 'Кол-во', 'Сумма'])
+        self.order_details_model = RowTableModel([
+            ('Тип', 'item_type', get_item_type_ru),
+            ('Название', 'item_name', None),
+            ('Цена', 'price', format_money),
+            ('Кол-во', 'qty', None),
+            ('Сумма', 'sum', format_money),
+        ], parent=self)
+        self.order_details_table = create_table_view(self.order_details_model)
         layout.addWidget(self.order_details_table)
         
         # Оплата
@@ -187,100 +238,71 @@ class ClientWindow(QMainWindow):
         widget.setLayout(layout)
         return widget
     
+    def refresh_catalog(self):
+        """Перечитывает снимок каталога: при открытии вкладки, после записи в склад и по таймеру"""
+        self.queries.submit('catalog', catalog_engine.load_snapshot, CATALOG_TYPE_FILTERS['Все'],
+                            [self.catalog_model.fields], on_result=self.set_catalog_snapshot)
+    
+    def refresh_loaded_catalog(self):
+        # До первого открытия вкладки снимок загрузит LazyTabs
+        if self.catalog is not None:
+            self.refresh_catalog()
+    
+    def set_catalog_snapshot(self, snapshot):
+        self.catalog = snapshot
+        self.apply_catalog_filter()
+        fit_columns(self.catalog_table)
+    
+    def schedule_catalog_filter(self, *args):
+        self.catalog_filter_timer.start()
+    
     def load_catalog(self):
         """Загружает каталог без фильтров"""
         self.catalog_type_filter.setCurrentIndex(0)
         self.catalog_price_from.setValue(0)
         self.catalog_price_to.setValue(0)
         self.apply_catalog_filter()
+        self.refresh_catalog()
     
     def apply_catalog_filter(self):
         """Применяет фильтры к каталогу"""
+        self.catalog_filter_timer.stop()
+        if self.catalog is None:
+            return
+        
+        # Фильтрация в памяти по снимку каталога, без запросов к БД
         type_filter = self.catalog_type_filter.currentText()
-        price_from = self.catalog_price_from.value()
-        price_to = self.catalog_price_to.value()
-        
-        items = []
-        
-        # Цветы
-        if type_filter in ['Все', 'Цветы']:
-            sql = """
-                SELECT f.*, COALESCE(i.qty, 0) as stock 
-                FROM flowers f 
-                LEFT JOIN inventory i ON i.item_type='FLOWER' AND i.item_id=f.flower_id 
-                WHERE f.is_active=1
-            """
-            params = []
-            if price_from > 0:
-                sql += " AND f.price >= %s"
-                params.append(price_from)
-            if price_to > 0:
-                sql += " AND f.price <= %s"
-                params.append(price_to)
-            
-            flowers = db.fetch_all(sql, tuple(params) if params else None)
-            for f in flowers:
-                items.append(('FLOWER', f['flower_id'], f['name'], f['price'], f['stock']))
-        
-        # Букеты
-        if type_filter in ['Все', 'Букеты']:
-            sql = """
-                SELECT b.*, COALESCE(i.qty, 0) as stock 
-                FROM bouquets b 
-                LEFT JOIN inventory i ON i.item_type='BOUQUET' AND i.item_id=b.bouquet_id 
-                WHERE b.is_active=1
-            """
-            params = []
-            if price_from > 0:
-                sql += " AND b.base_price >= %s"
-                params.append(price_from)
-            if price_to > 0:
-                sql += " AND b.base_price <= %s"
-                params.append(price_to)
-            
-            bouquets = db.fetch_all(sql, tuple(params) if params else None)
-            for b in bouquets:
-                items.append(('BOUQUET', b['bouquet_id'], b['name'], b['base_price'], b['stock']))
-        
-        # Заполняем таблицу
-        self.catalog_table.setRowCount(len(items))
-        for i, (item_type, item_id, name, price, stock) in enumerate(items):
-            self.catalog_table.setItem(i, 0, QTableWidgetItem(get_item_type_ru(item_type)))
-            self.catalog_table.setItem(i, 1, QTableWidgetItem(str(item_id)))
-            self.catalog_table.setItem(i, 2, QTableWidgetItem(name))
-            self.catalog_table.setItem(i, 3, QTableWidgetItem(f'{price:.2f}'))
-            self.catalog_table.setItem(i, 4, QTableWidgetItem(str(stock)))
-        
-        self.catalog_table.resizeColumnsToContents()
+        indices = self.catalog.filter(
+            price_from=self.catalog_price_from.value(),
+            price_to=self.catalog_price_to.value(),
+            item_types=CATALOG_TYPE_FILTERS.get(type_filter, ())
+        )
+        self.catalog_model.set_rows(self.catalog.rows(indices, self.catalog_model.fields))
     
     def load_request_flowers(self):
         """Загружает цветы для заявки"""
-        flowers = db.fetch_all("""
+        self.queries.submit('request_flowers', db.fetch_all, """
             SELECT f.*, COALESCE(i.qty, 0) as stock 
             FROM flowers f 
             LEFT JOIN inventory i ON i.item_type='FLOWER' AND i.item_id=f.flower_id 
             WHERE f.is_active=1 AND COALESCE(i.qty, 0) > 0
             ORDER BY f.name, f.variety
-        """)
-        
-        self.request_flowers_table.setRowCount(len(flowers))
-        for i, flower in enumerate(flowers):
-            self.request_flowers_table.setItem(i, 0, QTableWidgetItem(str(flower['flower_id'])))
-            self.request_flowers_table.setItem(i, 1, QTableWidgetItem(flower['name']))
-            self.request_flowers_table.setItem(i, 2, QTableWidgetItem(flower['variety']))
-            self.request_flowers_table.setItem(i, 3, QTableWidgetItem(flower['color']))
-        self.request_flowers_table.resizeColumnsToContents()
+        """, on_result=self.fill_request_flowers)
+    
+    def fill_request_flowers(self, flowers):
+        self.request_flowers_model.set_rows(flowers)
+        fit_columns(self.request_flowers_table)
     
     def add_to_request(self):
         """Добавляет цветок в заявку"""
-        row = self.request_flowers_table.currentRow()
-        if row < 0:
+        record = selected_record(self.request_flowers_table)
+        if record is None:
             QMessageBox.warning(self, 'Ошибка', 'Выберите цветок')
             return
         
-        flower_id = int(self.request_flowers_table.item(row, 0).text())
-        name = self.request_flowers_table.item(row, 1).text()
-        variety = self.request_flowers_table.item(row, 2).text()
+        flower_id = record['flower_id']
+        name = record['name']
+        variety = record['variety']
         
         # Проверяем, есть ли уже
         for item in self.current_request_items:
@@ -333,18 +355,7 @@ class ClientWindow(QMainWindow):
         wishes = self.request_wishes.toPlainText().strip()
         
         try:
-            # Создаём заявку
-            request_id = db.execute(
-                "INSERT INTO custom_requests (client_id, desired_date, wishes, status) VALUES (%s, %s, %s, 'Новая')",
-                (self.client_id, desired_date, wishes if wishes else None)
-            )
-            
-            # Добавляем позиции
-            for item in self.current_request_items:
-                db.execute(
-                    "INSERT INTO custom_request_items (request_id, flower_id, qty) VALUES (%s, %s, %s)",
-                    (request_id, item['flower_id'], item['qty'])
-                )
+            request_id = operations.submit_request(self.client_id, desired_date, wishes, self.current_request_items)
             
             QMessageBox.information(self, 'Успех', f'Заявка #{request_id} отправлена')
             self.current_request_items.clear()
@@ -359,53 +370,23 @@ class ClientWindow(QMainWindow):
         if not self.client_id:
             return
         
-        orders = db.fetch_all("""
-            SELECT o.*, 
-                   (SELECT COUNT(*) FROM payments p WHERE p.order_id = o.order_id) > 0 as is_paid
-            FROM orders o 
-            WHERE o.client_id = %s
-            ORDER BY o.order_id DESC
-        """, (self.client_id,))
-        
-        self.orders_table.setRowCount(len(orders))
-        for i, order in enumerate(orders):
-            self.orders_table.setItem(i, 0, QTableWidgetItem(str(order['order_id'])))
-            self.orders_table.setItem(i, 1, QTableWidgetItem(str(order['created_at'])))
-            self.orders_table.setItem(i, 2, QTableWidgetItem(order['status']))
-            self.orders_table.setItem(i, 3, QTableWidgetItem(f"{order['total_sum']:.2f}"))
-            self.orders_table.setItem(i, 4, QTableWidgetItem('Да' if order['is_paid'] else 'Нет'))
-        self.orders_table.resizeColumnsToContents()
+        self.orders_model.reload(on_loaded=lambda: fit_columns(self.orders_table))
     
-    def load_order_details(self, row, col):
+    def load_order_details(self, index):
         """Загружает детали выбранного заказа"""
-        if row < 0:
+        if not index.isValid():
             return
         
-        order_id = int(self.orders_table.item(row, 0).text())
-        
-        items = db.fetch_all("""
-            SELECT oi.*, 
-                   CASE oi.item_type
-                       WHEN 'FLOWER' THEN (SELECT name FROM flowers WHERE flower_id = oi.item_id)
-                       WHEN 'BOUQUET' THEN (SELECT name FROM bouquets WHERE bouquet_id = oi.item_id)
-                       WHEN 'PACKAGING' THEN (SELECT name FROM packaging WHERE packaging_id = oi.item_id)
-                       WHEN 'ACCESSORY' THEN (SELECT name FROM accessories WHERE accessory_id = oi.item_id)
-                   END as item_name
-            FROM order_items oi 
-            WHERE oi.order_id = %s
-        """, (order_id,))
-        
-        self.order_details_table.setRowCount(len(items))
-        for i, item in enumerate(items):
-            self.order_details_table.setItem(i, 0, QTableWidgetItem(get_item_type_ru(item['item_type'])))
-            self.order_details_table.setItem(i, 1, QTableWidgetItem(item['item_name']))
-            self.order_details_table.setItem(i, 2, QTableWidgetItem(f"{item['price']:.2f}"))
-            self.order_details_table.setItem(i, 3, QTableWidgetItem(str(item['qty'])))
-            self.order_details_table.setItem(i, 4, QTableWidgetItem(f"{item['sum']:.2f}"))
-        self.order_details_table.resizeColumnsToContents()
+        order_id = self.orders_model.record(index.row())['order_id']
         
         # Сохраняем выбранный заказ для оплаты
         self.selected_order_id = order_id
+        
+        self.queries.submit('order_details', operations.order_details, order_id, on_result=self.fill_order_details)
+    
+    def fill_order_details(self, items):
+        self.order_details_model.set_rows(items)
+        fit_columns(self.order_details_table)
     
     def pay_order(self):
         """Оплачивает заказ"""
@@ -415,27 +396,15 @@ class ClientWindow(QMainWindow):
         
         order_id = self.selected_order_id
         
-        # Проверяем, не оплачен ли уже
-        payment = db.fetch_one("SELECT * FROM payments WHERE order_id = %s", (order_id,))
-        if payment:
-            QMessageBox.warning(self, 'Ошибка', 'Заказ уже оплачен')
-            return
-        
-        order = db.fetch_one("SELECT * FROM orders WHERE order_id = %s", (order_id,))
-        if not order:
-            QMessageBox.warning(self, 'Ошибка', 'Заказ не найден')
-            return
-        
         method = self.payment_method.currentText()
         
         try:
-            db.execute(
-                "INSERT INTO payments (order_id, method, amount) VALUES (%s, %s, %s)",
-                (order_id, method, order['total_sum'])
-            )
+            operations.pay_order(order_id, method)
             
             QMessageBox.information(self, 'Успех', 'Оплата принята')
             self.load_orders()
+        except (operations.AlreadyProcessed, operations.NotFound) as e:
+            QMessageBox.warning(self, 'Ошибка', str(e))
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при оплате: {str(e)}')
     
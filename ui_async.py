@@ -0,0 +1,172 @@
+"""
+Фоновое выполнение запросов к БД для окон PyQt
+"""
+import traceback
+from PyQt6.QtCore import QObject, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+import db
+
+
+class QueryRunner(QObject):
+    """Выполняет функции доступа к БД в пуле потоков и возвращает результат в GUI-поток.
+
+    Запросы группируются по ключу (например, 'catalog'): новый запрос с тем же ключом
+    вытесняет предыдущий. Ещё не начатый вытесненный запрос не выполняется вовсе,
+    а результат уже выполняющегося просто отбрасывается.
+    """
+
+    done = pyqtSignal(str, int, object)
+    failed = pyqtSignal(str, int, object)
+    # Все отправленные запросы доставлены или отменены
+    idle = pyqtSignal()
+
+    def __init__(self, parent=None, on_error=None, thread_pool=None):
+        super().__init__(parent)
+        self.thread_pool = thread_pool or QThreadPool.globalInstance()
+        self.on_error = on_error
+        self._tickets = {}
+        self._callbacks = {}
+        # Сигналы испускаются из рабочих потоков, слоты вызываются в потоке окна
+        self.done.connect(self._deliver)
+        self.failed.connect(self._fail)
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None, **kwargs):
+        ticket = self._tickets.get(key, 0) + 1
+        self._tickets[key] = ticket
+        self._callbacks[key] = (ticket, on_result, on_error)
+        # Метод окна запоминаем здесь: в рабочем потоке его уже нет на стеке
+        caller = db.caller_label()
+        self.thread_pool.start(lambda: self._run(key, ticket, caller, fn, args, kwargs))
+        return ticket
+
+    def cancel(self, key):
+        self._tickets[key] = self._tickets.get(key, 0) + 1
+        if self._callbacks.pop(key, None) is not None and not self._callbacks:
+            self.idle.emit()
+
+    def is_pending(self):
+        return bool(self._callbacks)
+
+    def is_current(self, key, ticket):
+        return self._tickets.get(key) == ticket
+
+    def _run(self, key, ticket, caller, fn, args, kwargs):
+        if not self.is_current(key, ticket):
+            return
+        try:
+            with db.query_context(caller, key):
+                result = fn(*args, **kwargs)
+        except Exception as e:
+            e.traceback_text = traceback.format_exc()
+            signal, value = self.failed, e
+        else:
+            signal, value = self.done, result
+        try:
+            signal.emit(key, ticket, value)
+        except RuntimeError:
+            # Окно уже закрыто, доставлять результат некуда
+            pass
+
+    def _take_callbacks(self, key, ticket):
+        callbacks = self._callbacks.get(key)
+        if callbacks is None or callbacks[0] != ticket:
+            return None
+        del self._callbacks[key]
+        return callbacks
+
+    @pyqtSlot(str, int, object)
+    def _deliver(self, key, ticket, result):
+        callbacks = self._take_callbacks(key, ticket)
+        if callbacks and callbacks[1]:
+            callbacks[1](result)
+        if callbacks and not self._callbacks:
+            self.idle.emit()
+
+    @pyqtSlot(str, int, object)
+    def _fail(self, key, ticket, error):
+        callbacks = self._take_callbacks(key, ticket)
+        if callbacks is None:
+            return
+        handler = callbacks[2] or self.on_error
+        if handler:
+            handler(error)
+        else:
+            print(getattr(error, 'traceback_text', error))
+        if not self._callbacks:
+            self.idle.emit()
+
+
+class LazyTabs(QObject):
+    """Загружает данные вкладки при первом её открытии.
+
+    Сначала грузится только видимая вкладка; когда её запросы отработают,
+    загрузчики остальных вкладок запускаются в фоне все сразу.
+    """
+
+    def __init__(self, tabs, runner, prefetch=True):
+        super().__init__(tabs)
+        self.tabs = tabs
+        self.runner = runner
+        self.prefetch = prefetch
+        self._loaders = {}
+        self._started = set()
+        self._prefetched = False
+        tabs.currentChanged.connect(self.ensure_loaded)
+
+    def add_tab(self, widget, title, *loaders):
+        index = self.tabs.addTab(widget, title)
+        self._loaders[index] = loaders
+        return index
+
+    def ensure_loaded(self, index):
+        # Один загрузчик может обслуживать несколько вкладок, поэтому учитываем сами загрузчики
+        for loader in self._loaders.get(index, ()):
+            if loader not in self._started:
+                self._started.add(loader)
+                loader()
+
+    def start(self):
+        self.ensure_loaded(self.tabs.currentIndex())
+        if not self.prefetch:
+            return
+        if self.runner.is_pending():
+            self.runner.idle.connect(self.prefetch_all)
+        else:
+            QTimer.singleShot(0, self.prefetch_all)
+
+    def prefetch_all(self):
+        if self._prefetched:
+            return
+        self._prefetched = True
+        try:
+            self.runner.idle.disconnect(self.prefetch_all)
+        except TypeError:
+            pass
+        for index in self._loaders:
+            self.ensure_loaded(index)
+
+
+class TableWatcher(QObject):
+    """Вызывает callback в потоке окна после записи в таблицы tables и раз в interval_ms.
+
+    Записи из этого процесса приходят через слушатель кэша db, который может вызываться
+    из рабочего потока; записи других терминалов кэш не видит, их подхватывает таймер.
+    """
+
+    changed = pyqtSignal()
+
+    def __init__(self, parent, tables, interval_ms, callback):
+        super().__init__(parent)
+        self.tables = set(tables)
+        self.changed.connect(callback)
+        listener = self._on_tables_changed
+        db.add_invalidation_listener(listener)
+        self.destroyed.connect(lambda: db.remove_invalidation_listener(listener))
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(callback)
+        self.timer.start()
+
+    def _on_tables_changed(self, tables):
+        if tables & self.tables:
+            self.changed.emit()
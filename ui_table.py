@@ -0,0 +1,294 @@
+"""
+Табличная модель для длинных списков в окнах PyQt
+"""
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent, QSize, pyqtSignal
+from PyQt6.QtWidgets import (QTableView, QAbstractItemView, QHeaderView, QApplication,
+                             QStyledItemDelegate, QStyleOptionButton, QStyle)
+
+
+# Сколько загруженных строк отдаётся представлению за один fetchMore
+FETCH_BATCH = 200
+# По скольким строкам подбирается ширина колонок
+SIZE_SAMPLE = 50
+COLUMN_PADDING = 24
+
+
+def format_money(value):
+    return f'{value:.2f}'
+
+
+def format_percent(value):
+    return f'{value:.2f}%'
+
+
+def format_yes_no(value):
+    return 'Да' if value else 'Нет'
+
+
+class RowTableModel(QAbstractTableModel):
+    """Модель только для чтения поверх списка кортежей.
+
+    columns - список (заголовок, поле, форматтер). Строки из db.fetch_all упаковываются
+    в кортежи по полям колонок и extra_fields (скрытые значения, нужные окну при выборе строки).
+    Представлению строки отдаются порциями по batch_size. Если задан загрузчик страниц
+    loader(token) -> (rows, next_token), следующая страница запрашивается через QueryRunner,
+    когда прокрутка дошла до конца загруженных строк. Сортировка по клику на заголовок
+    (create_table_view(..., sortable=True)) упорядочивает загруженные строки по исходным
+    значениям колонки и сохраняется при следующих set_rows.
+    """
+
+    def __init__(self, columns, extra_fields=(), runner=None, key=None, parent=None,
+                 batch_size=FETCH_BATCH):
+        super().__init__(parent)
+        self.headers = [header for header, _, _ in columns]
+        self.formatters = [formatter for _, _, formatter in columns]
+        self.fields = []
+        for field in [field for _, field, _ in columns] + list(extra_fields):
+            if field is not None and field not in self.fields:
+                self.fields.append(field)
+        # Колонка без поля (например, кнопка) ничего не показывает
+        self._slots = [self.fields.index(field) if field is not None else None for _, field, _ in columns]
+        self.runner = runner
+        self.key = key
+        self.batch_size = batch_size
+        self.loader = None
+        self._rows = []
+        self._visible = 0
+        self._next_token = None
+        self._loading = False
+        self._sort = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._visible
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        slot = self._slots[index.column()]
+        if slot is None:
+            return None
+        value = self._rows[index.row()][slot]
+        if role == Qt.ItemDataRole.UserRole:
+            return value
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if value is None:
+            return ''
+        formatter = self.formatters[index.column()]
+        return formatter(value) if formatter else str(value)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def pack(self, rows):
+        # Кортеж на строку вместо словаря; вызывается и из рабочего потока загрузчика.
+        # Готовые кортежи (строки снимка каталога) не копируются
+        if rows and type(rows[0]) is tuple:
+            return list(rows)
+        fields = self.fields
+        return [tuple(row[f] for f in fields) if isinstance(row, dict) else tuple(row) for row in rows]
+
+    def set_rows(self, rows, next_token=None):
+        self.beginResetModel()
+        self._rows = self._sorted(self.pack(rows))
+        self._visible = min(self.batch_size, len(self._rows))
+        self._next_token = next_token
+        self._loading = False
+        self.endResetModel()
+
+    def _sorted(self, rows):
+        if self._sort is None:
+            return rows
+        slot, descending = self._sort
+        # Пустые значения - в конце при любом направлении
+        filled = sorted((row for row in rows if row[slot] is not None), key=lambda row: row[slot], reverse=descending)
+        return filled + [row for row in rows if row[slot] is None]
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # column = -1: порядок, в котором строки пришли из запроса, со следующей загрузки
+        slot = self._slots[column] if column >= 0 else None
+        if slot is None:
+            self._sort = None
+            return
+        self._sort = (slot, order == Qt.SortOrder.DescendingOrder)
+        self._reorder(self._sorted(self._rows))
+
+    def _reorder(self, rows):
+        """Подменяет строки той же модели в новом порядке; выделение и другие постоянные
+        индексы представления переезжают вслед за своими строками"""
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_rows = self._rows
+        positions = {id(row): position for position, row in enumerate(rows)}
+        new_indexes = []
+        for index in old_indexes:
+            position = positions.get(id(old_rows[index.row()]))
+            # Строка, ушедшая за пределы показанных, теряет выделение
+            if position is None or position >= self._visible:
+                new_indexes.append(QModelIndex())
+            else:
+                new_indexes.append(self.index(position, index.column()))
+        self._rows = rows
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def clear(self):
+        if self.runner is not None and self.key is not None:
+            self.runner.cancel(self.key)
+        self.set_rows([])
+
+    def record(self, row):
+        return dict(zip(self.fields, self._rows[row]))
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        if self._visible < len(self._rows):
+            return True
+        return self._next_token is not None and self.loader is not None and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        if self._visible < len(self._rows):
+            self._expose()
+        elif self._next_token is not None and self.loader is not None and not self._loading:
+            self._loading = True
+            self.runner.submit(self.key, self._load_page, self._next_token,
+                               on_result=self._append_page, on_error=self._page_failed)
+
+    def set_loader(self, loader):
+        self.loader = loader
+
+    def reload(self, on_loaded=None):
+        """Загружает первую страницу заново; незавершённые запросы страниц отбрасываются"""
+        self._loading = True
+
+        def first_page(page):
+            rows, next_token = page
+            self.set_rows(rows, next_token)
+            if on_loaded:
+                on_loaded()
+
+        self.runner.submit(self.key, self._load_page, None,
+                           on_result=first_page, on_error=self._page_failed)
+
+    def _load_page(self, token):
+        rows, next_token = self.loader(token)
+        return self.pack(rows), next_token
+
+    def _append_page(self, page):
+        rows, next_token = page
+        self._loading = False
+        self._next_token = next_token
+        self._rows.extend(rows)
+        self._expose()
+        if self._sort is not None:
+            # Строки новой страницы встают на свои места среди уже показанных
+            self._reorder(self._sorted(self._rows))
+
+    def _page_failed(self, error):
+        self._loading = False
+        if self.runner.on_error:
+            self.runner.on_error(error)
+        else:
+            print(getattr(error, 'traceback_text', error))
+
+    def _expose(self):
+        count = min(self.batch_size, len(self._rows) - self._visible)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._visible, self._visible + count - 1)
+        self._visible += count
+        self.endInsertRows()
+
+
+class ButtonDelegate(QStyledItemDelegate):
+    """Рисует кнопку в каждой ячейке колонки без создания виджетов.
+
+    Нажатие обрабатывается через события представления и отдаётся сигналом clicked(row).
+    """
+
+    clicked = pyqtSignal(int)
+
+    def __init__(self, text, parent=None):
+        super().__init__(parent)
+        self.text = text
+        self._pressed = None
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.text = self.text
+        button.state = QStyle.StateFlag.State_Enabled
+        if self._pressed == (index.row(), index.column()):
+            button.state |= QStyle.StateFlag.State_Sunken
+        else:
+            button.state |= QStyle.StateFlag.State_Raised
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.ControlElement.CE_PushButton, button, painter, option.widget)
+
+    def sizeHint(self, option, index):
+        metrics = option.fontMetrics
+        return QSize(metrics.horizontalAdvance(self.text) + COLUMN_PADDING, metrics.height() + 10)
+
+    def editorEvent(self, event, model, option, index):
+        kind = event.type()
+        if kind == QEvent.Type.MouseButtonPress and event.button() == Qt.MouseButton.LeftButton:
+            self._pressed = (index.row(), index.column())
+            self._repaint(option)
+            return True
+        if kind == QEvent.Type.MouseButtonRelease and self._pressed is not None:
+            pressed_here = self._pressed == (index.row(), index.column())
+            self._pressed = None
+            self._repaint(option)
+            if pressed_here and option.rect.contains(event.position().toPoint()):
+                self.clicked.emit(index.row())
+            return True
+        return kind == QEvent.Type.MouseButtonDblClick
+
+    def _repaint(self, option):
+        if option.widget is not None:
+            option.widget.viewport().update(option.rect)
+
+
+def create_table_view(model, sortable=False):
+    view = QTableView()
+    view.setModel(model)
+    view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+    view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+    # Строки одной высоты: представлению не нужно измерять каждую
+    view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+    if sortable:
+        # Без индикатора строки идут в порядке запроса, пока не кликнут по заголовку
+        view.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        view.setSortingEnabled(True)
+    return view
+
+
+def selected_record(view):
+    """Словарь полей текущей строки представления или None"""
+    index = view.currentIndex()
+    if not index.isValid():
+        return None
+    return view.model().record(index.row())
+
+
+def fit_columns(view, sample=SIZE_SAMPLE):
+    """Ширина колонок по заголовку и первым sample строкам вместо resizeColumnsToContents по всей таблице"""
+    model = view.model()
+    metrics = view.fontMetrics()
+    header_metrics = view.horizontalHeader().fontMetrics()
+    rows = min(model.rowCount(), sample)
+    for column in range(model.columnCount()):
+        width = header_metrics.horizontalAdvance(str(model.headerData(column, Qt.Orientation.Horizontal)))
+        for row in range(rows):
+            text = model.data(model.index(row, column))
+            if text:
+                width = max(width, metrics.horizontalAdvance(text))
+        view.setColumnWidth(column, width + COLUMN_PADDING)